@@ -0,0 +1,57 @@
+﻿"""Cadencement sans dérive : échéances régulières calculées sur l'horloge monotone"""
+
+from time import monotonic  # horloge qui ne recule jamais (insensible aux changements d'heure)
+
+
+# Retard maximal rattrapé par défaut, en secondes : au-delà (fenêtre déplacée, machine en veille...),
+# les échéances manquées sont abandonnées plutôt que rattrapées d'un coup
+_RETARD_MAX = 0.25
+
+
+class Cadenceur:
+    """Suite d'échéances espacées d'une période fixe.
+
+       Les échéances sont calculées à partir de la première, et non du moment où l'étape précédente s'est terminée :
+       le temps pris par chaque étape ne décale donc pas les suivantes, et les étapes en retard sont rattrapées.
+       Plusieurs échéances peuvent passer entre deux appels, si la période est plus courte que le délai entre deux appels."""
+
+    def __init__(self, periode, retardMax=_RETARD_MAX):
+        """Crée un cadenceur de période donnée (en secondes), qui démarre maintenant"""
+
+        if periode <= 0:
+            raise ValueError("La période doit être strictement positive : {}".format(periode))
+
+        self.periode = periode
+        self.retardMax = retardMax
+        self.demarrer()
+
+    def demarrer(self, maintenant=None):
+        """(Re)démarre le cadenceur : la prochaine échéance est dans une période"""
+
+        if maintenant == None:
+            maintenant = monotonic()
+        self.echeance = maintenant + self.periode
+
+    def etapesDues(self, maintenant=None):
+        """Renvoie le nombre d'échéances passées depuis le dernier appel, et passe à la prochaine échéance à venir.
+           Si le retard dépasse retardMax, seules les échéances des retardMax dernières secondes sont comptées."""
+
+        if maintenant == None:
+            maintenant = monotonic()
+        if maintenant < self.echeance:          # si la prochaine échéance n'est pas passée,
+            return 0                            # il n'y a rien à faire
+
+        retard = maintenant - self.echeance
+        if retard > self.retardMax:             # si le retard est trop grand, on abandonne les échéances les plus anciennes
+            self.echeance += (retard - self.retardMax) // self.periode * self.periode
+            retard = maintenant - self.echeance
+        nombre = int(retard // self.periode) + 1
+        self.echeance += nombre * self.periode
+        return nombre
+
+    def delai(self, maintenant=None):
+        """Renvoie le temps restant (en secondes) avant la prochaine échéance"""
+
+        if maintenant == None:
+            maintenant = monotonic()
+        return max(self.echeance - maintenant, 0)
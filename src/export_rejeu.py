@@ -0,0 +1,81 @@
+﻿"""Export des rejeux en suite d'images PPM, sans Tk : une image par tick, produites au fur et à mesure"""
+
+import sys                  # pour les arguments de la ligne de commande et la sortie standard
+import os                   # pour les opérations sur les fichiers et les chemins
+import time                 # pour mesurer la vitesse de l'export
+
+from image_grille import ImageRGB, DessinGrille, DessinPiece    # pour dessiner les images
+from rejeu import EnregistrementPartie                          # pour relire et rejouer les parties
+
+
+# Taille par défaut d'une case de la grille, en pixels
+_TAILLE_CASE_DEFAUT = 24
+
+# Taille et position du cadre de la prochaine pièce (voir _LARGEUR_PROCHAINEPIECE et _HAUTEUR_PROCHAINEPIECE dans fenetre_principale.py),
+# placé à droite de la grille, à la hauteur où la fenêtre l'affiche
+_LARGEUR_PROCHAINEPIECE = 75
+_HAUTEUR_PROCHAINEPIECE = 100
+_MARGE_PROCHAINEPIECE = 60
+
+
+def imagesRejeu(enregistrement, tailleCase=_TAILLE_CASE_DEFAUT):
+    """Rejoue la partie et renvoie (au fur et à mesure) une image PPM (bytes) au début de la partie puis après chaque tick :
+       la grille comme GrilleMelobrics, et la prochaine pièce à sa droite comme CanvasPiece.
+
+       Une seule image est gardée en mémoire, mise à jour d'un tick à l'autre comme à l'écran :
+       la mémoire utilisée ne dépend pas de la durée de la partie."""
+
+    largeurGrille = int(enregistrement.nbColonnes*tailleCase + 0.5) + 1
+    hauteurGrille = int(enregistrement.nbLignes*tailleCase + 0.5) + 1
+    abscissePiece = largeurGrille + _MARGE_PROCHAINEPIECE // 2
+    image = ImageRGB(abscissePiece + _LARGEUR_PROCHAINEPIECE + _MARGE_PROCHAINEPIECE // 2,
+                     max(hauteurGrille, _MARGE_PROCHAINEPIECE + _HAUTEUR_PROCHAINEPIECE))
+    dessinGrille = DessinGrille(image, enregistrement.nbColonnes, enregistrement.nbLignes, tailleCase)
+    dessinPiece = DessinPiece(image, _LARGEUR_PROCHAINEPIECE, _HAUTEUR_PROCHAINEPIECE, abscissePiece, _MARGE_PROCHAINEPIECE)
+    dessinGrille.preparer()
+
+    for moteur in enregistrement.parcourir():
+        dessinGrille.dessiner(moteur)
+        dessinPiece.dessiner(None if moteur.terminee else moteur.prochainePiece)
+        yield image.versPPM()
+
+
+def exporterRejeu(enregistrement, sortie, tailleCase=_TAILLE_CASE_DEFAUT):
+    """Ecrit les images du rejeu (voir imagesRejeu) et renvoie leur nombre :
+       - si sortie est un dossier, dans des fichiers numérotés 000000.ppm, 000001.ppm...
+       - sinon, les unes à la suite des autres dans le fichier binaire sortie (fichier ouvert, ou tube vers un encodeur vidéo)"""
+
+    nbImages = 0
+    for numero, image in enumerate(imagesRejeu(enregistrement, tailleCase)):
+        if isinstance(sortie, str):
+            with open(sortie + os.sep + "{:06d}.ppm".format(numero), "wb") as fichier:
+                fichier.write(image)
+        else:
+            sortie.write(image)
+        nbImages += 1
+    return nbImages
+
+
+if __name__ == "__main__":
+    # utilisation : python export_rejeu.py <fichier de rejeu> [dossier de sortie, ou - pour la sortie standard] [taille d'une case]
+    # par exemple, pour une vidéo : python export_rejeu.py partie.rejeu - | ffmpeg -f image2pipe -c:v ppm -framerate 5 -i - partie.mp4
+    if len(sys.argv) < 2:
+        print("utilisation : python export_rejeu.py <fichier de rejeu> [dossier de sortie, ou -] [taille d'une case]", file=sys.stderr)
+        sys.exit(2)
+    with open(sys.argv[1], "rb") as fichier:
+        enregistrement = EnregistrementPartie.depuisOctets(fichier.read())
+    sortie = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(sys.argv[1])[0]
+    tailleCase = float(sys.argv[3]) if len(sys.argv) > 3 else _TAILLE_CASE_DEFAUT
+
+    debut = time.perf_counter()
+    if sortie == "-":
+        nbImages = exporterRejeu(enregistrement, sys.stdout.buffer, tailleCase)
+        sys.stdout.buffer.flush()
+    else:
+        os.makedirs(sortie, exist_ok=True)
+        nbImages = exporterRejeu(enregistrement, sortie, tailleCase)
+    duree = time.perf_counter() - debut
+
+    # (sur la sortie d'erreur, pour ne pas se mélanger aux images envoyées sur la sortie standard)
+    dureePartie = nbImages / enregistrement.difficulte      # un tick dure periodeDeplacement = 1000/difficulte ms
+    print("{} images exportées en {:.2f} s ({:.0f} fois plus vite que la partie)".format(nbImages, duree, dureePartie / max(duree, 1e-9)), file=sys.stderr)
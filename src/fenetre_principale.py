@@ -5,11 +5,16 @@ from tkinter.simpledialog import askstring  # pour le nom
 
 from grille import *  # pour le widget affichant la grille
 
-from fenetre_scores import *  # pour la fenêtre des meilleurs scores
+from fenetre_scores import FenetreScores, CHEMIN_FICHIER_SCORES  # pour la fenêtre des meilleurs scores et le fichier des scores
+from gestion_scores import GestionScores    # pour les scores enregistrés
 
-# nombre de colonnes et de lignes de la grille
+# nombre de colonnes et de lignes de la grille, par défaut et choisis par le joueur
+# (au moins 4, la taille de la plus grande pièce, et au plus 200 colonnes et 400 lignes)
 _NBCOLONNES_DEFAUT  = 10
 _NBLIGNES_DEFAUT    = 15
+_TAILLE_GRILLE_MIN  = 4
+_NBCOLONNES_MAX     = 200
+_NBLIGNES_MAX       = 400
 
 # taille du canvas des contrôles en pixels
 _LARGEUR_PANNEAUCONTROLES = 200
@@ -26,8 +31,8 @@ _DIFFICULTE_MAX = 10
 class FenetrePrincipale(Tk):
     """Fenetre principale"""
 
-    def __init__(self):
-        """Crée les widgets et affiche l'écran d'accueil"""
+    def __init__(self, rendu=RENDU_RECTANGLES, profilage=False):
+        """Crée les widgets et affiche l'écran d'accueil (voir GrilleMelobrics pour rendu et profilage)"""
 
         # constructeur de la classe parent Tk
         super(FenetrePrincipale, self).__init__()
@@ -35,6 +40,7 @@ class FenetrePrincipale(Tk):
         # titre et taille de la fenêtre
         self.wm_title("Mélobrics")
         self.resizable(width=False, height=False)
+        self.protocol("WM_DELETE_WINDOW", self.destroy)     # fermer la fenêtre = quitter (en sauvegardant, voir destroy)
         largeur_ecran, hauteur_ecran = self.winfo_screenwidth(), self.winfo_screenheight()
 
         # on crée les deux grands cadres de la fenêtre : 
@@ -49,24 +55,34 @@ class FenetrePrincipale(Tk):
             self.rappelProchainePieceChange,    # - fonction appelée quand la prochaine pièce change
             self.rappelPauseChange,             # - fonction appelée quand la pause est (dés)activée
             self.rappelScoreChange,             # - fonction appelée quand le score change
-            self.rappelPartieTerminee           # - fonction appelée quand la partie est terminée
+            self.rappelPartieTerminee,          # - fonction appelée quand la partie est terminée
+            rendu,                              # - façon de dessiner la grille
+            profilage                           # - mesure de la durée des phases des ticks
         )
         # - le panneau des contrôles.
         self.panneauControles = Frame(self, width=largeur_ecran*0.15, height=largeur_ecran*0.3/10*15)
         self.panneauControles.pack_propagate(False) # empêche le cadre de se redimensionner
         
-        # on crée la fenêtre des meilleurs scores
-        self.fenetreScores = FenetreScores(_DIFFICULTE_MAX)
+        # on lance la lecture des meilleurs scores en arrière-plan ;
+        # leur fenêtre ne sera créée que quand le joueur voudra la voir
+        self.scores = GestionScores(CHEMIN_FICHIER_SCORES, _DIFFICULTE_MAX)
+        self.fenetreScores = None
 
         # on crée les contrôles dans le panneauControles
         def nouvellePartie():
+            nbColonnes, nbLignes = self.tailleGrille()
+            if (nbColonnes, nbLignes) != (self.canvasGrille.nbColonnes, self.canvasGrille.nbLignes):
+                self.canvasGrille.changerTaille(nbColonnes, nbLignes)
             self.canvasGrille.nouvellePartie(self.curseurDifficulte.get(), self.limiterScore.get())
         def abandonner():
             self.canvasGrille.partieTerminee(False)
         def changerPause():
             self.canvasGrille.changerPause()
         def meilleursScores():
-            self.fenetreScores.deiconify()
+            if self.fenetreScores == None:
+                self.fenetreScores = FenetreScores(self, self.scores, _DIFFICULTE_MAX)
+            else:
+                self.fenetreScores.deiconify()
         self.canvasProchainePiece = CanvasPiece(self.panneauControles, _LARGEUR_PROCHAINEPIECE, _HAUTEUR_PROCHAINEPIECE)
         self.labelScore = Label(self.panneauControles)
         self.boutonNouvellePartie = Button(self.panneauControles, text="Nouvelle partie", command=nouvellePartie)
@@ -80,20 +96,37 @@ class FenetrePrincipale(Tk):
         self.labelDifficulte.pack(side=LEFT)
         self.curseurDifficulte = Scale(self.cadreDifficulte, from_=1, to=_DIFFICULTE_MAX, orient=HORIZONTAL)
         self.curseurDifficulte.pack(side=LEFT)
+        self.cadreTaille = Frame(self.panneauControles)
+        self.labelTaille = Label(self.cadreTaille, text="Grille : ")
+        self.labelTaille.pack(side=LEFT)
+        self.nbColonnes, self.nbLignes = IntVar(value=_NBCOLONNES_DEFAUT), IntVar(value=_NBLIGNES_DEFAUT)
+        self.choixNbColonnes = Spinbox(self.cadreTaille, from_=_TAILLE_GRILLE_MIN, to=_NBCOLONNES_MAX, textvariable=self.nbColonnes, width=4)
+        self.choixNbColonnes.pack(side=LEFT)
+        self.labelFoisTaille = Label(self.cadreTaille, text=" x ")
+        self.labelFoisTaille.pack(side=LEFT)
+        self.choixNbLignes = Spinbox(self.cadreTaille, from_=_TAILLE_GRILLE_MIN, to=_NBLIGNES_MAX, textvariable=self.nbLignes, width=4)
+        self.choixNbLignes.pack(side=LEFT)
         self.limiterScore = BooleanVar()
         self.caseLimiterScore = Checkbutton(self.panneauControles, text="Limiter le score", variable=self.limiterScore)
         # séparateurs pour améliorer le placement des widgets
         self.separateurs_30px = [Frame(self.panneauControles, width=30, height=30) for i in range(3)]
-        self.separateurs_5px = [Frame(self.panneauControles, width=5, height=5) for i in range(5)]
+        self.separateurs_5px = [Frame(self.panneauControles, width=5, height=5) for i in range(6)]
 
         # sélectionner un bouton avec Tab provoque un conflit avec la touche Espace, on désactive donc Tab
         def neRienFaire(evenement):
             return "break"      # demande d'ignorer l'événement (l'appui de la touche ne sera pas traité)
         self.bind("<Tab>", neRienFaire)    # on affecte à Tab une fonction qui ne fait rien
 
+        # touche de débogage : F12 affiche les mesures des phases des ticks (si le profilage est activé, voir GrilleMelobrics)
+        self.bind("<F12>", lambda evenement: self.canvasGrille.afficherProfil())
+
         # on affiche l'accueil
         self.afficherEcranAccueil()
 
+        # puis on reprend la partie sauvegardée, s'il y en a une
+        self.update_idletasks()         # (pour que la grille connaisse sa taille)
+        self.canvasGrille.reprendre()
+
     def afficherAide(self, event=None):
         """Affiche l'aide du jeu"""
 
@@ -102,7 +135,21 @@ class FenetrePrincipale(Tk):
 
         # Puis on affiche la boîte de dialogue d'aide
         showinfo("Comment jouer",
-                "Les contrôles sont simples :\n- flèches droite et gauche pour dévier la pièce\n- flèche bas pour descendre plus vite\n- flèche haut pour retourner la pièce\n- espace pour activer et désactiver la pause\n\n(astuce : supprimer plusieurs lignes d'un coup rapporte plus de points !)")
+                "Les contrôles sont simples :\n- flèches droite et gauche pour dévier la pièce\n- flèche bas pour descendre plus vite\n- flèche haut pour retourner la pièce\n- entrée pour faire tomber la pièce d'un coup\n- espace pour activer et désactiver la pause\n\n(astuce : supprimer plusieurs lignes d'un coup rapporte plus de points !)\n\nLa partie en cours est sauvegardée à chaque pièce posée et quand vous quittez, et reprise au prochain lancement.")
+
+    def tailleGrille(self):
+        """Renvoie le nombre de colonnes et de lignes choisis par le joueur, ramenés entre les limites autorisées
+           (et remet les valeurs par défaut si ce qui est écrit n'est pas un nombre)"""
+
+        taille = []
+        for variable, defaut, maximum in ((self.nbColonnes, _NBCOLONNES_DEFAUT, _NBCOLONNES_MAX), (self.nbLignes, _NBLIGNES_DEFAUT, _NBLIGNES_MAX)):
+            try:
+                valeur = min(max(variable.get(), _TAILLE_GRILLE_MIN), maximum)
+            except TclError:            # si ce n'est pas un nombre
+                valeur = defaut
+            variable.set(valeur)
+            taille.append(valeur)
+        return taille
 
     def rappelNouvellePartie(self):
         """Change l'affichage pour une nouvelle partie"""
@@ -155,7 +202,10 @@ class FenetrePrincipale(Tk):
                 elif ":" in pseudo:                 # si le nom contient ":"
                     showerror("Nom invalide", "Le nom ne peut pas contenir le caractère ':'.")
                 else:                               # si le nom est correct
-                    self.fenetreScores.ajouterScore(pseudo, score, difficulte)
+                    self.scores.ajouterScore(pseudo, score, difficulte)
+                    if self.fenetreScores != None:              # si la fenêtre des scores existe,
+                        self.fenetreScores.actualiserWidgets()  # on y affiche le nouveau score
+                    self.canvasGrille.sauverRejeu(pseudo, score)    # on garde le rejeu, qui permet de vérifier le score
                     break
 
         # on revient à l'écran d'accueil.
@@ -178,8 +228,10 @@ class FenetrePrincipale(Tk):
         self.separateurs_5px[2].pack()
         self.caseLimiterScore.pack()
         self.separateurs_5px[3].pack()
-        self.boutonAide.pack()
+        self.cadreTaille.pack()
         self.separateurs_5px[4].pack()
+        self.boutonAide.pack()
+        self.separateurs_5px[5].pack()
         self.boutonQuitter.pack()
         
         # ...puis les deux grands cadres (canvasGrille et panneauControles) dans la fenêtre.
@@ -218,6 +270,7 @@ class FenetrePrincipale(Tk):
         self.bind("<Left>", self.canvasGrille.mouvementGauche)
         self.bind("<Down>", self.canvasGrille.mouvementBas)
         self.bind("<Up>", self.canvasGrille.retournerPiece)
+        self.bind("<Return>", self.canvasGrille.chute)
 
     def cacherEcranPrecedent(self):
         """Retire tous les widgets de la fenêtre et désaffecte toutes les touches clavier.
@@ -233,10 +286,13 @@ class FenetrePrincipale(Tk):
         self.unbind("<Left>")
         self.unbind("<Down>")
         self.unbind("<Up>")
+        self.unbind("<Return>")
         
     def destroy(self):
-        """Détruit la fenêtre des scores avant de détruire la fenêtre principale"""
-        
-        self.fenetreScores.destroy()
+        """Sauvegarde la partie en cours et ferme le fichier des scores avant de détruire la fenêtre principale
+           (et celle des scores avec elle)"""
+
+        self.canvasGrille.sauvegarder()
+        self.scores.fermer()
         super().destroy()
 
@@ -1,41 +1,59 @@
-﻿"""Gère l'enregistrement et l'affichage des meilleurs scores dans une fenêtre"""
+﻿"""Gère l'affichage des meilleurs scores dans une fenêtre"""
 
 
 import sys                          # pour obtenir le chemin du jeu
 import os.path                      # pour les opérations sur les chemins
 from tkinter import *               # pour les widgets
 
+from gestion_scores import GestionScores    # pour les scores enregistrés
+
 
 # On récupère le chemin du dossier du jeu, pour y écrire le fichier des scores
 #   __file__ est le chemin du fichier python, dirname en extrait le dossier du jeu,
 #   os.sep est le séparateur de chemins du système ("\" dans C:\windows\ par exemple)
-_CHEMIN_FICHIER_SCORES = os.path.dirname(__file__) + os.sep + "scores.txt"
+CHEMIN_FICHIER_SCORES = os.path.dirname(__file__) + os.sep + "scores.txt"
 # le résultat est donc : "C:\<chemin_du_jeu>\scores.txt"
 
+# nombre de scores affichés à la fois dans le tableau (seuls ces scores sont insérés dans la Listbox)
+_NB_SCORES_VISIBLES = 30
+# nombre de scores parcourus à chaque cran de la molette de la souris
+_NB_SCORES_MOLETTE = 3
+# période (en ms) de vérification de la fin de la lecture des scores
+_PERIODE_ATTENTE_CHARGEMENT = 100
 
-class FenetreScores(Tk):
-    """Fenêtre qui enregistre et affiche les scores"""
-    
-    def __init__(self, difficulte_max):
-        """Crée les widgets et les place dans la fenêtre"""
-        
-        # constructeur de la classe parent Tk
-        super().__init__()
+
+class FenetreScores(Toplevel):
+    """Fenêtre qui affiche les scores enregistrés"""
+
+    def __init__(self, maitre, scores, difficulte_max):
+        """Crée les widgets et les place dans la fenêtre.
+           scores est la GestionScores dont on affiche les scores (éventuellement encore en cours de lecture)."""
+
+        # constructeur de la classe parent Toplevel
+        super().__init__(maitre)
         
         # titre et taille de la fenêtre
         self.wm_title("Meilleurs scores")
         self.resizable(width=False, height=False)
 
-        # on enregistre la difficulté maximale
+        # on enregistre les scores et la difficulté maximale
+        self.scores = scores
         self.difficulte_max = difficulte_max
+
+        # la fenêtre se masque quand on la ferme
+        self.protocol("WM_DELETE_WINDOW", self.withdraw)    # fermer la fenêtre = la masquer (withdraw masque la fenêtre)
         
-        # la fenêtre est masquée par défaut et se masque quand on la ferme
-        self.withdraw()                                     # withdraw masque la fenêtre
-        self.protocol("WM_DELETE_WINDOW", self.withdraw)    # fermer la fenêtre = la masquer
-        
-        # création des widgets
-        self.tableau_scores = Listbox(self, width=50, height=30)
+        # création des widgets :
+        # le tableau n'affiche qu'une page de scores, la barre de défilement et les boutons permettent de changer de page
+        self.tableau_scores = Listbox(self, width=50, height=_NB_SCORES_VISIBLES)
         self.tableau_scores.pack(side=LEFT)
+        self.barre_defilement = Scrollbar(self, command=self.defiler)
+        self.barre_defilement.pack(side=LEFT, fill=Y)
+        self.tableau_scores.bind("<MouseWheel>", self.defilerMolette)              # molette sous Windows et Mac
+        self.tableau_scores.bind("<Button-4>", self.defilerMolette)                # molette sous Linux
+        self.tableau_scores.bind("<Button-5>", self.defilerMolette)
+        self.bind("<Prior>", lambda evenement: self.defiler("scroll", -1, "pages"))   # touches page précédente
+        self.bind("<Next>", lambda evenement: self.defiler("scroll", 1, "pages"))     # et page suivante
         self.panneau_boutons = Frame(self)
         self.boutons_difficultes = []
         class BoutonDifficulte(Button):
@@ -59,72 +77,112 @@ class FenetreScores(Tk):
             
         self.separateur = Frame(self.panneau_boutons, width=30, height=30)
         self.separateur.pack()
+        self.boutonPagePrecedente = Button(self.panneau_boutons, text="Page précédente", command=lambda: self.defiler("scroll", -1, "pages"))
+        self.boutonPagePrecedente.pack()
+        self.boutonPageSuivante = Button(self.panneau_boutons, text="Page suivante", command=lambda: self.defiler("scroll", 1, "pages"))
+        self.boutonPageSuivante.pack()
+        self.cadreRang = Frame(self.panneau_boutons)
+        self.champRang = Entry(self.cadreRang, width=8)
+        self.champRang.pack(side=LEFT)
+        self.champRang.bind("<Return>", lambda evenement: self.allerAuRang())
+        self.boutonRang = Button(self.cadreRang, text="Aller au rang", command=self.allerAuRang)
+        self.boutonRang.pack(side=LEFT)
+        self.cadreRang.pack()
+        self.separateur2 = Frame(self.panneau_boutons, width=30, height=30)
+        self.separateur2.pack()
         self.boutonQuitter = Button(self.panneau_boutons, text="Fermer", command=self.withdraw)
         self.boutonQuitter.pack()
         self.panneau_boutons.pack(side=LEFT)
 
-        # on affiche la difficulté 1 par défaut
+        # on affiche la difficulté 1 par défaut, à partir du meilleur score
         self.tableau_scores.difficulte_affichee = 1
+        self.tableau_scores.premier_rang = 0            # nombre de scores au-dessus du premier score affiché
+        self.actualisation_programmee = False           # indique si actualiserTableau est déjà programmé
         self.boutons_difficultes[0].config(relief=SUNKEN)
-        
-        # fichier des scores
-        self.fichier = open(_CHEMIN_FICHIER_SCORES, "a+", encoding="utf-8")
-        self.lireScores()
+
+        # on affiche les scores, ou on attend la fin de leur lecture
+        self.attendreChargement()
+
+    def attendreChargement(self):
+        """Affiche les scores si leur lecture est terminée, ou l'erreur si elle a échoué ; sinon l'indique et revérifie un peu plus tard"""
+
+        if self.scores.charge.is_set():
+            self.actualiserWidgets()
+        elif self.scores.erreur != None:
+            self.tableau_scores.delete(0, END)
+            self.tableau_scores.insert(END, "Impossible de lire les scores :", str(self.scores.erreur))
+        else:
+            self.tableau_scores.delete(0, END)
+            self.tableau_scores.insert(END, "Chargement des scores...")
+            self.after(_PERIODE_ATTENTE_CHARGEMENT, self.attendreChargement)
 
     def afficherDifficulte(self, difficulte):
         """Affiche les scores de la difficulté demandée dans le tableau"""
 
         self.tableau_scores.difficulte_affichee = difficulte
+        self.tableau_scores.premier_rang = 0
         self.actualiserWidgets()
-        
-    def ajouterScore(self, pseudo, score, difficulte):
-        """Ajoute un score à la liste"""
 
-        self.scores_par_difficulte[difficulte-1].append((score, pseudo))
+    def defiler(self, action, nombre, unite=None):
+        """Change la page de scores affichée ; appelée par la barre de défilement, qui passe :
+           - "moveto" et la position (entre 0 et 1) du haut de la page,
+           - ou "scroll", un nombre de lignes ou de pages, et "units" ou "pages"."""
 
-        self.scores_par_difficulte[difficulte-1].sort()
-        self.scores_par_difficulte[difficulte-1].reverse()
-        
-        self.actualiserWidgets()
-    
-    def lireScores(self):
-        """Lit le fichier et met à jour les scores affichés par la fenêtre"""
+        nbScores = self.scores.index.nbScores(self.tableau_scores.difficulte_affichee)
+        if action == "moveto":
+            premierRang = int(float(nombre) * nbScores)
+        elif unite == "pages":
+            premierRang = self.tableau_scores.premier_rang + int(nombre) * _NB_SCORES_VISIBLES
+        else:
+            premierRang = self.tableau_scores.premier_rang + int(nombre)
+        self.afficherRang(premierRang)
+
+    def defilerMolette(self, evenement):
+        """Fait défiler le tableau avec la molette de la souris"""
 
-        self.scores_par_difficulte = [[] for i in range(self.difficulte_max)]   # on efface l'ancienne liste
+        if evenement.num == 4 or evenement.delta > 0:      # vers le haut
+            self.defiler("scroll", -_NB_SCORES_MOLETTE)
+        else:                                               # vers le bas
+            self.defiler("scroll", _NB_SCORES_MOLETTE)
+        return "break"
+
+    def allerAuRang(self):
+        """Affiche la page commençant au rang entré dans champRang"""
+
+        rang = self.champRang.get().strip()
+        if rang.isdigit() and int(rang) > 0:
+            self.afficherRang(int(rang) - 1)
+
+    def afficherRang(self, premierRang):
+        """Affiche les scores à partir du score de rang premierRang+1 (en restant dans la liste)"""
+
+        nbScores = self.scores.index.nbScores(self.tableau_scores.difficulte_affichee)
+        self.tableau_scores.premier_rang = max(min(premierRang, nbScores - _NB_SCORES_VISIBLES), 0)
+        self.actualiserWidgets()
         
-        self.fichier.seek(0)                                                    # on se place au début du fichier
-        for ligne in self.fichier.readlines():                                          # Pour chaque ligne du fichier,
-            score = ligne[:-1].split(":")                                               # on sépare la ligne selon le format des scores (pseudo:score:difficulté),
-            if len(score) != 3 or not score[1].isdigit() or not score[2].isdigit():     # s'il n'y a pas trois parties séparées par ':' ou si score ou difficulté n'est pas un nombre,
-                continue                                                                # on ignore la ligne. Sinon,
-            self.ajouterScore(score[0], int(score[1]), int(score[2]))                   # on enregistre le score.
-    
     def actualiserWidgets(self):
-        """Met à jour les scores affichés par la fenêtre"""
-        
-        self.tableau_scores.delete(0, END)
-        
-        for score in self.scores_par_difficulte[self.tableau_scores.difficulte_affichee-1]:
-            self.tableau_scores.insert(END, "{} : {}".format(score[1], score[0]))
-    
-    def ecrireScores(self):
-        """Ecrit la liste actuelle des scores dans le fichier"""
-        
-        self.fichier.truncate(0)
-        self.fichier.write("Fichier des scores. Format : \"<pseudo>:<score>:<difficulté>\".\nAttention, les lignes ne respectant pas ce format seront ignorées lors de la lecture et disparaîtront lors de la réécriture du fichier.\n\n")
-        
-        for difficulte in range(self.difficulte_max):
-            for score in self.scores_par_difficulte[difficulte]:
-                self.fichier.write("{}:{}:{}\n".format(
-                    score[1],
-                    score[0],
-                    difficulte+1))
-    
-    def destroy(self):
-        """Ecrit les scores dans le fichier et ferme ce dernier avant de quitter"""
-        
-        self.ecrireScores()     # on écrit les scores dans le fichier
-        self.fichier.close()    # on ferme le fichier
+        """Programme la mise à jour des scores affichés par la fenêtre.
+           La mise à jour a lieu quand Tk n'a plus rien à faire : plusieurs changements à la suite ne la font qu'une fois."""
+
+        if not self.actualisation_programmee:
+            self.actualisation_programmee = True
+            self.after_idle(self.actualiserTableau)
 
-        super().destroy()       # on détruit la fenêtre
+    def actualiserTableau(self):
+        """Met à jour les scores affichés par la fenêtre : seuls les scores visibles sont insérés dans le tableau"""
+
+        self.actualisation_programmee = False
+        if not self.scores.charge.is_set():     # (tant que la lecture n'est pas terminée, attendreChargement s'en occupe)
+            return
+
+        difficulte, premierRang = self.tableau_scores.difficulte_affichee, self.tableau_scores.premier_rang
+        self.tableau_scores.delete(0, END)
+        scores = self.scores.index.meilleurs(difficulte, _NB_SCORES_VISIBLES, premierRang)
+        self.tableau_scores.insert(END, *["{}. {} : {}".format(premierRang+rang+1, pseudo, score) for rang, (score, pseudo) in enumerate(scores)])
 
+        # on place le curseur de la barre de défilement selon la page affichée
+        nbScores = self.scores.index.nbScores(difficulte)
+        if nbScores > 0:
+            self.barre_defilement.set(premierRang / nbScores, (premierRang + len(scores)) / nbScores)
+        else:
+            self.barre_defilement.set(0, 1)
@@ -0,0 +1,75 @@
+﻿"""Gestion des scores enregistrés : fichier des scores et index, chargés en arrière-plan"""
+
+import threading            # pour charger les scores sans bloquer la fenêtre
+
+from journal_scores import JournalScores, ligneScore    # pour le fichier des scores
+from index_scores import IndexScores        # pour les scores triés
+
+
+class GestionScores:
+    """Scores enregistrés : le fichier des scores (JournalScores) et leur index (IndexScores).
+
+       Le fichier est lu par un thread dès la création, pour que le jeu démarre sans attendre :
+       tant que la lecture n'est pas terminée, index est vide et les scores ajoutés sont mis en attente,
+       puis écrits et indexés dès la fin de la lecture. charge indique si la lecture est terminée ;
+       si elle échoue, erreur contient l'exception et les scores ajoutés restent en attente (fermer les écrit à la fin du fichier)."""
+
+    def __init__(self, chemin, difficulteMax):
+        """Lance la lecture du fichier des scores en arrière-plan"""
+
+        self.chemin, self.difficulteMax = chemin, difficulteMax
+        self.journal = None
+        self.index = IndexScores(difficulteMax)
+        self.scoresEnAttente = []           # scores ajoutés avant la fin de la lecture
+        self.ferme = False                  # indique si fermer a été appelée
+        self.verrou = threading.Lock()      # protège journal, index, scoresEnAttente et ferme
+        self.charge = threading.Event()     # activé à la fin de la lecture
+        self.erreur = None                  # exception levée par la lecture, si elle a échoué
+
+        threading.Thread(target=self.charger, daemon=True).start()
+
+    def charger(self):
+        """Lit le fichier des scores et construit l'index (dans le thread de lecture)"""
+
+        try:
+            journal = JournalScores(self.chemin)
+            index = IndexScores(self.difficulteMax)
+            index.charger(journal.lire())
+        except Exception as erreur:         # (fichier illisible...) : la fenêtre des scores l'affichera, voir FenetreScores.attendreChargement
+            with self.verrou:
+                self.erreur = erreur
+            return
+
+        with self.verrou:
+            if self.ferme:                  # si le jeu a été quitté pendant la lecture, fermer a déjà écrit les scores en attente
+                journal.fermer()
+                return
+            self.journal, self.index = journal, index
+            for pseudo, score, difficulte in self.scoresEnAttente:     # on enregistre les scores en attente
+                self.journal.ajouter(pseudo, score, difficulte)
+                self.index.ajouter(pseudo, score, difficulte)
+            self.scoresEnAttente = []
+            self.charge.set()
+
+    def ajouterScore(self, pseudo, score, difficulte):
+        """Enregistre un score (ou le met en attente si la lecture du fichier n'est pas terminée)"""
+
+        with self.verrou:
+            if not self.charge.is_set():
+                self.scoresEnAttente.append((pseudo, score, difficulte))
+                return
+            self.journal.ajouter(pseudo, score, difficulte)
+            self.index.ajouter(pseudo, score, difficulte)
+
+    def fermer(self):
+        """Ferme le fichier des scores, sans attendre la fin de la lecture si elle est en cours
+           (les scores en attente sont alors ajoutés directement à la fin du fichier)"""
+
+        with self.verrou:
+            self.ferme = True
+            if self.journal != None:
+                self.journal.fermer()
+            elif self.scoresEnAttente:
+                with open(self.chemin, "a", encoding="utf-8") as fichier:
+                    fichier.writelines(ligneScore(*score) for score in self.scoresEnAttente)
+                self.scoresEnAttente = []
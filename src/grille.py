@@ -1,236 +1,37 @@
 ﻿"""Widgets permettant de gérer et dessiner le jeu, et de traiter les commandes transmises par la fenêtre"""
 
 from tkinter import *       # pour créer le widget affichant la grille
-from random import randint  # pour choisir aléatoirement une forme et une couleur de pièce
-from copy import deepcopy   # pour copier correctement une pièce
-
-
-_PAS_SCORE = 100   # gain de score à chaque ligne détruite
-
-
-# Liste des formes de pièces possibles
-_FORMES_PIECES = (
-    # ####
-    [
-        {
-            "abscisse":1,
-            "ordonnee":0
-        },
-        {
-            "abscisse":0,
-            "ordonnee":1
-        },
-        {
-            "abscisse":1,
-            "ordonnee":1
-        },
-        {
-            "abscisse":2,
-            "ordonnee":1
-        },
-    ],
-    #  #
-    # ###
-    [
-        {
-            "abscisse":0,
-            "ordonnee":0
-        },
-        {
-            "abscisse":0,
-            "ordonnee":1
-        },
-        {
-            "abscisse":0,
-            "ordonnee":2
-        },
-        {
-            "abscisse":0,
-            "ordonnee":3
-        }
-    ],
-    # ##
-    # ##
-    [
-        {
-            "abscisse":0,
-            "ordonnee":0
-        },
-        {
-            "abscisse":1,
-            "ordonnee":0
-        },
-        {
-            "abscisse":0,
-            "ordonnee":1
-        },
-        {
-            "abscisse":1,
-            "ordonnee":1
-        },
-    ],
-    # #
-    # ###
-    [
-        {
-            "abscisse":0,
-            "ordonnee":0
-        },
-        {
-            "abscisse":0,
-            "ordonnee":1
-        },
-        {
-            "abscisse":1,
-            "ordonnee":1
-        },
-        {
-            "abscisse":2,
-            "ordonnee":1
-        },
-    ],
-    #   #
-    # ###
-    [
-        {
-            "abscisse":0,
-            "ordonnee":1
-        },
-        {
-            "abscisse":1,
-            "ordonnee":1
-        },
-        {
-            "abscisse":2,
-            "ordonnee":1
-        },
-        {
-            "abscisse":2,
-            "ordonnee":0
-        },
-    ],
-    #  ##
-    # ##
-    [
-        {
-            "abscisse":0,
-            "ordonnee":1
-        },
-        {
-            "abscisse":1,
-            "ordonnee":1
-        },
-        {
-            "abscisse":1,
-            "ordonnee":0
-        },
-        {
-            "abscisse":2,
-            "ordonnee":0
-        },
-    ],
-    # ##
-    #  ##
-    [
-        {
-            "abscisse":0,
-            "ordonnee":0
-        },
-        {
-            "abscisse":1,
-            "ordonnee":0
-        },
-        {
-            "abscisse":1,
-            "ordonnee":1
-        },
-        {
-            "abscisse":2,
-            "ordonnee":1
-        },
-    ]
-)
-
-# Liste des couleurs de pièces possibles
-_COULEURS_PIECES = (
-    "blue",
-    "green",
-    "red",
-    "orange",
-    "purple",
-    "yellow",
-    "hotpink"
-)
-
-
-class _PieceMelobrics:
-    """Représente une pièce (groupe de briques)"""
-
-    def __init__(self, aleatoire=True, largeur=None, hauteur=None, couleur=None):
-        """Si aleatoire=True, choisit aléatoirement les caractéristiques de la pièce
-           Si aleatoire=False, crée une pièce vide, largeur, hauteur et couleur doivent être fournies
-
-           Le cas aleatoire=False sert uniquement dans _PieceMelobrics.retourner"""
-
-        if aleatoire == True:
-            self.choisirAleatoirement()
-        else:
-            self.largeur, self.hauteur = largeur, hauteur
-            self.couleur = couleur
-            self.briques = list()
-
-    def choisirAleatoirement(self):
-        """Initialise aléatoirement forme et couleur de la pièce, à partir des listes au-dessus"""
-
-        self.briques = _FORMES_PIECES[randint(0, len(_FORMES_PIECES)-1)]
-        self.couleur = _COULEURS_PIECES[randint(0, len(_COULEURS_PIECES)-1)]
-
-        self.largeur = 0
-        self.hauteur = 0
-
-        for brique in self.briques:
-            brique["couleur"] = self.couleur
-            self.largeur = max(self.largeur, brique["abscisse"]+1)
-            self.hauteur = max(self.hauteur, brique["ordonnee"]+1)
-
-    def ajouterBrique(self, abscisse, ordonnee):
-        """Ajoute une brique dans la pièce aux coordonnées demandées"""
 
-        self.briques.append({
-                            "abscisse": abscisse,
-                            "ordonnee": ordonnee,
-                            "couleur": self.couleur
-                        })
+from moteur import *                # pour les règles du jeu
+from moteur import _FORMES_PIECES, _COULEURS_PIECES # pour la taille maximale et les couleurs d'une pièce
+import rejeu                        # pour enregistrer les parties
+import sauvegarde                   # pour sauvegarder et reprendre la partie en cours
+from cadenceur import Cadenceur, monotonic  # pour cadencer la descente et le dessin
+from collections import deque       # pour la file des actions du joueur
+from math import ceil               # pour arrondir les délais du minuteur à la milliseconde supérieure
+from image_grille import ImageRGB, DessinGrille, _TAILLE_CASE_MIN_LIGNES   # pour le rendu dans une image
+from profilage import ProfilTicks   # pour mesurer la durée de chaque phase des ticks
 
-        self.largeur = max(self.largeur, abscisse+1)
-        self.hauteur = max(self.hauteur, ordonnee+1)
 
-    def retourner(self):
-        """Renvoie la pièce retournée de 90°"""
+# Période minimale entre deux dessins de la grille, en secondes (une image)
+_PERIODE_DESSIN = 1/60
 
-        # on crée une pièce vide, qu'on remplira en parcourant la pièce à retourner (noter qu'on inverse hauteur et largeur)
-        pieceRetournee = _PieceMelobrics(False, self.hauteur, self.largeur, self.couleur)
-
-        # on copie chaque case de l'ancienne pièce à son nouvel emplacement
-        for brique in self.briques:
-            nouvelleAbscisse = pieceRetournee.largeur-1-brique["ordonnee"]
-            nouvelleOrdonnee = brique["abscisse"]
-            pieceRetournee.briques.append({
-                                "abscisse": nouvelleAbscisse,
-                                "ordonnee": nouvelleOrdonnee,
-                                "couleur": self.couleur
-                            })
-
-            self.largeur = max(self.largeur, nouvelleAbscisse+1)
-            self.hauteur = max(self.hauteur, nouvelleOrdonnee+1)
-
-        return pieceRetournee
+# Façons de dessiner la grille (voir GrilleMelobrics.__init__) :
+# - RENDU_RECTANGLES : un rectangle du Canvas par case remplie,
+# - RENDU_IMAGE      : une seule image, dessinée en mémoire (voir image_grille.py), dont seules les lignes de pixels modifiées sont recopiées
+RENDU_RECTANGLES = "rectangles"
+RENDU_IMAGE = "image"
+# Mesures du banc d'essai (voir la fin du fichier ; python grille.py 2000, sans affichage, donc sans le rendu en rectangles
+# ni la recopie dans la PhotoImage) : dessiner l'image en mémoire coûte 1,7 ms en 10 x 15, 0,8 ms en 40 x 60 et 0,2 ms
+# en 200 x 400, à taille de grille égale en pixels. Le coût suit le nombre de pixels redessinés, pas le nombre de cases :
+# il baisse quand les cases rapetissent. Le rendu en rectangles reste celui par défaut, la bascule entre les deux rendus
+# n'ayant pas été mesurée (le banc d'essai complet a besoin d'un affichage).
 
 
 class GrilleMelobrics(Canvas):
     """Grille de jeu"""
 
-    def __init__(self, maitre, largeur, hauteur, nbColonnes, nbLignes, rappelNouvellePartie, rappelNouvellePiece, rappelPause, rappelScoreChange, rappelPartieTerminee):
+    def __init__(self, maitre, largeur, hauteur, nbColonnes, nbLignes, rappelNouvellePartie, rappelNouvellePiece, rappelPause, rappelScoreChange, rappelPartieTerminee, rendu=RENDU_RECTANGLES, profilage=False):
         """Initialise la grille.
 
         Liste des arguments :
@@ -242,6 +43,8 @@ class GrilleMelobrics(Canvas):
         - rappelPause               : fonction appelée quand le jeu entre ou sort de pause (avec self.enPause en argument)
         - rappelScoreChange         : fonction appelée quand le score change (avec le score en argument)
         - rappelPartieTerminee      : fonction appelée quand la partie est terminée (avec le score et la difficulté, et un argument : True si gagné, False sinon)
+        - rendu                     : façon de dessiner la grille, RENDU_RECTANGLES ou RENDU_IMAGE (voir leurs mesures)
+        - profilage                 : si True, la durée de chaque phase des ticks est mesurée (voir instrumenter et afficherProfil)
 
         La grille prévient la fenêtre principale avec les fonctions rappel<QuelqueChose> dès que quelqueChose a changé et a besoin d'être affiché.
         """
@@ -259,190 +62,240 @@ class GrilleMelobrics(Canvas):
         self.rappelPause = rappelPause
         self.rappelScoreChange = rappelScoreChange
         self.rappelPartieTerminee = rappelPartieTerminee
+        if rendu not in (RENDU_RECTANGLES, RENDU_IMAGE):
+            raise ValueError("Rendu inconnu : {}".format(rendu))
+        self.rendu = rendu
+
+        # les règles du jeu sont gérées par le moteur, la grille ne fait que l'afficher et le cadencer
+        self.moteur = MoteurMelobrics(nbColonnes, nbLignes, rappelNouvellePiece, rappelScoreChange, self.partieTerminee)
+
+        # ids des appels programmés avec after et after_idle (None s'il n'y en a pas), voir annulerMinuteurs
+        self.after_id, self.dessin_id, self.actions_id = None, None, None
+        self.actionsEnAttente = deque()     # actions du joueur pas encore appliquées, voir mettreEnFile
 
-        # initialisation : le jeu commence en pause et la pièce en déplacement n'est pas encore créée
+        # la partie en cours est sauvegardée à chaque pièce posée, par un thread (voir sauvegardeAutomatique)
+        self.sauvegardeAuto = sauvegarde.SauvegardeAuto()
+        self.nbPiecesSauvegardees = None    # nombre de pièces données lors de la dernière sauvegarde
+
+        # mesure des phases des ticks, si elle est demandée (voir instrumenter)
+        self.profil = ProfilTicks() if profilage else None
+        if self.profil != None:
+            self.instrumenter()
+
+        # initialisation : le jeu commence en pause
         self.enPause = True
-        self.piece = None
 
-    def mouvementBas(self, evenement=None):
-        """Fait avancer le jeu :
-            - déplace la pièce d'un rang vers le bas si possible,
-            - en insère une nouvelle si nécessaire,
-            - pour chaque ligne pleine, efface la ligne et augmente le score,
-            - se relance pour la prochaine étape"""
+    def mettreEnFile(self, action):
+        """Met une action du joueur (ACTION_...) dans la file d'attente.
+           Les actions en attente sont appliquées toutes ensemble quand Tk n'a plus d'événement à traiter (voir appliquerActions) :
+           avec la répétition automatique des touches, plusieurs actions sont ainsi appliquées pour un seul dessin."""
 
         if self.enPause:        # si le jeu est en pause,
-            return              # on quitte
-
-        # si une pièce est en mouvement, on tente de la faire descendre
-        if self.piece != None:
-            obstacle = False
-            # on vérifie si la pièce a atteint la dernière ligne...
-            if self.ordonneePiece >= self.nbLignes-self.piece.hauteur:
-                obstacle = True
-            # ...puis si elle a atteint un obstacle (une autre brique)
-            else:
-                for brique in self.piece.briques:
-                    if self.grille[self.abscissePiece+brique["abscisse"]][self.ordonneePiece+brique["ordonnee"]+1] != None:
-                        obstacle = True
-                        break
-            if obstacle:                            # Si la pièce est bloquée,
-                for brique in self.piece.briques:   # on la "fixe" dans la grille,
-                    self.grille[self.abscissePiece+brique["abscisse"]][self.ordonneePiece+brique["ordonnee"]] = brique
-                self.piece = None                   # on la supprime,
-                nb_lignes_pleines = 0
-                for ligne in range(self.nbLignes):  # et on vérifie si des lignes sont remplies.
-                    lignePleine = True
-                    for colonne in range(self.nbColonnes):
-                        if self.grille[colonne][ligne] == None:     # si une case est vide,
-                            lignePleine = False                     # la ligne n'est pas pleine
-                            break
-                    # si la ligne est pleine, on la supprime et on augmente le score
-                    if lignePleine:
-                        # on augmente le score...
-                        nb_lignes_pleines += 1
-                        # le gain de score de chaque ligne est multiplié par le nombre de lignes détruites
-                        # -> supprimer plusieurs lignes d'un coup peut rapporter beaucoup plus
-                        self.score += _PAS_SCORE * nb_lignes_pleines
-                        self.rappelScoreChange(self.score, self.limiterScore, self.scoreMaximal)
-                        # ...on supprime la ligne...
-                        for colonne in range(self.nbColonnes):
-                            self.grille[colonne][ligne] = None
-                        # ...on descend d'un rang toutes les lignes supérieures...
-                        for ligne2 in range(1, ligne+1)[::-1]:
-                            for colonne in range(self.nbColonnes):
-                                self.grille[colonne][ligne2] = self.grille[colonne][ligne2-1]
-                        # ...et si le score maximal est atteint, on a gagné
-                        if self.limiterScore and self.score >= self.scoreMaximal:
-                            self.partieTerminee(True)
-                            return
-            else:                                   # Si la pièce peut encore descendre,
-                self.ordonneePiece += 1             # on la descend,
-
-        # s'il n'y a pas ou plus de pièce en mouvement, on insère la suivante
-        if self.piece == None:
-            self.piece = deepcopy(self.prochainePiece)
-            self.abscissePiece, self.ordonneePiece = self.nbColonnes//2 - self.piece.largeur//2, 0  # on change les coordonnées
-            # on vérifie que la pièce peut être insérée
-            obstacle = False
-            for brique in self.piece.briques:                                                                       # pour chaque brique,
-                if self.grille[self.abscissePiece+brique["abscisse"]][self.ordonneePiece+brique["ordonnee"]] != None:   # si la pièce ne peut pas être insérée,
-                    self.partieTerminee(False)                                                                      # on a perdu
-                    return
-            self.prochainePiece = _PieceMelobrics()         # on crée la pièce suivante
-            self.rappelNouvellePiece(self.prochainePiece)   # et on l'affiche
-
-        # on redessine
-        self.dessiner()
+            return              # on ignore l'action
+
+        self.actionsEnAttente.append(action)
+        if self.actions_id == None:
+            self.actions_id = self.after_idle(self.appliquerActions)
+
+    def appliquerActions(self):
+        """Applique dans l'ordre les actions en attente, en les enregistrant, puis demande un dessin si quelque chose a bougé"""
+
+        self.actions_id = None
+        aChange = False
+        while self.actionsEnAttente:
+            action = self.actionsEnAttente.popleft()
+            self.enregistrement.ajouterAction(self.nbTicks, action)
+            aChange |= self.moteur.etape(action)
+            if self.moteur.terminee:    # si la partie vient de se terminer,
+                return                  # partieTerminee a déjà tout arrêté
+        self.sauvegardeAutomatique()
+        if aChange:
+            self.demanderDessin()
 
-        if evenement != None:                   # si appelée au clavier,
-            self.after_cancel(self.after_id)    # on évite de lancer la boucle deux fois
-        # on programme la prochaine étape, en enregistrant l'id
-        # l'id permet d'annuler la prochaine étape avec after_cancel
-        self.after_id = self.after(self.periodeDeplacement, self.mouvementBas)
+    def mouvementBas(self, evenement=None):
+        """Fait descendre la pièce d'un rang (au clavier), voir MoteurMelobrics.mouvementBas.
+           La descente automatique n'est pas décalée : elle garde son propre rythme (voir boucle)."""
+
+        self.mettreEnFile(ACTION_BAS)
 
     def mouvementGauche(self, evenement=None):
         """Déplace la pièce d'un rang vers la gauche"""
 
-        if self.enPause:
-            return
-
-        obstacle = False
-        for brique in self.piece.briques:                                                               # on vérifie si un obstacle est rencontré
-            if self.abscissePiece + brique["abscisse"] <= 0 or self.grille[self.abscissePiece+brique["abscisse"]-1][self.ordonneePiece+brique["ordonnee"]] != None:
-                obstacle = True
-                break
-
-        if not obstacle:                # si la place est libre,
-            self.abscissePiece -= 1     # on déplace la pièce
-            self.dessiner()             # et on redessine
+        self.mettreEnFile(ACTION_GAUCHE)
 
     def mouvementDroite(self, evenement=None):
         """Déplace la pièce d'un rang vers la droite"""
 
-        if self.enPause:
-            return
-
-        obstacle = False
-        for brique in self.piece.briques:                                                               # on vérifie si un obstacle est rencontré
-            if self.abscissePiece + brique["abscisse"] >= self.nbColonnes-1 or self.grille[self.abscissePiece+brique["abscisse"]+1][self.ordonneePiece+brique["ordonnee"]] != None:
-                obstacle = True
-                break
-
-        if not obstacle:                # si la place est libre,
-            self.abscissePiece += 1     # on déplace la pièce
-            self.dessiner()             # et on redessine
+        self.mettreEnFile(ACTION_DROITE)
 
     def retournerPiece(self, evenement=None):
         """Tourne la pièce de 90° vers la droite"""
 
-        if self.enPause:
-            return
+        self.mettreEnFile(ACTION_RETOURNER)
 
-        pieceRetournee = self.piece.retourner()
-
-        # on modifie les coordonnées de la nouvelle pièce
-        ordonneePieceTest = self.ordonneePiece + int(self.piece.hauteur/2 - pieceRetournee.hauteur/2)
-        # on teste différentes abscisses
-        for decalage in [0, -1, 1, -2, 2]:
-            abscissePieceTest = self.abscissePiece + int(self.piece.largeur/2 - pieceRetournee.largeur/2) + decalage
-            obstacle = False
-            for brique in pieceRetournee.briques:   # on vérifie si un obstacle est rencontré
-                if abscissePieceTest + brique["abscisse"] < 0 or abscissePieceTest + brique["abscisse"] >= self.nbColonnes or self.grille[abscissePieceTest+brique["abscisse"]][ordonneePieceTest+brique["ordonnee"]] != None:
-                    obstacle = True
-                    break
-            if not obstacle:
-                self.piece = pieceRetournee
-                self.abscissePiece, self.ordonneePiece = abscissePieceTest, ordonneePieceTest
-                self.dessiner()
-                break
+    def chute(self, evenement=None):
+        """Fait tomber la pièce d'un coup jusqu'en bas"""
 
-    def nouvellePartie(self, difficulte, limiterScore):
-        """Prépare une nouvelle partie, à appeler avant de lancer"""
+        self.mettreEnFile(ACTION_CHUTE)
 
-        # création du tableau 2D qui représente la grille :
-        # pour chaque colonne, on crée une case vide par ligne (voir le compte rendu)
-        self.grille = [[None for i in range(self.nbLignes)] for j in range(self.nbColonnes)]
+    def descenteAutomatique(self):
+        """Fait descendre la pièce d'un rang au rythme du jeu : c'est un tick. Renvoie False si la partie s'est terminée."""
 
-        self.difficulte = difficulte                    # quand la difficulté augmente,
-        self.periodeDeplacement = 1000//difficulte      # la vitesse augmente...
+        # le tick est compté avant la descente : si elle termine la partie, l'enregistrement est terminé (voir sauverRejeu)
+        # pendant l'appel du moteur, et doit compter cette dernière descente pour que le rejeu aille jusqu'au bout
+        self.nbTicks += 1
+        self.moteur.etape(ACTION_BAS)
+        if self.moteur.terminee:
+            return False
+        self.sauvegardeAutomatique()
+        return True
 
-        if limiterScore:
-            self.scoreMaximal = 11000-1000*difficulte   # ...et le score à atteindre baisse
-        else:
-            self.scoreMaximal = None
-        self.limiterScore = limiterScore
+    def sauvegardeAutomatique(self):
+        """Sauvegarde la partie si une pièce a été posée depuis la dernière sauvegarde (une nouvelle pièce a alors été donnée).
+           Seul le codage se fait ici (quelques dizaines de microsecondes) : l'écriture est faite par le thread de sauvegardeAuto."""
+
+        if self.moteur.generateur.nbDonnees != self.nbPiecesSauvegardees:
+            self.nbPiecesSauvegardees = self.moteur.generateur.nbDonnees
+            self.sauvegardeAuto.proposer(self.moteur.instantane(), self.nbTicks, self.enregistrement)
+
+    def boucle(self):
+        """Boucle du jeu, appelée par le minuteur de Tk : fait les descentes automatiques dues depuis le dernier appel,
+           demande un dessin, puis se reprogramme pour la prochaine échéance.
+
+           Les échéances sont fixes (le retard du minuteur ne s'accumule pas) et les descentes en retard sont rattrapées ;
+           si la période des descentes est plus courte qu'une image, plusieurs descentes sont faites avant chaque dessin."""
+
+        maintenant = monotonic()
+
+        nbDescentes = self.cadenceDescentes.etapesDues(maintenant)
+        for i in range(nbDescentes):
+            if not self.descenteAutomatique():  # si la partie vient de se terminer,
+                return                          # partieTerminee a déjà tout arrêté
+        if nbDescentes:
+            self.demanderDessin()
+
+        # on programme le prochain appel à la prochaine descente
+        # l'id permet d'annuler le prochain appel avec after_cancel
+        self.after_id = self.after(max(ceil(self.cadenceDescentes.delai(maintenant)*1000), 1), self.boucle)
+
+    def demanderDessin(self):
+        """Indique que la grille a changé : elle sera redessinée une seule fois, quand Tk n'aura plus d'événement à traiter
+           (voir rafraichir), quel que soit le nombre de changements d'ici là"""
+
+        self.aRedessiner = True
+        if self.dessin_id == None:
+            self.dessin_id = self.after_idle(self.rafraichir)
+
+    def rafraichir(self):
+        """Redessine la grille si elle a changé, au plus une fois par image (_PERIODE_DESSIN) :
+           si la dernière image est trop récente, le dessin est reporté à la prochaine"""
+
+        maintenant = monotonic()
+        if not self.cadenceDessin.etapesDues(maintenant):   # si l'image précédente est trop récente, on attend la prochaine
+            self.dessin_id = self.after(max(ceil(self.cadenceDessin.delai(maintenant)*1000), 1), self.rafraichir)
+            return
+
+        self.dessin_id = None
+        if self.aRedessiner:
+            self.aRedessiner = False
+            self.dessiner()
+
+    def annulerMinuteurs(self):
+        """Déprogramme le prochain tour de boucle, le prochain dessin et les actions en attente"""
+
+        for nom in ("after_id", "dessin_id", "actions_id"):
+            if getattr(self, nom) != None:
+                self.after_cancel(getattr(self, nom))
+                setattr(self, nom, None)
+        self.actionsEnAttente.clear()
+
+    def nouvellePartie(self, difficulte, limiterScore, graine=None, modeTirage=MODE_ALEATOIRE):
+        """Prépare une nouvelle partie, à appeler avant de lancer (voir MoteurMelobrics.nouvellePartie pour graine et modeTirage)"""
 
-        self.score = 0          # compteur de score
         self.enPause = True     # indique si l'animation est en cours
-        self.piece = None       # contient la pièce actuellement en mouvement
 
-        # on calcule la taille des lignes et des colonnes en pixels
-        self.largeurColonne = self.winfo_width()/self.nbColonnes
-        self.hauteurLigne = self.winfo_height()/self.nbLignes
+        # on calcule la taille des cases en pixels : les cases sont carrées, et la grille la plus grande possible dans le widget
+        self.largeurColonne = self.hauteurLigne = min(self.winfo_width()/self.nbColonnes, self.winfo_height()/self.nbLignes)
+
+        # le moteur réinitialise la grille et le score (et prévient rappelScoreChange)
+        self.moteur.nouvellePartie(difficulte, limiterScore, graine, modeTirage)
 
-        # on initialise l'affichage du score
-        self.rappelScoreChange(self.score, self.limiterScore, self.scoreMaximal)
+        # on enregistre la partie pour pouvoir la rejouer (voir rejeu.py)
+        self.enregistrement = rejeu.EnregistrementPartie(self.moteur.graine, modeTirage, difficulte, limiterScore, self.nbColonnes, self.nbLignes)
+        self.nbTicks = 0        # nombre de descentes automatiques depuis le début de la partie
+        self.nbPiecesSauvegardees = None    # (la première descente sauvegardera la nouvelle partie à la place de l'ancienne)
 
+        self.preparerDessin()
         self.dessiner()
 
-        self.prochainePiece = _PieceMelobrics()
+        self.rappelNouvellePartie()
+
+    def reprendre(self):
+        """Reprend la partie sauvegardée (voir sauvegarder), en pause, comme nouvellePartie.
+           Renvoie False s'il n'y a pas de sauvegarde, ou si elle est illisible (elle est alors effacée)."""
+
+        try:
+            partie = sauvegarde.lirePartie()
+        except ValueError:
+            sauvegarde.effacerPartie()
+            return False
+        if partie == None:
+            return False
+        instantane, nbTicks, enregistrement = partie
+
+        if (instantane.nbColonnes, instantane.nbLignes) != (self.nbColonnes, self.nbLignes):
+            self.changerTaille(instantane.nbColonnes, instantane.nbLignes)
+        self.enPause = True
+        self.largeurColonne = self.hauteurLigne = min(self.winfo_width()/self.nbColonnes, self.winfo_height()/self.nbLignes)
+
+        # le moteur reprend l'état de la partie (et prévient rappelScoreChange et rappelNouvellePiece),
+        # et l'enregistrement continue, pour que le score de la partie reprise puisse être vérifié
+        self.moteur.restaurer(instantane)
+        self.enregistrement, self.nbTicks = enregistrement, nbTicks
+        self.nbPiecesSauvegardees = self.moteur.generateur.nbDonnees     # (la sauvegarde lue est à jour)
+
+        self.preparerDessin()
+        self.dessiner()
 
         self.rappelNouvellePartie()
+        self.rappelPause(True)
+        return True
+
+    def sauvegarder(self):
+        """Sauvegarde la partie en cours pour la reprendre plus tard (voir reprendre) ; renvoie False s'il n'y a pas de partie en cours.
+           Comme les sauvegardes automatiques, elle est écrite par le thread de sauvegardeAuto (au plus tard dans destroy)."""
+
+        if self.moteur.terminee:
+            return False
+        self.sauvegardeAuto.proposer(self.moteur.instantane(), self.nbTicks, self.enregistrement)
+        self.nbPiecesSauvegardees = self.moteur.generateur.nbDonnees
+        return True
+
+    def changerTaille(self, nbColonnes, nbLignes):
+        """Change le nombre de colonnes et de lignes de la grille, à appeler avant nouvellePartie (la partie en cours est perdue)"""
+
+        self.changerPause(True)
+        self.nbColonnes, self.nbLignes = nbColonnes, nbLignes
+        self.moteur = MoteurMelobrics(nbColonnes, nbLignes, self.rappelNouvellePiece, self.rappelScoreChange, self.partieTerminee)
+        if self.profil != None:
+            self.instrumenterMoteur()
 
     def changerPause(self, enPause=None):
         """Lance le jeu ou le met en pause.
            Si enPause n'est pas fourni, on inverse."""
 
         if (enPause == None and self.enPause) or enPause == False:
-            self.enPause = False                # On lance le jeu.
-            self.mouvementBas()
+            self.enPause = False                # On lance le jeu :
+            # les cadenceurs repartent de maintenant (la durée de la pause n'est pas à rattraper),
+            self.cadenceDescentes = Cadenceur(self.moteur.periodeDeplacement/1000)
+            self.cadenceDessin = Cadenceur(_PERIODE_DESSIN, retardMax=0)
+            self.aRedessiner = False
+            if self.descenteAutomatique():      # on fait une première descente tout de suite,
+                self.dessiner()
+                self.boucle()                   # et on lance la boucle.
         elif (enPause == None and not self.enPause) or enPause == True:
             self.enPause = True                 # On arrête le jeu,
-            try:
-                self.after_cancel(self.after_id)    # et on déprogramme la prochaine étape (par sécurité).
-            except AttributeError:
-                pass
+            self.annulerMinuteurs()             # et on déprogramme la boucle, le dessin et les actions en attente.
 
         self.rappelPause(self.enPause)
 
@@ -450,54 +303,182 @@ class GrilleMelobrics(Canvas):
         """Termine la partie et efface le dessin"""
 
         self.changerPause(True)             # On arrête le jeu,
-        self.rappelPartieTerminee(self.score, self.difficulte, gagne)    # on informe le joueur,
+        self.moteur.terminee = True         # (utile si le joueur abandonne)
+        self.sauvegardeAuto.effacer()       # (la partie ne pourra plus être reprise)
+        self.rappelPartieTerminee(self.moteur.score, self.moteur.difficulte, gagne)  # on informe le joueur,
         self.delete(ALL)                    # on efface la grille,
         self.rappelNouvellePiece(None)      # et on efface la prochaine pièce affichée.
 
-    def dessiner(self):
-        """Dessine la grille"""
+    def sauverRejeu(self, pseudo, score):
+        """Ecrit le rejeu de la partie terminée, avec le pseudo et le score enregistrés par le joueur"""
+
+        self.enregistrement.terminer(self.nbTicks, pseudo, score)
+        rejeu.sauverRejeu(self.enregistrement)
+
+    def instrumenter(self):
+        """Remplace les phases des ticks par des versions chronométrées (voir ProfilTicks.chronometrer) : celles de la grille
+           (actions du joueur, descente automatique, sauvegarde, dessin) et celles du moteur (voir instrumenterMoteur) ;
+           la boucle mesure en plus le retard des descentes sur leurs échéances (la gigue), où se voit le temps pris par Tk.
+           Seules les méthodes de cette grille sont remplacées : sans profilage, la mesure ne coûte rien."""
+
+        for phase, nom in (("entrées", "appliquerActions"), ("descente", "descenteAutomatique"),
+                           ("sauvegarde", "sauvegardeAutomatique"), ("dessin", "dessiner")):
+            setattr(self, nom, self.profil.chronometrer(phase, getattr(self, nom)))
+
+        boucle = self.boucle
+        def boucleMesuree():
+            maintenant = monotonic()
+            if maintenant >= self.cadenceDescentes.echeance:    # (si une descente est due)
+                self.profil.mesurerGigue(maintenant - self.cadenceDescentes.echeance, self.cadenceDescentes.periode)
+            boucle()
+        self.boucle = boucleMesuree
+
+        self.instrumenterMoteur()
+
+    def instrumenterMoteur(self):
+        """Remplace les phases du moteur par des versions chronométrées (à refaire pour chaque nouveau moteur, voir changerTaille)"""
+
+        for phase, nom in (("collision", "obstacle"), ("placement", "fixerPiece"), ("lignes", "effacerLignesPleines"),
+                           ("insertion", "insererPiece"), ("rappel score", "rappelScoreChange"), ("rappel pièce", "rappelNouvellePiece")):
+            setattr(self.moteur, nom, self.profil.chronometrer(phase, getattr(self.moteur, nom)))
+
+    def afficherProfil(self):
+        """Affiche le résumé des mesures des phases des ticks (voir instrumenter), si le profilage est activé"""
+
+        if self.profil != None:
+            print(self.profil.resume())
+
+    def preparerDessin(self):
+        """Efface le dessin et prépare celui d'une nouvelle partie (voir preparerRectangles et preparerImage)"""
 
-        # on efface l'ancien dessin
         self.delete(ALL)
+        if self.rendu == RENDU_IMAGE:
+            self.preparerImage()
+        else:
+            self.preparerRectangles()
+
+    def dessiner(self):
+        """Met à jour le dessin de la grille (voir dessinerRectangles et dessinerImage)"""
 
-        # on dessine une grille vide
-        for verticale in range(self.nbColonnes):
-            self.create_line(verticale*self.largeurColonne, 0, verticale*self.largeurColonne, self.winfo_height(), fill="grey")
-        for horizontale in range(self.nbLignes):
-            self.create_line(0, horizontale*self.hauteurLigne, self.winfo_width(), horizontale*self.hauteurLigne, fill="grey")
-
-        # on dessine chaque case pleine de la grille
-        for colonne in range(self.nbColonnes):              # pour chaque
-            for ligne in range(self.nbLignes):              # case de la grille,
-                if self.grille[colonne][ligne] != None:     # si la case est pleine,
-                    self.create_rectangle(                  # on dessine un rectangle
-                        colonne*self.largeurColonne,                    # abscisse supérieure gauche
-                        ligne*self.hauteurLigne,                        # ordonnée supérieure gauche
-                        (colonne+1)*self.largeurColonne,                # abscisse inférieure droite
-                        (ligne+1)*self.hauteurLigne,                    # ordonnée inférieure droite
-                        fill=self.grille[colonne][ligne]["couleur"]     # couleur du rectangle
+        if self.rendu == RENDU_IMAGE:
+            self.dessinerImage()
+        else:
+            self.dessinerRectangles()
+
+    def preparerImage(self):
+        """Crée l'image de la grille, en mémoire et sur le Canvas, et y dessine une grille vide"""
+
+        largeur, hauteur = int(self.nbColonnes*self.largeurColonne + 0.5) + 1, int(self.nbLignes*self.hauteurLigne + 0.5) + 1
+        self.imageGrille = ImageRGB(largeur, hauteur)
+        self.dessinGrille = DessinGrille(self.imageGrille, self.nbColonnes, self.nbLignes, self.largeurColonne)
+        self.dessinGrille.preparer()
+        self.photo = PhotoImage(width=largeur, height=hauteur)  # (à garder : Tk n'affiche plus une image que Python a libérée)
+        self.create_image(0, 0, image=self.photo, anchor=NW)
+
+    def dessinerImage(self):
+        """Met à jour l'image en mémoire, puis recopie dans l'image affichée les seules lignes de pixels modifiées"""
+
+        self.dessinGrille.dessiner(self.moteur)
+        lignes = self.imageGrille.prendreLignesModifiees()
+        if lignes:
+            self.photo.put(self.imageGrille.versPPM(lignes), to=(0, lignes.start))
+
+    def preparerRectangles(self):
+        """Crée ce qui reste en place pendant toute la partie :
+           les lignes de la grille, et les rectangles de la pièce en déplacement (masqués pour l'instant).
+           Les rectangles des cases sont créés à la demande par dessinerRectangles, puis réutilisés."""
+
+        # on dessine une grille vide (seulement son contour si les cases sont trop petites)
+        largeurGrille, hauteurGrille = self.nbColonnes*self.largeurColonne, self.nbLignes*self.hauteurLigne
+        self.create_rectangle(0, 0, largeurGrille, hauteurGrille, outline="grey")
+        if self.largeurColonne >= _TAILLE_CASE_MIN_LIGNES:
+            for verticale in range(1, self.nbColonnes):
+                self.create_line(verticale*self.largeurColonne, 0, verticale*self.largeurColonne, hauteurGrille, fill="grey")
+            for horizontale in range(1, self.nbLignes):
+                self.create_line(0, horizontale*self.hauteurLigne, largeurGrille, horizontale*self.hauteurLigne, fill="grey")
+
+        # pour chaque case, l'id de son rectangle (None tant qu'il n'a pas été créé) et la couleur affichée (0 pour une case vide)
+        self.rectanglesCases = [[None] * self.nbColonnes for i in range(self.nbLignes)]
+        self.couleursAffichees = [bytearray(self.nbColonnes) for i in range(self.nbLignes)]
+
+        # un rectangle par brique de la pièce en déplacement, qu'on déplacera au lieu de les recréer,
+        # et autant pour le fantôme de la pièce (son contour, là où elle tomberait), créés avant pour rester dessous
+        nbBriquesMax = max(len(forme) for forme in _FORMES_PIECES)
+        self.rectanglesFantome = [self.create_rectangle(0, 0, 0, 0, fill="", width=2, state=HIDDEN) for i in range(nbBriquesMax)]
+        self.rectanglesPiece = [self.create_rectangle(0, 0, 0, 0, state=HIDDEN) for i in range(nbBriquesMax)]
+        self.couleurPieceAffichee = None
+
+    def dessinerRectangles(self):
+        """Met à jour le dessin de la grille : seules les cases qui ont changé depuis le dernier dessin sont modifiées.
+           Le moteur indique les lignes qui ont pu changer (voir MoteurMelobrics.prendreLignesModifiees) :
+           les autres ne sont même pas comparées, le coût d'un dessin ne dépend pas de la taille de la grille."""
+
+        moteur = self.moteur
+
+        # on met à jour chaque case qui a changé
+        for ligne in moteur.prendreLignesModifiees():       # pour chaque ligne qui a pu changer
+            couleursLigne, couleursAffichees = moteur.couleurs[ligne], self.couleursAffichees[ligne]
+            if couleursLigne == couleursAffichees:          # (si elle n'a pas changé, on passe à la suivante)
+                continue
+            for colonne in range(self.nbColonnes):          # et chaque case de la ligne,
+                indiceCouleur = couleursLigne[colonne]
+                if indiceCouleur == couleursAffichees[colonne]: # si la case n'a pas changé,
+                    continue                                    # on n'y touche pas
+                rectangle = self.rectanglesCases[ligne][colonne]
+                if indiceCouleur == 0:                      # si la case s'est vidée,
+                    self.itemconfig(rectangle, state=HIDDEN)    # on masque son rectangle
+                elif rectangle == None:                     # si la case se remplit pour la première fois,
+                    self.rectanglesCases[ligne][colonne] = self.create_rectangle(  # on crée son rectangle
+                        colonne*self.largeurColonne,                # abscisse supérieure gauche
+                        ligne*self.hauteurLigne,                    # ordonnée supérieure gauche
+                        (colonne+1)*self.largeurColonne,            # abscisse inférieure droite
+                        (ligne+1)*self.hauteurLigne,                # ordonnée inférieure droite
+                        fill=_COULEURS_PIECES[indiceCouleur-1]      # couleur du rectangle
                     )
+                else:                                       # sinon, on réaffiche son rectangle avec la bonne couleur
+                    self.itemconfig(rectangle, fill=_COULEURS_PIECES[indiceCouleur-1], state=NORMAL)
+                couleursAffichees[colonne] = indiceCouleur
+
+        # puis on déplace les rectangles de la pièce en déplacement et de son fantôme
+        if moteur.piece == None:                            # s'il n'y a pas de pièce,
+            if self.couleurPieceAffichee != None:           # on masque leurs rectangles
+                for rectangle in self.rectanglesPiece + self.rectanglesFantome:
+                    self.itemconfig(rectangle, state=HIDDEN)
+                self.couleurPieceAffichee = None
+            return
 
-        # puis on dessine la pièce en déplacement
-        if self.piece != None:
-            for brique in self.piece.briques:   # pour chaque brique de la pièce,
-                self.create_rectangle(          # on dessine un rectangle
-                    (self.abscissePiece+brique["abscisse"])*self.largeurColonne,    # abscisse supérieure gauche
-                    (self.ordonneePiece+brique["ordonnee"])*self.hauteurLigne,      # ordonnée supérieure gauche
-                    (self.abscissePiece+brique["abscisse"]+1)*self.largeurColonne,  # abscisse inférieure droite
-                    (self.ordonneePiece+brique["ordonnee"]+1)*self.hauteurLigne,    # ordonnée inférieure droite
-                    fill=self.piece.couleur                                         # couleur du rectangle = couleur de la pièce
-                )
+        if moteur.piece.couleur != self.couleurPieceAffichee:   # si la couleur de la pièce a changé, on la met à jour
+            for rectangle in self.rectanglesPiece:
+                self.itemconfig(rectangle, fill=moteur.piece.couleur, state=NORMAL)
+            for rectangle in self.rectanglesFantome:
+                self.itemconfig(rectangle, outline=moteur.piece.couleur, state=NORMAL)
+            self.couleurPieceAffichee = moteur.piece.couleur
+        ordonneeChute = moteur.ordonneeChute()
+        for rectangle, rectangleFantome, (abscisse, ordonnee) in zip(self.rectanglesPiece, self.rectanglesFantome, moteur.piece.briques):
+            # pour chaque brique de la pièce, on déplace son rectangle
+            self.coords(rectangle,
+                (moteur.abscissePiece+abscisse)*self.largeurColonne,    # abscisse supérieure gauche
+                (moteur.ordonneePiece+ordonnee)*self.hauteurLigne,      # ordonnée supérieure gauche
+                (moteur.abscissePiece+abscisse+1)*self.largeurColonne,  # abscisse inférieure droite
+                (moteur.ordonneePiece+ordonnee+1)*self.hauteurLigne     # ordonnée inférieure droite
+            )
+            # et celui du fantôme, à la même abscisse mais à l'ordonnée de chute
+            self.coords(rectangleFantome,
+                (moteur.abscissePiece+abscisse)*self.largeurColonne,
+                (ordonneeChute+ordonnee)*self.hauteurLigne,
+                (moteur.abscissePiece+abscisse+1)*self.largeurColonne,
+                (ordonneeChute+ordonnee+1)*self.hauteurLigne
+            )
 
     def destroy(self):
-        """Déprogramme la prochaine étape avant de détruire le widget.
+        """Déprogramme la boucle et le dessin avant de détruire le widget.
            Evite un message d'erreur en quittant le jeu sans pause et en laissant Python ouvert
-           (l'étape restait programmée même après la fin du programme)."""
+           (la boucle restait programmée même après la fin du programme).
+           Attend aussi l'écriture des sauvegardes en attente, et affiche le résumé du profilage s'il est activé."""
 
-        try:
-            self.after_cancel(self.after_id)    # on annule la prochaine étape
-        except AttributeError:                  # s'il n'y avait pas de prochaine étape,
-            pass                                # ça ne change rien
+        self.annulerMinuteurs()                 # on annule le prochain tour de boucle et le prochain dessin
+        self.sauvegardeAuto.fermer()            # on termine l'écriture des sauvegardes
+        self.afficherProfil()                   # on affiche les mesures des phases, si elles sont demandées
         super().destroy()                       # on détruit le widget
 
 
@@ -552,12 +533,92 @@ class CanvasPiece(Canvas):
 
         if self.piece != None:  # s'il y a une pièce à afficher,
                                 # on dessine chaque brique de la pièce
-            for brique in self.piece.briques:       # pour chaque brique de la pièce,
-                self.create_rectangle(              # on dessine un rectangle
-                    self.abscisseDessin+brique["abscisse"]*self.largeurColonne,     # abscisse supérieure gauche
-                    self.ordonneeDessin+brique["ordonnee"]*self.hauteurLigne,       # ordonnée supérieure gauche
-                    self.abscisseDessin+(brique["abscisse"]+1)*self.largeurColonne, # abscisse inférieure droite
-                    self.ordonneeDessin+(brique["ordonnee"]+1)*self.hauteurLigne,   # ordonnée inférieure droite
+            for abscisse, ordonnee in self.piece.briques:   # pour chaque brique de la pièce,
+                self.create_rectangle(                      # on dessine un rectangle
+                    self.abscisseDessin+abscisse*self.largeurColonne,       # abscisse supérieure gauche
+                    self.ordonneeDessin+ordonnee*self.hauteurLigne,         # ordonnée supérieure gauche
+                    self.abscisseDessin+(abscisse+1)*self.largeurColonne,   # abscisse inférieure droite
+                    self.ordonneeDessin+(ordonnee+1)*self.hauteurLigne,     # ordonnée inférieure droite
                     fill=self.piece.couleur                                         # couleur du rectangle = couleur de la pièce
                 )
 
+
+
+if __name__ == "__main__":
+    # banc d'essai des deux rendus : temps moyen d'un dessin (jusqu'à l'affichage) selon la taille de la grille
+    # utilisation : python grille.py [nombre d'actions par taille]
+    # sans affichage (pas de Tk), seul le dessin de l'image en mémoire est mesuré, sans sa recopie dans la PhotoImage
+    import sys
+    from random import Random
+    from time import perf_counter
+
+    nbActions = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    try:
+        fenetre = Tk()
+    except TclError as erreur:
+        print("Pas d'affichage ({}) : seul le rendu en image est mesuré, en mémoire".format(erreur))
+        fenetre = None
+    neRienFaire = lambda *arguments: None
+    rapideParTaille = []
+    print("grille      rectangles (ms)   image (ms)")
+    for nbColonnes, nbLignes in ((10, 15), (20, 30), (40, 60), (60, 120), (100, 200), (150, 300), (200, 400)):
+        durees = []
+        for rendu in (RENDU_RECTANGLES, RENDU_IMAGE):
+            if fenetre == None:
+                if rendu == RENDU_RECTANGLES:
+                    durees.append(float("nan"))
+                    continue
+                # même image que GrilleMelobrics.preparerImage pour une grille de 600 x 900 pixels
+                moteur = MoteurMelobrics(nbColonnes, nbLignes)
+                tailleCase = min(600/nbColonnes, 900/nbLignes)
+                imageGrille = ImageRGB(int(nbColonnes*tailleCase + 0.5) + 1, int(nbLignes*tailleCase + 0.5) + 1)
+                dessinGrille = DessinGrille(imageGrille, nbColonnes, nbLignes, tailleCase)
+                dessinGrille.preparer()
+                moteur.nouvellePartie(5, False, graine=1)
+
+                def dessiner():
+                    dessinGrille.dessiner(moteur)
+                    lignes = imageGrille.prendreLignesModifiees()
+                    if lignes:
+                        imageGrille.versPPM(lignes)
+                finir = neRienFaire
+            else:
+                grille = GrilleMelobrics(fenetre, 600, 900, nbColonnes, nbLignes, neRienFaire, neRienFaire, neRienFaire, neRienFaire, neRienFaire, rendu)
+                grille.pack()
+                fenetre.update()
+                grille.nouvellePartie(5, False, graine=1)
+                fenetre.update()
+                moteur = grille.moteur
+
+                def dessiner():
+                    grille.dessiner()
+                    fenetre.update_idletasks()
+                finir = grille.destroy
+            aleatoire, duree, nbDessins = Random(1), 0, 0
+            for i in range(nbActions):
+                if moteur.terminee:
+                    break
+                # surtout des chutes, pour remplir la grille et effacer des lignes
+                moteur.etape(aleatoire.choice((ACTION_GAUCHE, ACTION_DROITE, ACTION_RETOURNER, ACTION_BAS, ACTION_CHUTE, ACTION_CHUTE)))
+                debut = perf_counter()
+                dessiner()
+                duree += perf_counter() - debut
+                nbDessins += 1
+            durees.append(1000 * duree / max(nbDessins, 1))
+            finir()
+        print("{:>4} x {:<4} {:>12.3f} {:>12.3f}".format(nbColonnes, nbLignes, *durees))
+        rapideParTaille.append(((nbColonnes, nbLignes), durees[1] < durees[0]))
+    if fenetre == None:
+        sys.exit()
+    fenetre.destroy()
+
+    # la bascule : première taille à partir de laquelle l'image est toujours plus rapide
+    bascule = None
+    for taille, imagePlusRapide in reversed(rapideParTaille):
+        if not imagePlusRapide:
+            break
+        bascule = taille
+    if bascule == None:
+        print("Le rendu en rectangles est le plus rapide pour toutes les tailles testées")
+    else:
+        print("Le rendu en image est le plus rapide à partir de {} x {}".format(*bascule))
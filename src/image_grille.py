@@ -0,0 +1,214 @@
+﻿"""Dessin de la grille dans une image en mémoire (sans Tk) : une ligne de pixels par bytearray, exportable au format PPM"""
+
+from moteur import _FORMES_PIECES, _COULEURS_PIECES     # pour la taille maximale et la palette des pièces
+
+
+# Valeurs RGB des couleurs utilisées par le dessin (celles de Tk pour les mêmes noms)
+_RGB_COULEURS = {
+    "blue": b"\x00\x00\xff",
+    "green": b"\x00\xff\x00",
+    "red": b"\xff\x00\x00",
+    "orange": b"\xff\xa5\x00",
+    "purple": b"\xa0\x20\xf0",
+    "yellow": b"\xff\xff\x00",
+    "hotpink": b"\xff\x69\xb4",
+    "grey": b"\xbe\xbe\xbe",
+    "black": b"\x00\x00\x00",
+}
+
+# Couleur du fond (celle d'un Canvas Tk par défaut)
+_RGB_FOND = b"\xd9\xd9\xd9"
+
+# Palette des pièces en RGB, dans l'ordre de _COULEURS_PIECES
+_RGB_PIECES = tuple(_RGB_COULEURS[couleur] for couleur in _COULEURS_PIECES)
+
+# Taille minimale des cases, en pixels, pour dessiner les lignes de la grille (avec les deux rendus, voir GrilleMelobrics.preparerRectangles)
+_TAILLE_CASE_MIN_LIGNES = 5
+
+
+class ImageRGB:
+    """Image RGB en mémoire : une ligne de pixels par bytearray, 3 octets par pixel.
+
+       Les lignes de pixels modifiées sont retenues (voir prendreLignesModifiees),
+       pour ne recopier à l'écran ou dans un fichier que ce qui a changé."""
+
+    def __init__(self, largeur, hauteur, fond=_RGB_FOND):
+        """Crée une image de la taille demandée (en pixels), remplie avec la couleur de fond"""
+
+        self.largeur, self.hauteur = largeur, hauteur
+        self.lignes = [bytearray(fond * largeur) for i in range(hauteur)]
+        self.ligneModifieeHaute, self.ligneModifieeBasse = 0, hauteur
+
+    def rectangle(self, x0, y0, x1, y1, remplissage=None, contour=None, epaisseur=1):
+        """Dessine le rectangle de pixels [x0, x1[ x [y0, y1[ (couleurs RGB en bytes, None pour ne pas remplir ou ne pas tracer le contour)"""
+
+        x0, y0, x1, y1 = max(x0, 0), max(y0, 0), min(x1, self.largeur), min(y1, self.hauteur)
+        if x0 >= x1 or y0 >= y1:
+            return
+        largeur = x1 - x0
+
+        # on prépare la ligne de pixels du bord (haut et bas) et celle de l'intérieur, puis on les recopie
+        if contour == None:
+            interieur = remplissage * largeur if remplissage != None else None
+            bord = interieur
+        else:
+            bord = contour * largeur
+            if remplissage != None and largeur > 2*epaisseur:
+                interieur = contour * epaisseur + remplissage * (largeur - 2*epaisseur) + contour * epaisseur
+            else:
+                interieur = None
+        for y in range(y0, y1):
+            if contour != None and (y < y0 + epaisseur or y >= y1 - epaisseur):
+                self.lignes[y][3*x0:3*x1] = bord
+            elif interieur != None:
+                self.lignes[y][3*x0:3*x1] = interieur
+            elif contour != None:                           # (contour sans remplissage : seulement les côtés)
+                ligne = self.lignes[y]
+                ligne[3*x0:3*(x0+epaisseur)] = contour * epaisseur
+                ligne[3*(x1-epaisseur):3*x1] = contour * epaisseur
+
+        self.ligneModifieeHaute = min(self.ligneModifieeHaute, y0)
+        self.ligneModifieeBasse = max(self.ligneModifieeBasse, y1)
+
+    def prendreLignesModifiees(self):
+        """Renvoie (sous forme de range) les lignes de pixels modifiées depuis le dernier appel, puis les oublie"""
+
+        lignes = range(self.ligneModifieeHaute, self.ligneModifieeBasse)
+        self.ligneModifieeHaute, self.ligneModifieeBasse = self.hauteur, 0
+        return lignes
+
+    def versPPM(self, lignes=None):
+        """Renvoie les lignes de pixels demandées (range, toute l'image par défaut) au format PPM binaire (P6)"""
+
+        if lignes == None:
+            lignes = range(self.hauteur)
+        entete = "P6\n{} {}\n255\n".format(self.largeur, len(lignes)).encode("ascii")
+        return entete + b"".join(self.lignes[lignes.start:lignes.stop])
+
+
+class DessinGrille:
+    """Dessine la grille d'un MoteurMelobrics dans une ImageRGB, avec la même disposition que GrilleMelobrics :
+       cases carrées de tailleCase pixels, lignes grises de la grille, briques entourées de noir, fantôme de la pièce.
+
+       Comme GrilleMelobrics.dessiner, seules les cases qui ont changé sont redessinées ; chaque case est dessinée
+       dans ses propres pixels, sans toucher à ses voisines.
+
+       Seule différence visible avec le rendu en rectangles : Tk trace le contour d'un rectangle sur ses bords,
+       si bien que deux briques voisines partagent une ligne noire d'un pixel ; ici, le contour d'une brique est
+       dans ses propres pixels, et deux briques voisines sont séparées par deux pixels noirs. C'est ce qui permet
+       de redessiner une case sans redessiner ses voisines."""
+
+    def __init__(self, image, nbColonnes, nbLignes, tailleCase, abscisse=0, ordonnee=0):
+        """Prépare le dessin d'une grille de taille donnée, à partir du pixel (abscisse, ordonnee) de l'image"""
+
+        self.image = image
+        self.nbColonnes, self.nbLignes = nbColonnes, nbLignes
+        # bords des cases en pixels : la colonne n va de abscisses[n] (inclus) à abscisses[n+1] (exclu)
+        self.abscisses = [abscisse + int(colonne*tailleCase + 0.5) for colonne in range(nbColonnes+1)]
+        self.ordonnees = [ordonnee + int(ligne*tailleCase + 0.5) for ligne in range(nbLignes+1)]
+        self.lignesGrille = tailleCase >= _TAILLE_CASE_MIN_LIGNES
+
+    def preparer(self):
+        """Dessine une grille vide (comme GrilleMelobrics.preparerDessin)"""
+
+        self.image.rectangle(self.abscisses[0], self.ordonnees[0], self.abscisses[-1]+1, self.ordonnees[-1]+1, _RGB_FOND, _RGB_COULEURS["grey"])
+        for ligne in range(self.nbLignes):
+            for colonne in range(self.nbColonnes):
+                self.dessinerCase(ligne, colonne, 0)
+
+        self.couleursAffichees = [bytearray(self.nbColonnes) for i in range(self.nbLignes)]
+        self.briquesAffichees = []          # cases (ligne, colonne) recouvertes par la pièce ou son fantôme au dernier dessin
+
+    def dessinerCase(self, ligne, colonne, indiceCouleur):
+        """Dessine une case de la grille : vide (indiceCouleur = 0) ou brique de couleur _COULEURS_PIECES[indiceCouleur-1],
+           entourée de noir à l'intérieur de la case (voir DessinGrille)"""
+
+        x0, x1 = self.abscisses[colonne], self.abscisses[colonne+1]
+        y0, y1 = self.ordonnees[ligne], self.ordonnees[ligne+1]
+        if indiceCouleur:
+            self.image.rectangle(x0, y0, x1, y1, _RGB_PIECES[indiceCouleur-1], _RGB_COULEURS["black"])
+            return
+        self.image.rectangle(x0, y0, x1, y1, _RGB_FOND)
+        # lignes grises en haut et à gauche de la case (toujours au bord de la grille, partout si les cases sont assez grandes)
+        if self.lignesGrille or ligne == 0:
+            self.image.rectangle(x0, y0, x1, y0+1, _RGB_COULEURS["grey"])
+        if self.lignesGrille or colonne == 0:
+            self.image.rectangle(x0, y0, x0+1, y1, _RGB_COULEURS["grey"])
+
+    def dessiner(self, moteur, lignes=None):
+        """Met à jour le dessin d'après le moteur : les cases des lignes modifiées (range, par défaut celles qu'indique
+           moteur.prendreLignesModifiees) qui ont changé, puis la pièce en déplacement et son fantôme"""
+
+        if lignes == None:
+            lignes = moteur.prendreLignesModifiees()
+
+        # on efface la pièce et le fantôme du dessin précédent, en redessinant les cases qu'ils recouvraient
+        for ligne, colonne in self.briquesAffichees:
+            self.dessinerCase(ligne, colonne, moteur.couleurs[ligne][colonne])
+        self.briquesAffichees = []
+
+        # on met à jour chaque case qui a changé
+        for ligne in lignes:
+            couleursLigne, couleursAffichees = moteur.couleurs[ligne], self.couleursAffichees[ligne]
+            if couleursLigne == couleursAffichees:
+                continue
+            for colonne in range(self.nbColonnes):
+                indiceCouleur = couleursLigne[colonne]
+                if indiceCouleur != couleursAffichees[colonne]:
+                    self.dessinerCase(ligne, colonne, indiceCouleur)
+                    couleursAffichees[colonne] = indiceCouleur
+
+        # puis on dessine le fantôme (contour de la pièce là où elle tomberait) et la pièce par-dessus
+        piece = moteur.piece
+        if piece == None:
+            return
+        couleur = _RGB_PIECES[piece.indiceCouleur]
+        ordonneeChute = moteur.ordonneeChute()
+        for abscisse, ordonnee in piece.briques:
+            colonne, ligne = moteur.abscissePiece + abscisse, ordonneeChute + ordonnee
+            self.image.rectangle(self.abscisses[colonne], self.ordonnees[ligne], self.abscisses[colonne+1], self.ordonnees[ligne+1], None, couleur, 2)
+            self.briquesAffichees.append((ligne, colonne))
+        for abscisse, ordonnee in piece.briques:
+            colonne, ligne = moteur.abscissePiece + abscisse, moteur.ordonneePiece + ordonnee
+            self.dessinerCase(ligne, colonne, piece.indiceCouleur + 1)
+            self.briquesAffichees.append((ligne, colonne))
+
+
+class DessinPiece:
+    """Dessine une pièce seule dans un cadre de l'image, avec la même disposition que CanvasPiece :
+       bordure noire, cases dimensionnées pour la plus grande pièce, pièce centrée"""
+
+    def __init__(self, image, largeur, hauteur, abscisse=0, ordonnee=0):
+        """Prépare le dessin d'un cadre de largeur x hauteur pixels, à partir du pixel (abscisse, ordonnee) de l'image"""
+
+        self.image = image
+        self.largeur, self.hauteur = largeur, hauteur
+        self.abscisse, self.ordonnee = abscisse, ordonnee
+
+        # taille des cases, calculée comme dans CanvasPiece d'après la taille maximale d'une pièce
+        nbColonnes = max(brique["abscisse"] for forme in _FORMES_PIECES for brique in forme) + 1
+        nbLignes = max(brique["ordonnee"] for forme in _FORMES_PIECES for brique in forme) + 1
+        self.largeurColonne = (largeur-2) // nbColonnes
+        self.hauteurLigne = (hauteur-2) // nbLignes
+
+        self.pieceAffichee = False      # pièce (forme, rotation, couleur) dessinée, None pour aucune, False avant le premier dessin
+
+    def dessiner(self, piece):
+        """Dessine la pièce (ou un cadre vide si piece vaut None) ; ne fait rien si c'est déjà la pièce affichée"""
+
+        pieceAffichee = None if piece == None else (piece.forme, piece.rotation, piece.indiceCouleur)
+        if pieceAffichee == self.pieceAffichee:
+            return
+        self.pieceAffichee = pieceAffichee
+
+        self.image.rectangle(self.abscisse, self.ordonnee, self.abscisse+self.largeur, self.ordonnee+self.hauteur, _RGB_FOND, _RGB_COULEURS["black"])
+        if piece == None:
+            return
+        abscisseDessin = self.abscisse + int((self.largeur - self.largeurColonne*piece.largeur)/2) + 2
+        ordonneeDessin = self.ordonnee + int((self.hauteur - self.hauteurLigne*piece.hauteur)/2) + 2
+        for abscisse, ordonnee in piece.briques:
+            self.image.rectangle(
+                abscisseDessin + abscisse*self.largeurColonne, ordonneeDessin + ordonnee*self.hauteurLigne,
+                abscisseDessin + (abscisse+1)*self.largeurColonne + 1, ordonneeDessin + (ordonnee+1)*self.hauteurLigne + 1,
+                _RGB_PIECES[piece.indiceCouleur], _RGB_COULEURS["black"]
+            )
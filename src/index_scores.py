@@ -0,0 +1,76 @@
+﻿"""Index des meilleurs scores : scores triés par difficulté, meilleur score de chaque joueur, rangs et centiles"""
+
+from bisect import bisect_left, insort  # pour insérer et chercher dans les listes triées
+
+
+class IndexScores:
+    """Scores rangés par difficulté, toujours triés.
+
+       Pour chaque difficulté, les scores sont gardés dans une liste croissante de couples (score, pseudo) :
+       ajouter un score, trouver un rang ou un centile se fait par dichotomie, sans parcourir la liste.
+       Le meilleur score de chaque joueur est aussi gardé, pour chaque difficulté."""
+
+    def __init__(self, difficulteMax):
+        """Crée un index vide pour les difficultés de 1 à difficulteMax"""
+
+        self.difficulteMax = difficulteMax
+        self.scores = [[] for i in range(difficulteMax)]            # pour chaque difficulté, couples (score, pseudo) croissants
+        self.meilleursScores = [{} for i in range(difficulteMax)]   # pour chaque difficulté, pseudo -> meilleur score
+
+    def ajouter(self, pseudo, score, difficulte):
+        """Ajoute un score à l'index"""
+
+        insort(self.scores[difficulte-1], (score, pseudo))
+        meilleursScores = self.meilleursScores[difficulte-1]
+        if score > meilleursScores.get(pseudo, -1):
+            meilleursScores[pseudo] = score
+
+    def charger(self, scores):
+        """Ajoute d'un coup des scores (pseudo, score, difficulté), en ne triant qu'une fois à la fin.
+           Les scores de difficulté inconnue sont ignorés."""
+
+        for pseudo, score, difficulte in scores:
+            if 1 <= difficulte <= self.difficulteMax:
+                self.scores[difficulte-1].append((score, pseudo))
+
+        for difficulte, scores in enumerate(self.scores):
+            scores.sort()
+            # les scores étant croissants, le dernier score de chaque joueur est son meilleur
+            self.meilleursScores[difficulte].update((pseudo, score) for score, pseudo in scores)
+
+    def nbScores(self, difficulte):
+        """Renvoie le nombre de scores enregistrés pour la difficulté"""
+
+        return len(self.scores[difficulte-1])
+
+    def meilleurs(self, difficulte, nombre=None, debut=0):
+        """Renvoie la liste des couples (score, pseudo) de la difficulté, du meilleur au moins bon,
+           en commençant au rang debut+1, et en s'arrêtant après `nombre` scores (tous si nombre=None)"""
+
+        scores = self.scores[difficulte-1]
+        fin = len(scores) - debut                                       # indice (exclu) du score de rang debut+1
+        if nombre == None:
+            return scores[fin-1::-1] if fin > 0 else []
+        return scores[max(fin-nombre, 0):max(fin, 0)][::-1]
+
+    def rang(self, score, difficulte):
+        """Renvoie le rang qu'a (ou qu'aurait) le score dans la difficulté : 1 + le nombre de scores strictement meilleurs"""
+
+        scores = self.scores[difficulte-1]
+        return len(scores) - bisect_left(scores, (score+1,)) + 1        # (score+1,) se place avant tous les couples de score > score
+
+    def rangJoueur(self, pseudo, difficulte):
+        """Renvoie le rang du meilleur score du joueur dans la difficulté, ou None s'il n'a pas de score"""
+
+        score = self.meilleursScores[difficulte-1].get(pseudo)
+        if score == None:
+            return None
+        return self.rang(score, difficulte)
+
+    def centile(self, score, difficulte):
+        """Renvoie le pourcentage de scores de la difficulté strictement moins bons que le score"""
+
+        scores = self.scores[difficulte-1]
+        if not scores:
+            return 100.0
+        return 100 * bisect_left(scores, (score,)) / len(scores)    # (score,) se place avant tous les couples de score >= score
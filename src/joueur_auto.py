@@ -0,0 +1,312 @@
+﻿"""Joueur automatique : cherche le meilleur placement de chaque pièce, en tenant compte de la prochaine pièce.
+   Sert aux tournois et aux tests d'endurance (voir tournoi.py), et peut donner un conseil au joueur (voir meilleurPlacement)."""
+
+import sys                  # pour les arguments de la ligne de commande
+import time                 # pour mesurer le temps de décision
+
+from moteur import *
+from moteur import _ROTATIONS_PIECES    # pour la géométrie des pièces
+
+
+# Poids de chaque critère dans l'évaluation d'une grille (une valeur plus grande est meilleure)
+_POIDS_HAUTEUR = -0.51      # somme des hauteurs des colonnes
+_POIDS_LIGNES = 0.76        # lignes effacées par la pièce
+_POIDS_TROUS = -0.36        # cases vides sous une brique
+_POIDS_BOSSES = -0.18       # somme des différences de hauteur entre colonnes voisines
+
+# Nombre de placements de la pièce en mouvement examinés avec la prochaine pièce (les meilleurs d'après la grille obtenue)
+_LARGEUR_RECHERCHE = 4
+
+# Nombre maximal de grilles gardées dans le cache des évaluations (vidé quand il est plein)
+_TAILLE_CACHE_MAX = 200000
+
+# Valeur d'un placement qui fait perdre la partie
+_VALEUR_DEFAITE = float("-inf")
+
+
+def _obstacle(lignes, nbLignes, lignePleine, masques, abscisse, ordonnee):
+    """Comme MoteurMelobrics.obstacle, mais pour une grille quelconque (lignes : un entier par ligne)"""
+
+    if abscisse < 0 or ordonnee < 0 or ordonnee + len(masques) > nbLignes:
+        return True
+    for rang, masque in enumerate(masques):
+        masque <<= abscisse
+        if masque > lignePleine or lignes[ordonnee+rang] & masque:
+            return True
+    return False
+
+
+def _sommets(lignes, nbColonnes, lignePleine):
+    """Comme MoteurMelobrics.calculerSommets : la ligne de la brique la plus haute de chaque colonne (nombre de lignes si elle est vide)"""
+
+    sommets = [len(lignes)] * nbColonnes
+    colonnesRestantes = lignePleine
+    for numero, ligne in enumerate(lignes):
+        trouvees = ligne & colonnesRestantes
+        colonnesRestantes ^= trouvees
+        while trouvees:
+            bit = trouvees & -trouvees
+            sommets[bit.bit_length()-1] = numero
+            trouvees ^= bit
+        if not colonnesRestantes:
+            break
+    return sommets
+
+
+def _geometrieChute(etat):
+    """Renvoie les constantes d'un état de rotation qui servent à évaluer une pièce tombée sur le sommet de ses colonnes
+       (voir JoueurAuto.evaluerChute) : (bas des colonnes + 1, somme des hauts des colonnes, somme des bas des colonnes
+       moins les trous entre les briques d'une même colonne, différences de hauteur entre colonnes voisines de la pièce)"""
+
+    trousInternes = sum(bas - haut + 1 for haut, bas in zip(etat.hautsColonnes, etat.basColonnes)) - len(etat.briques)
+    return (tuple(bas + 1 for bas in etat.basColonnes), sum(etat.hautsColonnes), sum(etat.basColonnes) - trousInternes,
+            sum(abs(haut - voisin) for haut, voisin in zip(etat.hautsColonnes, etat.hautsColonnes[1:])))
+
+
+# Constantes de chaque état de rotation de chaque forme (voir _geometrieChute) : _GEOMETRIES_CHUTE[forme][rotation]
+_GEOMETRIES_CHUTE = tuple(tuple(_geometrieChute(etat) for etat in rotations) for rotations in _ROTATIONS_PIECES)
+
+# Nombre maximal de briques d'une pièce sur une même ligne : une ligne moins remplie que ça ne peut pas être complétée par une pièce
+_LARGEUR_PIECES_MAX = max(masque.bit_count() for rotations in _ROTATIONS_PIECES for etat in rotations for masque in etat.masques)
+
+
+class JoueurAuto:
+    """Joueur automatique pour les tournois (même interface que tournoi.JoueurAleatoire).
+
+       Pour chaque nouvelle pièce, il essaie toutes les rotations (avec les décalages de MoteurMelobrics.retournerPiece)
+       puis toutes les colonnes atteignables, fait tomber la pièce, et évalue la grille obtenue (hauteur, trous, bosses,
+       lignes effacées). Les _LARGEUR_RECHERCHE meilleurs placements sont départagés par le meilleur placement de la
+       prochaine pièce.
+
+       Les évaluations des grilles sont gardées dans un cache indexé par la grille (tuple de ses lignes), de même que
+       le meilleur placement d'une forme dans une grille : une grille déjà vue, à la pièce précédente ou comme placement
+       d'une autre pièce, n'est pas réévaluée. La plupart des placements s'évaluent d'ailleurs sans construire la grille
+       obtenue, en corrigeant l'évaluation de la grille de départ (voir evaluerChute)."""
+
+    def __init__(self, graine=None):
+        """Crée le joueur (la graine est ignorée : le joueur est déterministe)"""
+
+        self.evaluations = {}           # grille -> (valeur, hauteur, trous, bosses) de la grille (voir evaluer)
+        self.meilleursSuivants = {}     # (grille, forme) -> meilleure valeur d'un placement de la forme dans la grille
+        self.nbEvaluations = 0          # nombre de grilles réellement évaluées (hors cache)
+        self.nbColonnes = self.nbLignes = None
+
+    def actions(self, moteur):
+        """Renvoie les actions qui placent la pièce en mouvement au meilleur endroit puis la font tomber"""
+
+        placement = self.meilleurPlacement(moteur)
+        return [] if placement == None else placement[3]
+
+    def meilleurPlacement(self, moteur):
+        """Renvoie le meilleur placement de la pièce en mouvement : (rotation, abscisse, ordonnée où elle se fixe, actions pour l'y amener),
+           ou None s'il n'y a pas de pièce en mouvement"""
+
+        piece = moteur.piece
+        if moteur.terminee or piece == None:
+            return None
+        if (moteur.nbColonnes, moteur.nbLignes) != (self.nbColonnes, self.nbLignes):     # (les caches ne valent que pour une taille de grille)
+            self.nbColonnes, self.nbLignes, self.lignePleine = moteur.nbColonnes, moteur.nbLignes, moteur.lignePleine
+            self.evaluations.clear()
+            self.meilleursSuivants.clear()
+
+        # on évalue chaque placement d'après la grille obtenue...
+        grille = tuple(moteur.lignes)       # (les grilles sont des tuples de lignes, qui servent directement de clés aux caches)
+        preparation = self.preparer(grille, moteur.sommets)
+        candidats = []
+        for rotation, abscisse, nbRotations, deplacement in self.placements(grille, piece.forme, piece.rotation, moteur.abscissePiece, moteur.ordonneePiece):
+            ordonnee, valeur = self.evaluerChute(grille, preparation, piece.forme, rotation, abscisse, moteur.ordonneePiece)
+            candidats.append((valeur, (rotation, abscisse, ordonnee, nbRotations, deplacement)))
+
+        # ... puis on départage les meilleurs par le meilleur placement de la prochaine pièce
+        candidats.sort(key=lambda candidat: candidat[0], reverse=True)
+        meilleur, meilleureValeur = candidats[0][1], _VALEUR_DEFAITE
+        for valeur, placement in candidats[:_LARGEUR_RECHERCHE]:
+            lignes, nbEffacees = self.poser(grille, piece.forme, *placement[:3])
+            valeur = _POIDS_LIGNES*nbEffacees + self.meilleurSuivant(lignes, moteur.prochainePiece.forme)
+            if valeur > meilleureValeur:
+                meilleur, meilleureValeur = placement, valeur
+
+        rotation, abscisse, ordonnee, nbRotations, deplacement = meilleur
+        actions = [ACTION_RETOURNER]*nbRotations + [ACTION_DROITE if deplacement > 0 else ACTION_GAUCHE]*abs(deplacement) + [ACTION_CHUTE]
+        return rotation, abscisse, ordonnee, actions
+
+    def meilleurSuivant(self, lignes, forme):
+        """Renvoie la meilleure valeur d'un placement d'une pièce de la forme donnée, insérée dans la grille comme le fait
+           MoteurMelobrics.mouvementBas (_VALEUR_DEFAITE si elle ne peut pas être insérée)"""
+
+        cle = (lignes, forme)
+        valeur = self.meilleursSuivants.get(cle)
+        if valeur != None:
+            return valeur
+
+        abscisse = self.nbColonnes//2 - _ROTATIONS_PIECES[forme][0].largeur//2
+        valeur = _VALEUR_DEFAITE
+        if not _obstacle(lignes, self.nbLignes, self.lignePleine, _ROTATIONS_PIECES[forme][0].masques, abscisse, 0):
+            preparation = self.preparer(lignes, _sommets(lignes, self.nbColonnes, self.lignePleine))
+            for rotation, abscisseFinale, nbRotations, deplacement in self.placements(lignes, forme, 0, abscisse, 0):
+                valeur = max(valeur, self.evaluerChute(lignes, preparation, forme, rotation, abscisseFinale, 0)[1])
+
+        if len(self.meilleursSuivants) >= _TAILLE_CACHE_MAX:
+            self.meilleursSuivants.clear()
+        self.meilleursSuivants[cle] = valeur
+        return valeur
+
+    def placements(self, lignes, forme, rotation, abscisse, ordonnee):
+        """Renvoie les placements atteignables depuis la position donnée, comme le ferait un joueur : tourner la pièce sur place
+           (avec les décalages de MoteurMelobrics.retournerPiece), puis la déplacer sur le côté tant que la place est libre,
+           avant de la faire tomber. Chaque placement est (rotation, abscisse, nombre de rotations, déplacement horizontal
+           après les rotations) ; les rotations qui donnent la même forme ne sont essayées qu'une fois."""
+
+        nbLignes, lignePleine = self.nbLignes, self.lignePleine
+        rotations = _ROTATIONS_PIECES[forme]
+        masquesVus = set()
+        for nbRotations in range(4):
+            etat = rotations[rotation]
+            if etat.masques not in masquesVus:
+                masquesVus.add(etat.masques)
+                # on déplace la pièce vers la gauche puis vers la droite, tant que la place est libre
+                gauche = abscisse
+                while not _obstacle(lignes, nbLignes, lignePleine, etat.masques, gauche-1, ordonnee):
+                    gauche -= 1
+                droite = abscisse
+                while not _obstacle(lignes, nbLignes, lignePleine, etat.masques, droite+1, ordonnee):
+                    droite += 1
+                for abscisseFinale in range(gauche, droite+1):
+                    yield rotation, abscisseFinale, nbRotations, abscisseFinale - abscisse
+
+            # puis on tourne la pièce, comme MoteurMelobrics.retournerPiece
+            rotationSuivante = (rotation + 1) % 4
+            masquesSuivants = rotations[rotationSuivante].masques
+            ordonneeSuivante = ordonnee + etat.decalageOrdonnee
+            for decalage in etat.decalagesAbscisse:
+                if not _obstacle(lignes, nbLignes, lignePleine, masquesSuivants, abscisse + decalage, ordonneeSuivante):
+                    rotation, abscisse, ordonnee = rotationSuivante, abscisse + decalage, ordonneeSuivante
+                    break
+            else:
+                return      # la pièce ne peut plus tourner
+
+    def preparer(self, lignes, sommets):
+        """Renvoie ce qui sert à évaluer rapidement les placements dans une grille (voir evaluerChute) :
+           (évaluation de la grille, sommets des colonnes, sommes cumulées des différences de hauteur entre colonnes voisines,
+           masque des lignes assez remplies pour qu'une pièce puisse les compléter)"""
+
+        ecartsCumules = [0]
+        for colonne in range(self.nbColonnes-1):
+            ecartsCumules.append(ecartsCumules[-1] + abs(sommets[colonne] - sommets[colonne+1]))
+        lignesPresquePleines = 0
+        for numero in range(min(sommets), self.nbLignes):
+            if lignes[numero].bit_count() >= self.nbColonnes - _LARGEUR_PIECES_MAX:
+                lignesPresquePleines |= 1 << numero
+        return self.evaluer(lignes), sommets, ecartsCumules, lignesPresquePleines
+
+    def evaluerChute(self, lignes, preparation, forme, rotation, abscisse, ordonnee):
+        """Fait tomber la pièce depuis la position donnée ; renvoie l'ordonnée où elle se fixe et la valeur de la grille obtenue
+           (lignes effacées comprises).
+
+           Dans le cas courant, la pièce tombe sur le sommet de ses colonnes sans effacer de ligne : seules ses colonnes changent,
+           et on corrige l'évaluation de la grille de départ (hauteur, trous et bosses) sans construire la nouvelle grille.
+           Sinon (pièce glissée sous une brique en surplomb, ou lignes effacées), on construit la grille et on l'évalue (voir evaluer)."""
+
+        (valeur, hauteur, trous, bosses), sommets, ecartsCumules, lignesPresquePleines = preparation
+        etat = _ROTATIONS_PIECES[forme][rotation]
+        basPlusUn, sommeHauts, sommeBas, bossesPiece = _GEOMETRIES_CHUTE[forme][rotation]
+        largeur, fin = etat.largeur, abscisse + etat.largeur
+        sommetsPiece = sommets[abscisse:fin]
+
+        # la pièce s'arrête au premier sommet qu'elle rencontre, sauf si elle est déjà sous le sommet d'une de ses colonnes
+        ordonneeChute = min(map(int.__sub__, sommetsPiece, basPlusUn))
+        if ordonneeChute < ordonnee:
+            ordonneeChute = ordonnee
+            while not _obstacle(lignes, self.nbLignes, self.lignePleine, etat.masques, abscisse, ordonneeChute+1):
+                ordonneeChute += 1
+        elif not (lignesPresquePleines >> ordonneeChute) & ((1 << etat.hauteur) - 1):
+            # chaque colonne de la pièce a pour nouveau sommet le haut de la pièce, et gagne les cases vides sous la pièce comme trous
+            somme = sum(sommetsPiece)
+            hauteur += somme - largeur*ordonneeChute - sommeHauts
+            trous += somme - largeur*(ordonneeChute+1) - sommeBas
+            bosses += bossesPiece - (ecartsCumules[fin-1] - ecartsCumules[abscisse])
+            if abscisse > 0:
+                bosses += abs(sommets[abscisse-1] - ordonneeChute - etat.hautsColonnes[0]) - (ecartsCumules[abscisse] - ecartsCumules[abscisse-1])
+            if fin < self.nbColonnes:
+                bosses += abs(sommets[fin] - ordonneeChute - etat.hautsColonnes[-1]) - (ecartsCumules[fin] - ecartsCumules[fin-1])
+            return ordonneeChute, _POIDS_HAUTEUR*hauteur + _POIDS_TROUS*trous + _POIDS_BOSSES*bosses
+
+        lignes, nbEffacees = self.poser(lignes, forme, rotation, abscisse, ordonneeChute)
+        return ordonneeChute, self.evaluer(lignes)[0] + _POIDS_LIGNES*nbEffacees
+
+    def poser(self, lignes, forme, rotation, abscisse, ordonnee):
+        """Renvoie la grille (tuple des lignes) obtenue en fixant la pièce puis en effaçant les lignes pleines,
+           et le nombre de lignes effacées"""
+
+        lignePleine = self.lignePleine
+        masques = _ROTATIONS_PIECES[forme][rotation].masques
+        rangees = tuple(ligne | (masque << abscisse) for ligne, masque in zip(lignes[ordonnee:ordonnee+len(masques)], masques))
+        lignes = lignes[:ordonnee] + rangees + lignes[ordonnee+len(masques):]
+        nbEffacees = rangees.count(lignePleine)
+        if nbEffacees:
+            lignes = (0,)*nbEffacees + tuple(ligne for ligne in lignes if ligne != lignePleine)
+        return lignes, nbEffacees
+
+    def evaluer(self, lignes):
+        """Évalue une grille (sans pièce en mouvement) : renvoie (valeur, hauteur, trous, bosses), où
+           - hauteur est la somme des hauteurs des colonnes,
+           - trous est le nombre de cases vides sous une brique,
+           - bosses est la somme des différences de hauteur entre colonnes voisines.
+
+           Tout se calcule en une passe sur les lignes, de haut en bas, avec le masque des colonnes déjà couvertes par une brique :
+           - un trou est une case vide d'une colonne couverte,
+           - une colonne couverte à partir de la ligne n a une hauteur de nbLignes-n,
+           - la différence de hauteur entre deux colonnes voisines est le nombre de lignes où une seule des deux est couverte.
+           Les deux derniers ne changent que sur les lignes où de nouvelles colonnes sont couvertes (le haut de la pile)."""
+
+        evaluation = self.evaluations.get(lignes)
+        if evaluation != None:
+            return evaluation
+
+        masqueVoisines = self.lignePleine >> 1     # (colonnes qui ont une voisine à droite)
+        couvertes = hauteur = trous = bosses = voisinesDifferentes = 0
+        lignesRestantes = self.nbLignes
+        for ligne in lignes:
+            nouvelles = ligne & ~couvertes
+            if nouvelles:                           # si de nouvelles colonnes sont couvertes,
+                trous += (couvertes & ~ligne).bit_count()
+                hauteur += nouvelles.bit_count() * lignesRestantes
+                couvertes |= ligne
+                differentes = ((couvertes ^ (couvertes >> 1)) & masqueVoisines).bit_count()
+                bosses += (differentes - voisinesDifferentes) * lignesRestantes
+                voisinesDifferentes = differentes
+            elif couvertes:
+                trous += (couvertes & ~ligne).bit_count()
+            lignesRestantes -= 1
+        evaluation = (_POIDS_HAUTEUR*hauteur + _POIDS_TROUS*trous + _POIDS_BOSSES*bosses, hauteur, trous, bosses)
+
+        if len(self.evaluations) >= _TAILLE_CACHE_MAX:
+            self.evaluations.clear()
+        self.evaluations[lignes] = evaluation
+        self.nbEvaluations += 1
+        return evaluation
+
+
+if __name__ == "__main__":
+    # utilisation : python joueur_auto.py [nombre de parties] [difficulté]
+    # mesure le temps de décision par pièce et le score du joueur automatique (parties limitées à _NB_PIECES_MAX pièces)
+    _NB_PIECES_MAX = 2000
+    nbParties = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    difficulte = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    for graine in range(nbParties):
+        joueur = JoueurAuto()
+        moteur = MoteurMelobrics(10, 15)
+        moteur.nouvellePartie(difficulte, False, graine)
+        moteur.etape(ACTION_BAS)
+        duree, nbPieces = 0, 0
+        while not moteur.terminee and nbPieces < _NB_PIECES_MAX:
+            debut = time.perf_counter()
+            actions = joueur.actions(moteur)
+            duree += time.perf_counter() - debut
+            nbPieces += 1
+            for action in actions:
+                moteur.etape(action)
+            moteur.etape(ACTION_BAS)
+        print("graine {} : {} pièces, score {}{}, {:.3f} ms par pièce, {:.1f} évaluations par pièce".format(
+            graine, nbPieces, moteur.score, " (perdu)" if moteur.terminee else "", 1000*duree/nbPieces, joueur.nbEvaluations/nbPieces))
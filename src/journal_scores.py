@@ -0,0 +1,147 @@
+﻿"""Fichier des scores en ajout seul : chaque score est écrit dès qu'il est ajouté, le fichier est compacté en arrière-plan"""
+
+import os                   # pour les opérations sur les fichiers
+import threading            # pour le compactage en arrière-plan
+
+
+# En-tête écrit au début du fichier des scores
+_ENTETE_SCORES = "Fichier des scores. Format : \"<pseudo>:<score>:<difficulté>\".\nAttention, les lignes ne respectant pas ce format seront ignorées lors de la lecture et disparaîtront lors de la réécriture du fichier.\n\n"
+
+# Format d'une ligne du fichier des scores (pseudo, score, difficulté)
+_FORMAT_LIGNE_SCORE = "{}:{}:{}\n"
+
+# Le fichier est vérifié en arrière-plan toutes les _PERIODE_COMPACTAGE secondes, et compacté (voir JournalScores.aCompacter) :
+# - s'il contient des lignes obsolètes (lignes invalides, ignorées à la lecture),
+# - ou si sa taille a été multipliée par _FACTEUR_CROISSANCE depuis l'ouverture ou le dernier compactage (avec au moins
+#   _CROISSANCE_MIN octets ajoutés) : les scores ajoutés à la fin sont alors regroupés par difficulté ; comme la taille
+#   doit doubler entre deux compactages, chaque score ajouté ne coûte en moyenne qu'une réécriture de taille constante
+_PERIODE_COMPACTAGE = 60
+_FACTEUR_CROISSANCE = 2
+_CROISSANCE_MIN = 64 * 1024
+
+
+def ligneScore(pseudo, score, difficulte):
+    """Renvoie la ligne du fichier des scores d'un score (voir _FORMAT_LIGNE_SCORE)"""
+
+    return _FORMAT_LIGNE_SCORE.format(pseudo, score, difficulte)
+
+
+def _lireLigne(ligne):
+    """Renvoie le score (pseudo, score, difficulté) d'une ligne du fichier, ou None si elle ne respecte pas le format"""
+
+    score = ligne.rstrip("\n").split(":")                                       # on sépare la ligne selon le format des scores (pseudo:score:difficulté),
+    if len(score) != 3 or not score[1].isdigit() or not score[2].isdigit():     # s'il n'y a pas trois parties séparées par ':' ou si score ou difficulté n'est pas un nombre,
+        return None                                                             # on ignore la ligne.
+    return score[0], int(score[1]), int(score[2])
+
+
+class JournalScores:
+    """Fichier des scores, dans lequel on ne fait qu'ajouter des lignes "<pseudo>:<score>:<difficulté>".
+
+       Chaque score ajouté coûte l'écriture d'une ligne : rien n'est perdu si le jeu s'arrête brutalement,
+       et il n'y a rien à réécrire en quittant. Le fichier est réécrit (compacté) par un thread quand il contient
+       des lignes invalides ou qu'il a doublé de taille, pour supprimer les lignes invalides et regrouper les scores
+       par difficulté ; la réécriture passe par un fichier
+       temporaire renommé ensuite, le fichier des scores est donc toujours complet."""
+
+    def __init__(self, chemin):
+        """Ouvre (ou crée) le fichier des scores et démarre le compactage en arrière-plan"""
+
+        self.chemin = chemin
+        self.verrou = threading.Lock()      # protège le fichier pendant le remplacement par la version compactée
+        self.fichier = open(chemin, "a", encoding="utf-8")
+        if self.fichier.tell() == 0:        # si le fichier vient d'être créé,
+            self.fichier.write(_ENTETE_SCORES)  # on écrit l'en-tête
+            self.fichier.flush()
+        self.nbLignesObsoletes = 0          # nombre de lignes invalides trouvées par lire depuis le dernier compactage
+        self.tailleCompactee = self.fichier.tell()  # taille du fichier à l'ouverture ou au dernier compactage
+
+        # le thread de compactage s'arrête quand arret est activé (voir fermer)
+        self.arret = threading.Event()
+        self.threadCompactage = threading.Thread(target=self.boucleCompactage, daemon=True)
+        self.threadCompactage.start()
+
+    def lire(self):
+        """Renvoie (au fur et à mesure) chaque score valide du fichier : (pseudo, score, difficulté)"""
+
+        nbLignesInvalides = 0
+        with open(self.chemin, encoding="utf-8") as fichier:
+            for ligne in fichier:                       # Pour chaque ligne du fichier,
+                score = _lireLigne(ligne)
+                if score == None:                       # si elle est invalide, il faudra la supprimer du fichier,
+                    nbLignesInvalides += 1
+                else:                                   # sinon, on renvoie le score.
+                    yield score
+        # (les lignes de l'en-tête ne sont pas des lignes à supprimer)
+        with self.verrou:
+            self.nbLignesObsoletes += max(nbLignesInvalides - _ENTETE_SCORES.count("\n"), 0)
+
+    def ajouter(self, pseudo, score, difficulte):
+        """Ajoute un score à la fin du fichier, et l'écrit immédiatement sur le disque"""
+
+        with self.verrou:
+            self.fichier.write(ligneScore(pseudo, score, difficulte))
+            self.fichier.flush()
+
+    def compacter(self):
+        """Réécrit le fichier : en-tête, puis scores valides regroupés par difficulté, du meilleur au moins bon.
+           Les scores ajoutés pendant la réécriture sont recopiés à la fin avant le remplacement du fichier."""
+
+        # on note où s'arrête le fichier, puis on lit les scores valides sans bloquer les ajouts
+        with self.verrou:
+            if self.fichier.closed:
+                return
+            taille = self.fichier.tell()
+            self.nbLignesObsoletes = 0
+        with open(self.chemin, "rb") as fichier:
+            lignes = fichier.read(taille).decode("utf-8").splitlines(True)
+        scores = [score for score in map(_lireLigne, lignes) if score != None]
+        scores.sort(key=lambda score: (score[2], -score[1]))
+
+        # on écrit la version compactée dans un fichier temporaire
+        cheminTemporaire = self.chemin + ".tmp"
+        with open(cheminTemporaire, "w", encoding="utf-8") as fichier:
+            fichier.write(_ENTETE_SCORES)
+            fichier.writelines(ligneScore(*score) for score in scores)
+
+            # puis, sans laisser ajouter de score, on recopie ce qui a été ajouté entre temps et on remplace le fichier
+            with self.verrou:
+                if self.fichier.closed:
+                    fichier.close()
+                    os.remove(cheminTemporaire)
+                    return
+                with open(self.chemin, "rb") as fichierActuel:
+                    fichierActuel.seek(taille)
+                    fichier.write(fichierActuel.read().decode("utf-8"))
+                fichier.flush()
+                os.fsync(fichier.fileno())
+                fichier.close()
+                self.fichier.close()
+                os.replace(cheminTemporaire, self.chemin)
+                self.fichier = open(self.chemin, "a", encoding="utf-8")
+                self.tailleCompactee = self.fichier.tell()
+
+    def aCompacter(self):
+        """Indique si le fichier a besoin d'être compacté : s'il contient des lignes obsolètes, ou s'il a assez grossi
+           depuis le dernier compactage (voir _FACTEUR_CROISSANCE)"""
+
+        with self.verrou:
+            if self.fichier.closed:
+                return False
+            taille = self.fichier.tell()
+            return self.nbLignesObsoletes > 0 or (taille >= _FACTEUR_CROISSANCE * self.tailleCompactee
+                                                  and taille - self.tailleCompactee >= _CROISSANCE_MIN)
+
+    def boucleCompactage(self):
+        """Compacte le fichier toutes les _PERIODE_COMPACTAGE secondes s'il en a besoin (voir aCompacter), jusqu'à l'appel de fermer"""
+
+        while not self.arret.wait(_PERIODE_COMPACTAGE):
+            if self.aCompacter():
+                self.compacter()
+
+    def fermer(self):
+        """Arrête le compactage et ferme le fichier ; rien n'est réécrit, chaque score est déjà sur le disque"""
+
+        self.arret.set()
+        with self.verrou:
+            self.fichier.close()
@@ -1,6 +1,17 @@
 ﻿"""Crée la fenêtre du Mélobrics et lance le jeu"""
 
+import argparse             # pour les options de la ligne de commande
+
 from fenetre_principale import FenetrePrincipale
+from grille import RENDU_RECTANGLES, RENDU_IMAGE
+
+# utilisation : python lancer_jeu.py [--rendu rectangles|image] [--profil] (voir GrilleMelobrics pour le rendu et le profilage)
+analyseur = argparse.ArgumentParser(description="Mélobrics")
+analyseur.add_argument("--rendu", choices=(RENDU_RECTANGLES, RENDU_IMAGE), default=RENDU_RECTANGLES,
+                       help="façon de dessiner la grille ({} par défaut ; voir les mesures de {} dans grille.py)".format(RENDU_RECTANGLES, RENDU_IMAGE))
+analyseur.add_argument("--profil", action="store_true",
+                       help="mesurer la durée de chaque phase des ticks, affichée en quittant ou avec la touche F12")
+options = analyseur.parse_args()
 
-fenetre = FenetrePrincipale()
+fenetre = FenetrePrincipale(options.rendu, options.profil)
 fenetre.mainloop()
@@ -0,0 +1,800 @@
+﻿"""Moteur du jeu, sans interface graphique : règles, score et conditions de fin de partie.
+   Permet de simuler des parties sans Tk, aussi vite que le processeur le permet."""
+
+from random import Random, getrandbits  # pour tirer les pièces à partir d'une graine
+from collections import namedtuple, deque   # pour les états de rotation précalculés et l'historique des instantanés
+from itertools import chain             # pour remettre bout à bout les blocs de lignes des instantanés
+
+
+# Actions transmises au moteur par MoteurMelobrics.etape
+ACTION_BAS = 0          # descendre la pièce d'un rang (et faire avancer le jeu)
+ACTION_GAUCHE = 1       # déplacer la pièce d'un rang vers la gauche
+ACTION_DROITE = 2       # déplacer la pièce d'un rang vers la droite
+ACTION_RETOURNER = 3    # tourner la pièce de 90° vers la droite
+ACTION_CHUTE = 4        # faire tomber la pièce d'un coup jusqu'en bas et la fixer
+
+# Modes de tirage des pièces (voir GenerateurPieces)
+MODE_ALEATOIRE = 0      # chaque forme est tirée au hasard
+MODE_SAC = 1            # les formes sont tirées par sacs de sept, chaque sac contenant une fois chaque forme
+
+_PAS_SCORE = 100   # gain de score à chaque ligne détruite
+
+_TAILLE_LOT_PIECES = 64     # nombre de pièces générées d'un coup par GenerateurPieces
+
+_CAPACITE_HISTORIQUE = 256  # nombre d'instantanés gardés par défaut par HistoriquePartie
+
+_TAILLE_BLOC_LIGNES = 16    # nombre de lignes de la grille par bloc des instantanés (voir MoteurMelobrics.instantane)
+
+
+# Liste des formes de pièces possibles
+_FORMES_PIECES = (
+    # ####
+    [
+        {
+            "abscisse":1,
+            "ordonnee":0
+        },
+        {
+            "abscisse":0,
+            "ordonnee":1
+        },
+        {
+            "abscisse":1,
+            "ordonnee":1
+        },
+        {
+            "abscisse":2,
+            "ordonnee":1
+        },
+    ],
+    #  #
+    # ###
+    [
+        {
+            "abscisse":0,
+            "ordonnee":0
+        },
+        {
+            "abscisse":0,
+            "ordonnee":1
+        },
+        {
+            "abscisse":0,
+            "ordonnee":2
+        },
+        {
+            "abscisse":0,
+            "ordonnee":3
+        }
+    ],
+    # ##
+    # ##
+    [
+        {
+            "abscisse":0,
+            "ordonnee":0
+        },
+        {
+            "abscisse":1,
+            "ordonnee":0
+        },
+        {
+            "abscisse":0,
+            "ordonnee":1
+        },
+        {
+            "abscisse":1,
+            "ordonnee":1
+        },
+    ],
+    # #
+    # ###
+    [
+        {
+            "abscisse":0,
+            "ordonnee":0
+        },
+        {
+            "abscisse":0,
+            "ordonnee":1
+        },
+        {
+            "abscisse":1,
+            "ordonnee":1
+        },
+        {
+            "abscisse":2,
+            "ordonnee":1
+        },
+    ],
+    #   #
+    # ###
+    [
+        {
+            "abscisse":0,
+            "ordonnee":1
+        },
+        {
+            "abscisse":1,
+            "ordonnee":1
+        },
+        {
+            "abscisse":2,
+            "ordonnee":1
+        },
+        {
+            "abscisse":2,
+            "ordonnee":0
+        },
+    ],
+    #  ##
+    # ##
+    [
+        {
+            "abscisse":0,
+            "ordonnee":1
+        },
+        {
+            "abscisse":1,
+            "ordonnee":1
+        },
+        {
+            "abscisse":1,
+            "ordonnee":0
+        },
+        {
+            "abscisse":2,
+            "ordonnee":0
+        },
+    ],
+    # ##
+    #  ##
+    [
+        {
+            "abscisse":0,
+            "ordonnee":0
+        },
+        {
+            "abscisse":1,
+            "ordonnee":0
+        },
+        {
+            "abscisse":1,
+            "ordonnee":1
+        },
+        {
+            "abscisse":2,
+            "ordonnee":1
+        },
+    ]
+)
+
+# Liste des couleurs de pièces possibles
+_COULEURS_PIECES = (
+    "blue",
+    "green",
+    "red",
+    "orange",
+    "purple",
+    "yellow",
+    "hotpink"
+)
+
+
+# État de rotation d'une pièce, précalculé une fois pour toutes (voir _calculerRotations) :
+# - briques           : coordonnées (abscisse, ordonnee) de chaque brique, la pièce étant recadrée en haut à gauche
+# - masques           : un entier par rang de briques, dont le bit n vaut 1 si la colonne n est occupée
+#                       (permet de tester une collision avec un décalage et un ET binaire par rang, voir MoteurMelobrics.obstacle)
+# - largeur, hauteur  : taille de la pièce
+# - hautsColonnes     : pour chaque colonne de la pièce, l'ordonnée de sa brique la plus haute
+# - basColonnes       : pour chaque colonne de la pièce, l'ordonnée de sa brique la plus basse
+#                       (permettent de trouver où la pièce va tomber, voir MoteurMelobrics.ordonneeChute)
+# - decalageOrdonnee  : déplacement vertical qui centre l'état suivant (rotation de 90° vers la droite) sur celui-ci
+# - decalagesAbscisse : déplacements horizontaux à essayer dans l'ordre pour placer l'état suivant
+#                       (centrage, puis décalages de 0, -1, 1, -2 et 2 colonnes si la place n'est pas libre)
+_EtatRotation = namedtuple("_EtatRotation", "briques masques largeur hauteur hautsColonnes basColonnes decalageOrdonnee decalagesAbscisse")
+
+# décalages horizontaux essayés quand une pièce retournée rencontre un obstacle
+_DECALAGES_ROTATION = (0, -1, 1, -2, 2)
+
+
+def _calculerRotations(forme):
+    """Renvoie les quatre états de rotation (_EtatRotation) d'une forme de _FORMES_PIECES"""
+
+    briques = tuple((brique["abscisse"], brique["ordonnee"]) for brique in forme)
+
+    # on calcule la géométrie de chaque état, en tournant la forme de 90° vers la droite à chaque fois
+    geometries = []
+    for rotation in range(4):
+        largeur = max(abscisse for abscisse, ordonnee in briques) + 1
+        hauteur = max(ordonnee for abscisse, ordonnee in briques) + 1
+        masques = [0] * hauteur
+        for abscisse, ordonnee in briques:
+            masques[ordonnee] |= 1 << abscisse
+        geometries.append((briques, tuple(masques), largeur, hauteur))
+        # (noter qu'on inverse hauteur et largeur)
+        briques = tuple((hauteur-1-ordonnee, abscisse) for abscisse, ordonnee in briques)
+
+    # puis les décalages qui centrent chaque état sur le précédent
+    etats = []
+    for rotation, (briques, masques, largeur, hauteur) in enumerate(geometries):
+        largeurSuivante, hauteurSuivante = geometries[(rotation+1) % 4][2:]
+        etats.append(_EtatRotation(
+            briques, masques, largeur, hauteur,
+            tuple(min(ordonnee for abscisse, ordonnee in briques if abscisse == colonne) for colonne in range(largeur)),
+            tuple(max(ordonnee for abscisse, ordonnee in briques if abscisse == colonne) for colonne in range(largeur)),
+            int(hauteur/2 - hauteurSuivante/2),
+            tuple(int(largeur/2 - largeurSuivante/2) + decalage for decalage in _DECALAGES_ROTATION)
+        ))
+    return tuple(etats)
+
+
+# États de rotation de chaque forme de pièce : _ROTATIONS_PIECES[forme][rotation]
+_ROTATIONS_PIECES = tuple(_calculerRotations(forme) for forme in _FORMES_PIECES)
+
+
+class _PieceMelobrics:
+    """Représente une pièce (groupe de briques) par trois entiers : l'indice de sa forme, de son état de rotation et de sa couleur.
+       La géométrie de chaque état est partagée dans _ROTATIONS_PIECES, une pièce n'en garde pas de copie :
+       créer une pièce ne coûte que trois affectations."""
+
+    __slots__ = ("forme", "rotation", "indiceCouleur")
+
+    def __init__(self, forme, indiceCouleur, rotation=0):
+        """Crée une pièce de la forme (indice dans _FORMES_PIECES) et de la couleur (indice dans _COULEURS_PIECES) demandées"""
+
+        self.forme = forme
+        self.indiceCouleur = indiceCouleur
+        self.rotation = rotation
+
+    @property
+    def couleur(self):
+        """Nom de la couleur de la pièce (pour l'affichage)"""
+
+        return _COULEURS_PIECES[self.indiceCouleur]
+
+    @property
+    def etat(self):
+        """État de rotation actuel de la pièce (_EtatRotation)"""
+
+        return _ROTATIONS_PIECES[self.forme][self.rotation]
+
+    @property
+    def briques(self):
+        return self.etat.briques
+
+    @property
+    def masques(self):
+        return self.etat.masques
+
+    @property
+    def largeur(self):
+        return self.etat.largeur
+
+    @property
+    def hauteur(self):
+        return self.etat.hauteur
+
+
+class _TiragePieces:
+    """Tirage d'une suite de pièces, partagé par les copies d'un GenerateurPieces (voir GenerateurPieces.copie).
+       Les pièces déjà tirées sont gardées, dans l'ordre, un octet par pièce : forme * len(_COULEURS_PIECES) + indiceCouleur."""
+
+    def __init__(self, graine, mode):
+        self.aleatoire = Random(graine)     # générateur aléatoire propre à la partie (indépendant du module random)
+        self.mode = mode
+        self.sac = []                       # formes restant dans le sac en cours (MODE_SAC)
+        self.pieces = bytearray()           # pièces déjà tirées
+        self.premiere = 0                   # numéro dans la suite de pieces[0] (voir GenerateurPieces.depuisEtat)
+
+    def generer(self, nombre):
+        """Tire d'un coup les `nombre` pièces suivantes de la suite.
+           Le lot ne change pas la suite tirée : les pièces sont tirées une par une, dans l'ordre."""
+
+        nbFormes, nbCouleurs = len(_FORMES_PIECES), len(_COULEURS_PIECES)
+        aleatoire, pieces = self.aleatoire, self.pieces
+        for i in range(nombre):
+            if self.mode == MODE_SAC:
+                if not self.sac:                        # si le sac est vide,
+                    self.sac = list(range(nbFormes))    # on le remplit
+                    aleatoire.shuffle(self.sac)         # et on le mélange
+                forme = self.sac.pop()
+            else:
+                forme = aleatoire.randrange(nbFormes)
+            pieces.append(forme*nbCouleurs + aleatoire.randrange(nbCouleurs))
+
+
+class GenerateurPieces:
+    """Suite de pièces reproductible : la même graine donne toujours la même suite de pièces.
+
+       Deux modes de tirage :
+       - MODE_ALEATOIRE : chaque forme est tirée au hasard, indépendamment des précédentes,
+       - MODE_SAC       : les formes sont tirées par sacs contenant chacun une fois chaque forme, dans un ordre aléatoire.
+       Dans les deux modes, la couleur de chaque pièce est tirée au hasard.
+
+       Le générateur n'est qu'une position (nbDonnees) dans la suite tirée (_TiragePieces) : ses copies partagent
+       le tirage, et un instantané de la partie (voir MoteurMelobrics.instantane) n'a pas à recopier l'état du tirage."""
+
+    def __init__(self, graine, mode=MODE_ALEATOIRE):
+        """Crée le générateur à partir d'une graine (un entier)"""
+
+        if mode not in (MODE_ALEATOIRE, MODE_SAC):
+            raise ValueError("Mode de tirage inconnu : {}".format(mode))
+
+        self.graine, self.mode = graine, mode
+        self.tirage = _TiragePieces(graine, mode)
+        self.nbDonnees = 0                  # nombre de pièces déjà données par suivante
+
+    def generer(self, nombre):
+        """Génère d'un coup `nombre` pièces de plus, qui seront données ensuite par suivante"""
+
+        self.tirage.generer(nombre)
+
+    def piece(self, numero):
+        """Renvoie la pièce de rang `numero` de la suite (qui doit déjà avoir été générée)"""
+
+        forme, indiceCouleur = divmod(self.tirage.pieces[numero - self.tirage.premiere], len(_COULEURS_PIECES))
+        return _PieceMelobrics(forme, indiceCouleur)
+
+    def apercu(self, nombre):
+        """Renvoie les `nombre` pièces suivantes, sans les donner"""
+
+        manquantes = self.nbDonnees + nombre - (self.tirage.premiere + len(self.tirage.pieces))
+        if manquantes > 0:
+            self.generer(max(manquantes, _TAILLE_LOT_PIECES))
+        return [self.piece(numero) for numero in range(self.nbDonnees, self.nbDonnees + nombre)]
+
+    def suivante(self):
+        """Renvoie la pièce suivante de la suite"""
+
+        if self.nbDonnees == self.tirage.premiere + len(self.tirage.pieces):    # si toutes les pièces générées ont été données,
+            self.generer(_TAILLE_LOT_PIECES)            # on en génère un nouveau lot
+        self.nbDonnees += 1
+        return self.piece(self.nbDonnees - 1)
+
+    def copie(self):
+        """Renvoie un générateur placé au même point de la même suite, qui pourra avancer indépendamment de celui-ci.
+           Le tirage est partagé (une même graine donne la même suite) : la copie ne coûte que la création de l'objet."""
+
+        copie = GenerateurPieces.__new__(GenerateurPieces)
+        copie.graine, copie.mode, copie.tirage, copie.nbDonnees = self.graine, self.mode, self.tirage, self.nbDonnees
+        return copie
+
+    def etat(self):
+        """Renvoie ce qu'il faut pour recréer le générateur à ce point de la suite (voir depuisEtat) :
+           l'état du générateur aléatoire (Random.getstate), le sac en cours (MODE_SAC),
+           et les pièces déjà tirées à partir de la dernière donnée (un octet par pièce, voir _TiragePieces)"""
+
+        tirage = self.tirage
+        return tirage.aleatoire.getstate(), bytes(tirage.sac), bytes(tirage.pieces[max(self.nbDonnees - 1 - tirage.premiere, 0):])
+
+    @staticmethod
+    def depuisEtat(graine, mode, nbDonnees, etatAleatoire, sac, pieces):
+        """Recrée un générateur à partir de son état (voir etat), sans retirer les pièces déjà données"""
+
+        generateur = GenerateurPieces(graine, mode)
+        tirage = generateur.tirage
+        tirage.aleatoire.setstate(etatAleatoire)
+        tirage.sac, tirage.pieces, tirage.premiere = list(sac), bytearray(pieces), max(nbDonnees - 1, 0)
+        generateur.nbDonnees = nbDonnees
+        return generateur
+
+
+def _neRienFaire(*arguments):
+    """Fonction de rappel par défaut : ignore l'événement"""
+
+    pass
+
+
+class MoteurMelobrics:
+    """Règles du jeu, indépendantes de tout affichage.
+
+       Le moteur ne connaît ni Tk ni le temps : chaque appel à etape fait avancer la partie d'une action,
+       de façon synchrone. GrilleMelobrics se contente de l'appeler au clavier et au rythme de periodeDeplacement (voir cadenceur.py)."""
+
+    def __init__(self, nbColonnes, nbLignes, rappelNouvellePiece=_neRienFaire, rappelScoreChange=_neRienFaire, rappelPartieTerminee=_neRienFaire):
+        """Initialise le moteur.
+
+        Liste des arguments :
+        - nbColonnes et nbLignes    : nombre de colonnes et de lignes de la grille
+        - rappelNouvellePiece       : fonction appelée quand une nouvelle pièce est insérée (avec la prochainePiece en argument)
+        - rappelScoreChange         : fonction appelée quand le score change (avec le score, limiterScore et scoreMaximal en arguments)
+        - rappelPartieTerminee      : fonction appelée quand la partie est terminée (avec True si gagné, False sinon)
+
+        Les fonctions de rappel sont facultatives : sans elles, le moteur peut tourner sans affichage.
+        """
+
+        # enregistrement des paramètres : taille de la grille, fonctions de rappel
+        self.nbColonnes, self.nbLignes = nbColonnes, nbLignes
+        self.lignePleine = (1 << nbColonnes) - 1    # masque d'une ligne pleine
+        self.couleursVides = bytes(nbColonnes)      # couleurs d'une ligne vide (partagées par toutes les lignes vides)
+        self.nbBlocs = -(-nbLignes // _TAILLE_BLOC_LIGNES)  # nombre de blocs de lignes des instantanés (arrondi au supérieur)
+        self.rappelNouvellePiece = rappelNouvellePiece
+        self.rappelScoreChange = rappelScoreChange
+        self.rappelPartieTerminee = rappelPartieTerminee
+
+        # initialisation : aucune partie n'est en cours
+        self.terminee = True
+        self.gagne = False
+        self.piece = None
+
+    def etape(self, action):
+        """Applique une action (ACTION_BAS, ACTION_GAUCHE, ACTION_DROITE, ACTION_RETOURNER ou ACTION_CHUTE) à la partie.
+           Renvoie True si la grille a changé et doit être redessinée, False sinon."""
+
+        if self.terminee:       # si aucune partie n'est en cours,
+            return False        # on ignore l'action
+
+        if action == ACTION_BAS:
+            return self.mouvementBas()
+        elif action == ACTION_GAUCHE:
+            return self.mouvementGauche()
+        elif action == ACTION_DROITE:
+            return self.mouvementDroite()
+        elif action == ACTION_RETOURNER:
+            return self.retournerPiece()
+        elif action == ACTION_CHUTE:
+            return self.chute()
+        else:
+            raise ValueError("Action inconnue : {}".format(action))
+
+    def obstacle(self, masques, abscisse, ordonnee):
+        """Renvoie True si une pièce de masques donnés (voir _EtatRotation)
+           ne peut pas être placée aux coordonnées demandées, à cause d'un bord ou d'une autre brique"""
+
+        if abscisse < 0 or ordonnee < 0 or ordonnee + len(masques) > self.nbLignes:   # si la pièce dépasse à gauche, en haut ou en bas,
+            return True                                                                 # il y a un obstacle
+
+        lignes = self.lignes
+        for rang, masque in enumerate(masques):     # pour chaque rang de la pièce,
+            masque <<= abscisse                     # on décale le masque jusqu'à la colonne de la pièce,
+            if masque > self.lignePleine or lignes[ordonnee+rang] & masque:    # si il dépasse à droite ou touche une brique,
+                return True                                                     # il y a un obstacle
+        return False
+
+    def mouvementBas(self):
+        """Fait avancer le jeu :
+            - déplace la pièce d'un rang vers le bas si possible,
+            - en insère une nouvelle si nécessaire,
+            - pour chaque ligne pleine, efface la ligne et augmente le score"""
+
+        # si une pièce est en mouvement, on tente de la faire descendre
+        if self.piece != None:
+            etat = self.piece.etat
+            # on vérifie si la pièce a atteint la dernière ligne ou un obstacle (une autre brique)
+            if self.obstacle(etat.masques, self.abscissePiece, self.ordonneePiece+1):
+                # Si la pièce est bloquée, on la "fixe" dans la grille,
+                ligneHaute, ligneBasse = self.fixerPiece()
+                self.piece = None                   # on la supprime,
+                # et on efface les lignes remplies (seules les lignes de la pièce peuvent l'être).
+                nb_lignes_pleines = len(self.effacerLignesPleines(ligneHaute, ligneBasse))
+                # si des lignes ont été effacées, on augmente le score
+                if nb_lignes_pleines > 0:
+                    # le gain de score de chaque ligne est multiplié par son rang parmi les lignes détruites (100, puis 200, ...)
+                    # -> supprimer plusieurs lignes d'un coup peut rapporter beaucoup plus
+                    self.score += _PAS_SCORE * nb_lignes_pleines*(nb_lignes_pleines+1)//2
+                    self.rappelScoreChange(self.score, self.limiterScore, self.scoreMaximal)
+                    # si le score maximal est atteint, on a gagné
+                    if self.limiterScore and self.score >= self.scoreMaximal:
+                        self.terminerPartie(True)
+                        return True
+            else:                                   # Si la pièce peut encore descendre,
+                self.ordonneePiece += 1             # on la descend,
+
+        # s'il n'y a pas ou plus de pièce en mouvement, on insère la suivante
+        if self.piece == None:
+            self.insererPiece()
+
+        return True
+
+    def fixerPiece(self):
+        """Fixe la pièce en mouvement dans la grille (briques, couleurs et sommets des colonnes),
+           et renvoie les lignes qu'elle occupe : ligneHaute (incluse) et ligneBasse (exclue)"""
+
+        etat = self.piece.etat
+        for rang, masque in enumerate(etat.masques):
+            self.lignes[self.ordonneePiece+rang] |= masque << self.abscissePiece
+        # (les lignes de couleurs ne sont jamais modifiées sur place mais remplacées, pour être partagées par les instantanés)
+        indiceCouleur = self.piece.indiceCouleur + 1
+        rangees = [bytearray(couleurs) for couleurs in self.couleurs[self.ordonneePiece:self.ordonneePiece+etat.hauteur]]
+        for abscisse, ordonnee in etat.briques:
+            rangees[ordonnee][self.abscissePiece+abscisse] = indiceCouleur
+        self.couleurs[self.ordonneePiece:self.ordonneePiece+etat.hauteur] = map(bytes, rangees)
+        for colonne, haut in enumerate(etat.hautsColonnes, self.abscissePiece):     # (la pièce peut former le nouveau sommet de ses colonnes)
+            self.sommets[colonne] = min(self.sommets[colonne], self.ordonneePiece+haut)
+        ligneHaute, ligneBasse = self.ordonneePiece, self.ordonneePiece+etat.hauteur
+        self.marquerLignesModifiees(ligneHaute, ligneBasse)
+        return ligneHaute, ligneBasse
+
+    def insererPiece(self):
+        """Insère la prochaine pièce en haut de la grille et tire la suivante ; termine la partie (perdue) s'il n'y a pas la place"""
+
+        self.piece = self.prochainePiece    # (la prochaine pièce n'a jamais été modifiée, inutile de la copier)
+        self.abscissePiece, self.ordonneePiece = self.nbColonnes//2 - self.piece.largeur//2, 0  # on change les coordonnées
+        # on vérifie que la pièce peut être insérée
+        if self.obstacle(self.piece.masques, self.abscissePiece, self.ordonneePiece):  # si la pièce ne peut pas être insérée,
+            self.terminerPartie(False)                                                  # on a perdu
+            return
+        self.prochainePiece = self.generateur.suivante()   # on tire la pièce suivante
+        self.rappelNouvellePiece(self.prochainePiece)   # et on l'affiche
+
+    def effacerLignesPleines(self, ligneHaute, ligneBasse):
+        """Efface en une seule passe les lignes pleines comprises entre ligneHaute (incluse) et ligneBasse (exclue),
+           descend d'autant les lignes supérieures, et renvoie la liste des indices des lignes effacées"""
+
+        lignes, lignePleine = self.lignes, self.lignePleine
+        lignesEffacees = [ligne for ligne in range(ligneHaute, ligneBasse) if lignes[ligne] == lignePleine]
+
+        if lignesEffacees:
+            # toutes les lignes entre le haut de la pile et ligneBasse vont descendre
+            self.marquerLignesModifiees(min(self.sommets), ligneBasse)
+            # au-dessus de ligneBasse, on ne garde que les lignes qui ne sont pas pleines,
+            # et on complète en haut par autant de lignes vides que de lignes effacées (les lignes du dessous ne bougent pas)
+            nbEffacees = len(lignesEffacees)
+            self.couleurs[:ligneBasse] = [self.couleursVides] * nbEffacees \
+                + [couleurs for couleurs, ligne in zip(self.couleurs[:ligneBasse], lignes[:ligneBasse]) if ligne != lignePleine]
+            lignes[:ligneBasse] = [0] * nbEffacees + [ligne for ligne in lignes[:ligneBasse] if ligne != lignePleine]
+            self.calculerSommets()
+
+        return lignesEffacees
+
+    def marquerLignesModifiees(self, ligneHaute, ligneBasse):
+        """Ajoute les lignes de ligneHaute (incluse) à ligneBasse (exclue) aux lignes modifiées,
+           pour l'affichage (voir prendreLignesModifiees) et pour le prochain instantané (voir instantane)"""
+
+        self.ligneModifieeHaute = min(self.ligneModifieeHaute, ligneHaute)
+        self.ligneModifieeBasse = max(self.ligneModifieeBasse, ligneBasse)
+        self.ligneInstantaneeHaute = min(self.ligneInstantaneeHaute, ligneHaute)
+        self.ligneInstantaneeBasse = max(self.ligneInstantaneeBasse, ligneBasse)
+
+    def prendreLignesModifiees(self):
+        """Renvoie les lignes de la grille (hors pièce en déplacement) qui ont pu changer depuis le dernier appel, sous forme de range,
+           puis les oublie. Permet à l'affichage de ne redessiner que ces lignes, quelle que soit la taille de la grille."""
+
+        lignes = range(self.ligneModifieeHaute, self.ligneModifieeBasse)
+        self.ligneModifieeHaute, self.ligneModifieeBasse = self.nbLignes, 0
+        return lignes
+
+    def calculerSommets(self):
+        """Recalcule le sommet de chaque colonne après l'effacement de lignes.
+           Les lignes ne font que descendre : on parcourt les lignes à partir de l'ancien sommet le plus haut,
+           jusqu'à avoir trouvé la première brique de chaque colonne."""
+
+        sommets = [self.nbLignes] * self.nbColonnes
+        colonnesRestantes = self.lignePleine            # colonnes dont on n'a pas encore trouvé le sommet
+        for numero in range(min(self.sommets), self.nbLignes):
+            trouvees = self.lignes[numero] & colonnesRestantes
+            colonnesRestantes ^= trouvees
+            while trouvees:                             # pour chaque colonne dont c'est la première brique,
+                bit = trouvees & -trouvees
+                sommets[bit.bit_length()-1] = numero    # on note le sommet
+                trouvees ^= bit
+            if not colonnesRestantes:
+                break
+        self.sommets = sommets
+
+    def ordonneeChute(self):
+        """Renvoie l'ordonnée où la pièce en déplacement s'arrêterait si elle tombait tout droit.
+
+           D'après le sommet des colonnes qu'elle occupe, le calcul ne coûte qu'une opération par colonne de la pièce.
+           Seul cas particulier : si la pièce a été glissée sous une brique en surplomb, elle est déjà sous le sommet
+           d'une de ses colonnes, et on la fait descendre rang par rang."""
+
+        etat = self.piece.etat
+        abscisse, ordonnee = self.abscissePiece, self.ordonneePiece
+        ordonneeChute = self.nbLignes - etat.hauteur
+        for colonne, bas in enumerate(etat.basColonnes, abscisse):
+            sommet = self.sommets[colonne]
+            if ordonnee + bas >= sommet:                # si la pièce est sous le sommet de la colonne,
+                while not self.obstacle(etat.masques, abscisse, ordonnee+1):   # on la descend rang par rang
+                    ordonnee += 1
+                return ordonnee
+            ordonneeChute = min(ordonneeChute, sommet - 1 - bas)
+        return ordonneeChute
+
+    def chute(self):
+        """Fait tomber la pièce d'un coup jusqu'en bas et la fixe (voir mouvementBas), renvoie True si la grille a changé"""
+
+        if self.piece == None:
+            return False
+
+        self.ordonneePiece = self.ordonneeChute()
+        return self.mouvementBas()      # la pièce est bloquée : mouvementBas la fixe et insère la suivante
+
+    def mouvementGauche(self):
+        """Déplace la pièce d'un rang vers la gauche, renvoie True si elle a bougé"""
+
+        if self.piece == None or self.obstacle(self.piece.masques, self.abscissePiece-1, self.ordonneePiece):  # si un obstacle est rencontré,
+            return False                                                                                        # on ne bouge pas
+
+        self.abscissePiece -= 1     # si la place est libre, on déplace la pièce
+        return True
+
+    def mouvementDroite(self):
+        """Déplace la pièce d'un rang vers la droite, renvoie True si elle a bougé"""
+
+        if self.piece == None or self.obstacle(self.piece.masques, self.abscissePiece+1, self.ordonneePiece):  # si un obstacle est rencontré,
+            return False                                                                                        # on ne bouge pas
+
+        self.abscissePiece += 1     # si la place est libre, on déplace la pièce
+        return True
+
+    def retournerPiece(self):
+        """Tourne la pièce de 90° vers la droite, renvoie True si elle a tourné"""
+
+        if self.piece == None:
+            return False
+
+        # l'état de rotation suivant et les décalages qui le centrent sont précalculés
+        etat = self.piece.etat
+        rotationSuivante = (self.piece.rotation + 1) % 4
+        masquesSuivants = _ROTATIONS_PIECES[self.piece.forme][rotationSuivante].masques
+
+        # on modifie l'ordonnée de la pièce et on teste différentes abscisses
+        ordonneePieceTest = self.ordonneePiece + etat.decalageOrdonnee
+        for decalage in etat.decalagesAbscisse:
+            if not self.obstacle(masquesSuivants, self.abscissePiece + decalage, ordonneePieceTest):  # si aucun obstacle n'est rencontré,
+                self.piece.rotation = rotationSuivante                                              # on tourne la pièce
+                self.abscissePiece, self.ordonneePiece = self.abscissePiece + decalage, ordonneePieceTest
+                return True
+
+        return False
+
+    def nouvellePartie(self, difficulte, limiterScore, graine=None, modeTirage=MODE_ALEATOIRE):
+        """Prépare une nouvelle partie ; la première pièce est insérée au premier ACTION_BAS.
+           La suite des pièces est tirée à partir de la graine (choisie au hasard si elle n'est pas fournie) :
+           une même graine, avec les mêmes actions, redonne exactement la même partie."""
+
+        # création de la grille, ligne par ligne (la ligne 0 est en haut) :
+        # - lignes : un entier par ligne, dont le bit n vaut 1 si la case de la colonne n est pleine,
+        # - couleurs : un octet par case, qui vaut 0 si la case est vide, et 1 + l'indice de sa couleur dans _COULEURS_PIECES sinon ;
+        #   chaque ligne est un bytes, jamais modifié : une ligne qui change est remplacée (voir instantane)
+        self.lignes = [0] * self.nbLignes
+        self.couleurs = [self.couleursVides] * self.nbLignes
+        # - sommets : pour chaque colonne, la ligne de sa brique la plus haute (nbLignes si la colonne est vide)
+        self.sommets = [self.nbLignes] * self.nbColonnes
+        # - lignes modifiées depuis le dernier dessin (voir prendreLignesModifiees) : toute la grille, qui vient d'être vidée
+        self.ligneModifieeHaute, self.ligneModifieeBasse = 0, self.nbLignes
+        # - blocs de lignes du dernier instantané, et lignes modifiées depuis (voir instantane) : tous les blocs sont à refaire
+        self.blocsLignes, self.blocsCouleurs = [None] * self.nbBlocs, [None] * self.nbBlocs
+        self.ligneInstantaneeHaute, self.ligneInstantaneeBasse = 0, self.nbLignes
+
+        self.reglerDifficulte(difficulte, limiterScore)
+
+        self.score = 0          # compteur de score
+        self.piece = None       # contient la pièce actuellement en mouvement
+        self.abscissePiece, self.ordonneePiece = 0, 0
+        self.terminee = False   # indique si la partie est terminée
+        self.gagne = False      # indique si la partie terminée a été gagnée
+
+        # on initialise l'affichage du score
+        self.rappelScoreChange(self.score, self.limiterScore, self.scoreMaximal)
+
+        if graine == None:
+            graine = getrandbits(32)
+        self.graine = graine
+        self.generateur = GenerateurPieces(graine, modeTirage)
+        self.prochainePiece = self.generateur.suivante()
+
+    def reglerDifficulte(self, difficulte, limiterScore):
+        """Règle la vitesse et le score à atteindre d'après la difficulté"""
+
+        self.difficulte = difficulte                    # quand la difficulté augmente,
+        self.periodeDeplacement = 1000/difficulte       # la vitesse augmente (période en millisecondes, pas forcément entière)...
+
+        if limiterScore:
+            self.scoreMaximal = 11000-1000*difficulte   # ...et le score à atteindre baisse
+        else:
+            self.scoreMaximal = None
+        self.limiterScore = limiterScore
+
+    def instantane(self):
+        """Renvoie l'état complet de la partie (InstantanePartie), qui ne changera plus quand la partie avancera.
+
+           Les lignes de la grille sont rangées par blocs de _TAILLE_BLOC_LIGNES lignes (des tuples), partagés
+           d'un instantané à l'autre : seuls les blocs dont une ligne a changé depuis l'instantané précédent
+           (voir marquerLignesModifiees) sont refaits. Le contenu des lignes n'est jamais recopié : un entier par ligne
+           pour les briques, et un bytes par ligne pour les couleurs, que le moteur remplace au lieu de le modifier.
+           Le coût suit donc le nombre de lignes modifiées, plus une référence par bloc (25 blocs pour 400 lignes)."""
+
+        blocHaut = self.ligneInstantaneeHaute // _TAILLE_BLOC_LIGNES
+        blocBas = -(-self.ligneInstantaneeBasse // _TAILLE_BLOC_LIGNES)
+        for bloc in range(blocHaut, blocBas):
+            debut, fin = bloc*_TAILLE_BLOC_LIGNES, (bloc+1)*_TAILLE_BLOC_LIGNES
+            self.blocsLignes[bloc], self.blocsCouleurs[bloc] = tuple(self.lignes[debut:fin]), tuple(self.couleurs[debut:fin])
+        self.ligneInstantaneeHaute, self.ligneInstantaneeBasse = self.nbLignes, 0
+
+        piece = self.piece
+        return InstantanePartie(
+            self.nbColonnes, self.nbLignes, self.difficulte, self.limiterScore,
+            tuple(self.blocsLignes), tuple(self.blocsCouleurs), tuple(self.sommets),
+            None if piece == None else (piece.forme, piece.rotation, piece.indiceCouleur), self.abscissePiece, self.ordonneePiece,
+            self.generateur.copie(), self.score, self.terminee, self.gagne
+        )
+
+    def restaurer(self, instantane):
+        """Remet la partie dans l'état d'un instantané (voir instantane), pris sur ce moteur ou sur un autre de même taille :
+           permet de revenir en arrière (voir HistoriquePartie), ou de poursuivre une partie dans plusieurs directions."""
+
+        if (instantane.nbColonnes, instantane.nbLignes) != (self.nbColonnes, self.nbLignes):
+            raise ValueError("Instantané d'une grille de {}x{}, au lieu de {}x{}".format(
+                instantane.nbColonnes, instantane.nbLignes, self.nbColonnes, self.nbLignes))
+
+        self.lignes, self.couleurs = lignesDeBlocs(instantane.lignes), lignesDeBlocs(instantane.couleurs)
+        self.sommets = list(instantane.sommets)
+        self.ligneModifieeHaute, self.ligneModifieeBasse = 0, self.nbLignes     # (l'affichage comparera chaque ligne)
+        # les blocs de l'instantané restauré resservent tels quels pour les instantanés suivants
+        self.blocsLignes, self.blocsCouleurs = list(instantane.lignes), list(instantane.couleurs)
+        self.ligneInstantaneeHaute, self.ligneInstantaneeBasse = self.nbLignes, 0
+        self.reglerDifficulte(instantane.difficulte, instantane.limiterScore)
+
+        self.piece = None if instantane.piece == None else _PieceMelobrics(instantane.piece[0], instantane.piece[2], instantane.piece[1])
+        self.abscissePiece, self.ordonneePiece = instantane.abscissePiece, instantane.ordonneePiece
+        self.score, self.terminee, self.gagne = instantane.score, instantane.terminee, instantane.gagne
+
+        # le générateur repart du même point de la suite (la prochaine pièce est la dernière donnée)
+        self.generateur = instantane.generateur.copie()
+        self.graine = self.generateur.graine
+        self.prochainePiece = self.generateur.piece(self.generateur.nbDonnees - 1)
+
+        self.rappelScoreChange(self.score, self.limiterScore, self.scoreMaximal)
+        self.rappelNouvellePiece(self.prochainePiece)
+
+    def terminerPartie(self, gagne):
+        """Termine la partie et prévient l'affichage"""
+
+        self.terminee = True
+        self.gagne = gagne
+        self.rappelPartieTerminee(gagne)
+
+
+# État complet d'une partie à un instant donné (voir MoteurMelobrics.instantane et MoteurMelobrics.restaurer) :
+# - lignes, couleurs          : lignes de la grille du moteur (voir MoteurMelobrics.nouvellePartie), par blocs de
+#                               _TAILLE_BLOC_LIGNES lignes partagés entre instantanés (voir blocsDeLignes et lignesDeBlocs)
+# - sommets                   : tuple des sommets des colonnes
+# - piece                     : pièce en mouvement (forme, rotation, indiceCouleur), None s'il n'y en a pas
+# - generateur                : copie du GenerateurPieces, placée juste après la prochaine pièce
+InstantanePartie = namedtuple("InstantanePartie", "nbColonnes nbLignes difficulte limiterScore lignes couleurs sommets "
+                                                   "piece abscissePiece ordonneePiece generateur score terminee gagne")
+
+
+def blocsDeLignes(lignes):
+    """Range une liste de lignes de la grille par blocs de _TAILLE_BLOC_LIGNES lignes, comme dans InstantanePartie"""
+
+    return tuple(tuple(lignes[debut:debut+_TAILLE_BLOC_LIGNES]) for debut in range(0, len(lignes), _TAILLE_BLOC_LIGNES))
+
+
+def lignesDeBlocs(blocs):
+    """Remet bout à bout (dans une liste) les lignes rangées par blocs d'un InstantanePartie (l'inverse de blocsDeLignes)"""
+
+    return list(chain.from_iterable(blocs))
+
+
+class HistoriquePartie:
+    """Tampon circulaire des derniers instantanés d'une partie, pour revenir en arrière (entraînement, analyse).
+       Au-delà de sa capacité, les instantanés les plus anciens sont oubliés : la mémoire utilisée reste bornée."""
+
+    def __init__(self, capacite=_CAPACITE_HISTORIQUE):
+        self.instantanes = deque(maxlen=capacite)
+
+    def __len__(self):
+        return len(self.instantanes)
+
+    def enregistrer(self, moteur):
+        """Ajoute l'état actuel de la partie à l'historique"""
+
+        self.instantanes.append(moteur.instantane())
+
+    def revenir(self, moteur, nombre=1):
+        """Remet la partie dans l'état du nombre-ième dernier instantané enregistré (qui est retiré de l'historique,
+           avec les plus récents). Renvoie False, sans rien changer, si l'historique n'en contient pas autant."""
+
+        if nombre < 1 or nombre > len(self.instantanes):
+            return False
+        for i in range(nombre - 1):
+            self.instantanes.pop()
+        moteur.restaurer(self.instantanes.pop())
+        return True
+
+    def vider(self):
+        self.instantanes.clear()
@@ -0,0 +1,117 @@
+﻿"""Mesure du temps passé dans chaque phase d'un tick, dans des histogrammes de taille fixe (voir GrilleMelobrics, option profilage)"""
+
+from time import perf_counter_ns    # pour chronométrer les phases à la nanoseconde
+
+
+# Précision des histogrammes : chaque puissance de deux est découpée en 2**_BITS_PRECISION intervalles,
+# l'erreur relative sur une durée est donc inférieure à 1/2**_BITS_PRECISION (3 %)
+_BITS_PRECISION = 5
+
+# Plus grande durée distinguée : 2**_BITS_DUREE ns (plus d'une minute) ; les durées plus longues sont comptées avec elle
+_BITS_DUREE = 36
+
+# Centiles affichés dans le résumé
+_CENTILES = (50, 90, 99)
+
+
+def _indice(duree):
+    """Renvoie l'intervalle de l'histogramme où compter une durée (en ns) : les 2**(_BITS_PRECISION+1) premières durées
+       ont chacune le leur, puis chaque puissance de deux est découpée en 2**_BITS_PRECISION intervalles égaux"""
+
+    decalage = max(duree.bit_length() - _BITS_PRECISION - 1, 0)
+    return (decalage << _BITS_PRECISION) + (duree >> decalage)
+
+
+def _bornes(indice):
+    """Renvoie la plus petite et la plus grande durée comptées dans un intervalle (l'inverse de _indice)"""
+
+    decalage = max((indice >> _BITS_PRECISION) - 1, 0)
+    debut = (indice - (decalage << _BITS_PRECISION)) << decalage
+    return debut, debut + (1 << decalage) - 1
+
+
+class HistogrammeDurees:
+    """Histogramme de durées en nanosecondes, à précision relative constante (comme HdrHistogram).
+
+       La mémoire est fixe (quelques milliers d'entiers) quel que soit le nombre de durées comptées,
+       et ajouter une durée ne coûte qu'un calcul d'indice : on peut tout compter pendant des heures de jeu."""
+
+    def __init__(self):
+        self.comptes = [0] * ((_BITS_DUREE - _BITS_PRECISION + 1) << _BITS_PRECISION)
+        self.nombre, self.total, self.maximum = 0, 0, 0
+
+    def ajouter(self, duree):
+        """Compte une durée (en ns)"""
+
+        duree = min(duree, (1 << _BITS_DUREE) - 1)
+        self.comptes[_indice(duree)] += 1
+        self.nombre += 1
+        self.total += duree
+        self.maximum = max(self.maximum, duree)
+
+    def moyenne(self):
+        """Renvoie la durée moyenne (en ns), 0 si aucune durée n'a été comptée"""
+
+        return self.total / self.nombre if self.nombre else 0
+
+    def centile(self, pourcentage):
+        """Renvoie le centile (en ns) : la plus grande durée de l'intervalle qui le contient, sans dépasser le maximum"""
+
+        rang = max(-(-pourcentage * self.nombre // 100), 1)     # (rang du centile, arrondi au supérieur)
+        cumul = 0
+        for indice, compte in enumerate(self.comptes):
+            cumul += compte
+            if cumul >= rang:
+                return min(_bornes(indice)[1], self.maximum)
+        return self.maximum
+
+
+class ProfilTicks:
+    """Durées de chaque phase des ticks d'une partie (un HistogrammeDurees par phase), et gigue de la descente automatique.
+
+       Les fonctions à mesurer sont remplacées par des versions chronométrées (voir chronometrer) : seul le jeu profilé
+       paie la mesure, le code du jeu lui-même n'est pas modifié. Les durées sont inclusives : une phase compte aussi
+       les phases qu'elle appelle (l'insertion d'une pièce compte sa collision et le rappel de la prochaine pièce...)."""
+
+    def __init__(self):
+        self.histogrammes = {}                  # nom de la phase -> HistogrammeDurees (dans l'ordre des premières mesures)
+        self.gigue = HistogrammeDurees()        # retard de chaque série de descentes sur son échéance
+        self.periode = None                     # période des descentes automatiques, en secondes (voir mesurerGigue)
+
+    def chronometrer(self, phase, fonction):
+        """Renvoie une version de fonction dont chaque appel est compté dans l'histogramme de la phase"""
+
+        ajouter = self.histogrammes.setdefault(phase, HistogrammeDurees()).ajouter
+
+        def fonctionChronometree(*arguments):
+            debut = perf_counter_ns()
+            try:
+                return fonction(*arguments)
+            finally:
+                ajouter(perf_counter_ns() - debut)
+        return fonctionChronometree
+
+    def mesurerGigue(self, retard, periode):
+        """Compte le retard (en secondes) d'une descente automatique sur son échéance, les échéances étant espacées de periode"""
+
+        self.gigue.ajouter(int(retard * 1e9))
+        self.periode = periode
+
+    def resume(self):
+        """Renvoie le résumé des mesures (texte) : pour chaque phase, nombre d'appels, moyenne, centiles et maximum en microsecondes,
+           puis la gigue en millisecondes et en proportion de la période des descentes"""
+
+        lignes = ["phase               appels   moyenne " + "".join("     c{:<4}".format(pourcentage) for pourcentage in _CENTILES) + "    maximum   (µs)"]
+        for phase, histogramme in self.histogrammes.items():
+            lignes.append("{:<16} {:>9} {:>9.1f} ".format(phase, histogramme.nombre, histogramme.moyenne() / 1000)
+                          + "".join(" {:>9.1f}".format(histogramme.centile(pourcentage) / 1000) for pourcentage in _CENTILES)
+                          + " {:>10.1f}".format(histogramme.maximum / 1000))
+
+        if self.gigue.nombre:
+            periode = self.periode * 1e9
+            lignes.append("gigue des descentes ({} séries, période {:.0f} ms) : moyenne {:.2f} ms ({:.1%}), ".format(
+                self.gigue.nombre, self.periode * 1000, self.gigue.moyenne() / 1e6, self.gigue.moyenne() / periode)
+                + ", ".join("c{} {:.2f} ms ({:.1%})".format(pourcentage, self.gigue.centile(pourcentage) / 1e6, self.gigue.centile(pourcentage) / periode)
+                            for pourcentage in _CENTILES)
+                + ", maximum {:.2f} ms ({:.1%})".format(self.gigue.maximum / 1e6, self.gigue.maximum / periode))
+        return "\n".join(lignes)
@@ -0,0 +1,199 @@
+﻿"""Enregistrement des parties dans un format binaire compact, et vérification des scores en rejouant les parties sans Tk"""
+
+import sys                  # pour les arguments de la ligne de commande
+import os                   # pour les opérations sur les fichiers et les chemins
+import time                 # pour nommer les fichiers de rejeu
+
+from moteur import *        # pour rejouer les parties
+
+
+# Dossier où sont écrits les rejeux, à côté du fichier des scores
+_CHEMIN_DOSSIER_REJEUX = os.path.dirname(__file__) + os.sep + "rejeux"
+
+# En-tête et version du format des fichiers de rejeu
+_MAGIE_REJEU = b"MLBR"
+_VERSION_REJEU = 1
+
+# Dans le fichier, chaque action est codée avec l'écart de ticks depuis l'action précédente : (ecart << _BITS_ACTION) | action
+_BITS_ACTION = 3
+
+
+def _ecrireEntier(tampon, entier):
+    """Ajoute un entier positif au tampon (bytearray) au format varint : 7 bits par octet, le bit de poids fort indique une suite"""
+
+    while entier >= 0x80:
+        tampon.append((entier & 0x7F) | 0x80)
+        entier >>= 7
+    tampon.append(entier)
+
+
+def _lireEntier(donnees, position):
+    """Lit un entier au format varint à partir de position, renvoie l'entier et la position suivante"""
+
+    entier, decalage = 0, 0
+    while True:
+        octet = donnees[position]
+        position += 1
+        entier |= (octet & 0x7F) << decalage
+        if octet < 0x80:
+            return entier, position
+        decalage += 7
+
+
+class EnregistrementPartie:
+    """Enregistrement d'une partie : ses paramètres, et les actions du joueur horodatées en ticks.
+
+       Un tick est une descente automatique de la pièce (un appel de GrilleMelobrics.descenteAutomatique).
+       Chaque action est enregistrée avec le nombre de ticks écoulés avant elle : comme le moteur est déterministe
+       pour une graine donnée, rejouer les mêmes actions entre les mêmes ticks redonne exactement la même partie."""
+
+    def __init__(self, graine, modeTirage, difficulte, limiterScore, nbColonnes, nbLignes):
+        """Commence un enregistrement vide pour une partie de paramètres donnés"""
+
+        self.graine, self.modeTirage = graine, modeTirage
+        self.difficulte, self.limiterScore = difficulte, limiterScore
+        self.nbColonnes, self.nbLignes = nbColonnes, nbLignes
+        self.actions = []       # liste de couples (tick, action)
+        self.actionsCodees = bytearray()    # les mêmes actions au format du fichier (voir versOctets), codées au fur et à mesure
+        self.tickDerniereAction = 0
+        self.nbTicks = 0        # nombre de ticks de la partie, connu à la fin
+        self.pseudo = ""        # pseudo et score enregistrés par FenetreScores.ajouterScore
+        self.score = 0
+
+    def ajouterAction(self, tick, action):
+        """Enregistre une action du joueur (ACTION_...), effectuée après `tick` ticks"""
+
+        self.actions.append((tick, action))
+        _ecrireEntier(self.actionsCodees, ((tick - self.tickDerniereAction) << _BITS_ACTION) | action)
+        self.tickDerniereAction = tick
+
+    def terminer(self, nbTicks, pseudo, score):
+        """Termine l'enregistrement avec le nombre total de ticks et le score enregistré par le joueur"""
+
+        self.nbTicks, self.pseudo, self.score = nbTicks, pseudo, score
+
+    def versOctets(self):
+        """Renvoie l'enregistrement au format binaire.
+           Les actions sont déjà codées (voir ajouterAction) : le coût ne dépend presque pas de la longueur de la partie,
+           ce qui permet de sauvegarder la partie en cours souvent (voir sauvegarde.SauvegardeAuto)."""
+
+        tampon = bytearray(_MAGIE_REJEU)
+        tampon.append(_VERSION_REJEU)
+        for entier in (self.graine, self.modeTirage, self.difficulte, int(self.limiterScore), self.nbColonnes, self.nbLignes, self.nbTicks, self.score):
+            _ecrireEntier(tampon, entier)
+        pseudo = self.pseudo.encode("utf-8")
+        _ecrireEntier(tampon, len(pseudo))
+        tampon += pseudo
+
+        # les actions, codées par écart de ticks avec l'action précédente
+        _ecrireEntier(tampon, len(self.actions))
+        tampon += self.actionsCodees
+
+        return bytes(tampon)
+
+    @staticmethod
+    def depuisOctets(donnees):
+        """Relit un enregistrement écrit par versOctets"""
+
+        if donnees[:len(_MAGIE_REJEU)] != _MAGIE_REJEU:
+            raise ValueError("Ce n'est pas un fichier de rejeu")
+        if donnees[len(_MAGIE_REJEU)] != _VERSION_REJEU:
+            raise ValueError("Version de rejeu non prise en charge : {}".format(donnees[len(_MAGIE_REJEU)]))
+        position = len(_MAGIE_REJEU) + 1
+
+        entiers = []
+        for i in range(8):
+            entier, position = _lireEntier(donnees, position)
+            entiers.append(entier)
+        graine, modeTirage, difficulte, limiterScore, nbColonnes, nbLignes, nbTicks, score = entiers
+        enregistrement = EnregistrementPartie(graine, modeTirage, difficulte, bool(limiterScore), nbColonnes, nbLignes)
+        longueur, position = _lireEntier(donnees, position)
+        pseudo = bytes(donnees[position:position+longueur]).decode("utf-8")
+        position += longueur
+        enregistrement.terminer(nbTicks, pseudo, score)
+
+        nbActions, position = _lireEntier(donnees, position)
+        debutActions = position
+        tick, masqueAction = 0, (1 << _BITS_ACTION) - 1
+        for i in range(nbActions):
+            code, position = _lireEntier(donnees, position)
+            tick += code >> _BITS_ACTION
+            enregistrement.actions.append((tick, code & masqueAction))
+        enregistrement.actionsCodees[:] = donnees[debutActions:position]
+        enregistrement.tickDerniereAction = tick
+
+        return enregistrement
+
+    def parcourir(self):
+        """Rejoue la partie sans affichage, et renvoie (au fur et à mesure) le moteur au début de la partie puis après chaque tick.
+           Le même moteur est renvoyé à chaque fois : il faut l'utiliser (le dessiner...) avant de demander le tick suivant."""
+
+        moteur = MoteurMelobrics(self.nbColonnes, self.nbLignes)
+        moteur.nouvellePartie(self.difficulte, self.limiterScore, self.graine, self.modeTirage)
+        etape = moteur.etape
+        yield moteur
+
+        tickCourant = 0
+        for tick, action in self.actions:
+            while tickCourant < tick and not moteur.terminee:   # on fait les descentes automatiques jusqu'à l'action,
+                etape(ACTION_BAS)
+                tickCourant += 1
+                yield moteur
+            if moteur.terminee:
+                return
+            etape(action)                                       # puis on applique l'action
+        while tickCourant < self.nbTicks and not moteur.terminee:   # enfin, on termine les descentes automatiques
+            etape(ACTION_BAS)
+            tickCourant += 1
+            yield moteur
+
+    def rejouer(self):
+        """Rejoue la partie sans affichage, aussi vite que possible, et renvoie le moteur dans son état final"""
+
+        for moteur in self.parcourir():
+            pass
+        return moteur
+
+    def verifier(self):
+        """Rejoue la partie et renvoie le score obtenu, et True s'il est égal au score enregistré"""
+
+        score = self.rejouer().score
+        return score, score == self.score
+
+
+def sauverRejeu(enregistrement, dossier=_CHEMIN_DOSSIER_REJEUX):
+    """Ecrit l'enregistrement dans un nouveau fichier du dossier des rejeux, et renvoie son chemin"""
+
+    os.makedirs(dossier, exist_ok=True)
+    chemin = dossier + os.sep + "{:x}.rejeu".format(time.time_ns())
+    with open(chemin, "wb") as fichier:
+        fichier.write(enregistrement.versOctets())
+    return chemin
+
+
+def verifierRejeux(dossier=_CHEMIN_DOSSIER_REJEUX):
+    """Vérifie chaque rejeu du dossier ; pour chacun, renvoie (au fur et à mesure) :
+       le nom du fichier, le pseudo, le score enregistré, le score rejoué, et True si les deux sont égaux"""
+
+    for nomFichier in sorted(os.listdir(dossier)):
+        if not nomFichier.endswith(".rejeu"):
+            continue
+        with open(dossier + os.sep + nomFichier, "rb") as fichier:
+            enregistrement = EnregistrementPartie.depuisOctets(fichier.read())
+        score, valide = enregistrement.verifier()
+        yield nomFichier, enregistrement.pseudo, enregistrement.score, score, valide
+
+
+if __name__ == "__main__":
+    # utilisation : python rejeu.py [dossier des rejeux]
+    dossier = sys.argv[1] if len(sys.argv) > 1 else _CHEMIN_DOSSIER_REJEUX
+    debut = time.perf_counter()
+    nbRejeux, nbInvalides = 0, 0
+    for nomFichier, pseudo, scoreEnregistre, scoreRejoue, valide in verifierRejeux(dossier):
+        nbRejeux += 1
+        if not valide:
+            nbInvalides += 1
+            print("{} : score de {} invalide ({} enregistré, {} rejoué)".format(nomFichier, pseudo, scoreEnregistre, scoreRejoue))
+    duree = time.perf_counter() - debut
+    print("{} rejeux vérifiés en {:.3f} s, {} invalides".format(nbRejeux, duree, nbInvalides))
+    sys.exit(1 if nbInvalides else 0)
@@ -0,0 +1,276 @@
+﻿"""Sauvegarde d'une partie en cours dans un format binaire compact, pour la reprendre plus tard (voir GrilleMelobrics.reprendre)"""
+
+import sys                  # pour les arguments de la ligne de commande
+import os                   # pour les opérations sur les fichiers et les chemins
+import time                 # pour mesurer la vitesse de la lecture
+import struct               # pour coder les nombres en binaire
+import mmap                 # pour lire le fichier sans le recopier
+import threading            # pour écrire les sauvegardes automatiques en arrière-plan
+from collections import deque   # pour la file des sauvegardes à écrire
+
+from moteur import *        # pour l'état de la partie
+from moteur import _ROTATIONS_PIECES, _FORMES_PIECES, _COULEURS_PIECES  # pour vérifier les pièces relues
+import rejeu                # pour l'enregistrement de la partie, sauvegardé avec elle
+
+
+# Fichier de la sauvegarde, à côté du fichier des scores
+_CHEMIN_SAUVEGARDE = os.path.dirname(__file__) + os.sep + "partie.sauvegarde"
+
+# En-tête et version du format des sauvegardes
+_MAGIE_SAUVEGARDE = b"MLBS"
+_VERSION_SAUVEGARDE = 1
+
+# Partie de taille fixe au début du fichier, après la magie et la version (voir versOctets pour la suite) :
+# taille de la grille, difficulté, limiterScore, score, nombre de ticks, pièce en mouvement (forme, -1 s'il n'y en a pas,
+# rotation, couleur) et sa position, tirage des pièces (graine, mode, nombre de pièces données, taille du sac,
+# nombre de pièces tirées gardées), première ligne non vide de la grille, taille de l'enregistrement de la partie
+_ENTETE = struct.Struct("<HHBBQQbBBhhqBQBIHI")
+
+# État du générateur aléatoire du tirage (Random.getstate) : 624 mots de 32 bits et la position dans ces mots
+_ETAT_ALEATOIRE = struct.Struct("<625I")
+_VERSION_ALEATOIRE = 3      # (version de l'état renvoyé par Random.getstate)
+
+# Taille minimale de la grille et difficulté maximale d'une partie (celles de FenetrePrincipale)
+_TAILLE_GRILLE_MIN = 4
+_DIFFICULTE_MAX = 10
+
+# Nombre maximal de sauvegardes automatiques en attente d'écriture : seule la plus récente compte,
+# les plus anciennes sont abandonnées si le disque n'écrit pas assez vite
+_PROFONDEUR_FILE = 1
+
+
+def versOctets(instantane, nbTicks, enregistrement):
+    """Renvoie la sauvegarde d'une partie au format binaire : son état (InstantanePartie, voir MoteurMelobrics.instantane),
+       le nombre de ticks écoulés et son enregistrement (voir rejeu.py), pour que la partie reprise puisse toujours être vérifiée.
+
+       Seules les lignes de la grille sous la plus haute brique sont écrites, chacune deux fois :
+       en masque de bits (les briques, voir MoteurMelobrics.lignes) et en octets (les couleurs), avec le sommet de chaque colonne ;
+       tout se relit d'un bloc, sans calcul case par case."""
+
+    etatAleatoire, sac, pieces = instantane.generateur.etat()
+    premiereLigne = min(instantane.sommets)
+    forme, rotation, indiceCouleur = instantane.piece if instantane.piece != None else (-1, 0, 0)
+    donneesRejeu = enregistrement.versOctets()
+
+    tampon = bytearray(_MAGIE_SAUVEGARDE)
+    tampon.append(_VERSION_SAUVEGARDE)
+    tampon += _ENTETE.pack(
+        instantane.nbColonnes, instantane.nbLignes, instantane.difficulte, instantane.limiterScore, instantane.score, nbTicks,
+        forme, rotation, indiceCouleur, instantane.abscissePiece, instantane.ordonneePiece,
+        instantane.generateur.graine, instantane.generateur.mode, instantane.generateur.nbDonnees, len(sac), len(pieces),
+        premiereLigne, len(donneesRejeu)
+    )
+    tampon += _ETAT_ALEATOIRE.pack(*etatAleatoire[1])
+    tampon += sac
+    tampon += pieces
+
+    tampon += struct.pack("<{}H".format(instantane.nbColonnes), *instantane.sommets)
+    largeurMasque = (instantane.nbColonnes + 7) // 8
+    for ligne in lignesDeBlocs(instantane.lignes)[premiereLigne:]:
+        tampon += ligne.to_bytes(largeurMasque, "little")
+    for couleurs in lignesDeBlocs(instantane.couleurs)[premiereLigne:]:
+        tampon += couleurs
+
+    tampon += donneesRejeu
+    return bytes(tampon)
+
+
+def depuisOctets(donnees):
+    """Relit une sauvegarde écrite par versOctets (bytes, ou fichier projeté en mémoire par mmap) ;
+       renvoie l'état de la partie (InstantanePartie), le nombre de ticks et l'enregistrement de la partie.
+       Lève ValueError si la sauvegarde est incohérente : la partie reprise doit toujours pouvoir être jouée."""
+
+    if donnees[:len(_MAGIE_SAUVEGARDE)] != _MAGIE_SAUVEGARDE:
+        raise ValueError("Ce n'est pas un fichier de sauvegarde")
+    if donnees[len(_MAGIE_SAUVEGARDE)] != _VERSION_SAUVEGARDE:
+        raise ValueError("Version de sauvegarde non prise en charge : {}".format(donnees[len(_MAGIE_SAUVEGARDE)]))
+    position = len(_MAGIE_SAUVEGARDE) + 1
+
+    (nbColonnes, nbLignes, difficulte, limiterScore, score, nbTicks, forme, rotation, indiceCouleur, abscissePiece, ordonneePiece,
+     graine, modeTirage, nbDonnees, longueurSac, nbPieces, premiereLigne, longueurRejeu) = _ENTETE.unpack_from(donnees, position)
+    position += _ENTETE.size
+
+    # on vérifie l'en-tête avant de s'en servir : une sauvegarde abîmée ne doit pas donner une partie impossible
+    if nbColonnes < _TAILLE_GRILLE_MIN or nbLignes < _TAILLE_GRILLE_MIN:
+        raise ValueError("Taille de grille invalide : {}x{}".format(nbColonnes, nbLignes))
+    if not 1 <= difficulte <= _DIFFICULTE_MAX or limiterScore > 1:
+        raise ValueError("Difficulté invalide : {} (limiterScore {})".format(difficulte, limiterScore))
+    if forme >= 0:
+        if forme >= len(_FORMES_PIECES) or rotation >= len(_ROTATIONS_PIECES[forme]) or indiceCouleur >= len(_COULEURS_PIECES):
+            raise ValueError("Pièce invalide : forme {}, rotation {}, couleur {}".format(forme, rotation, indiceCouleur))
+        etat = _ROTATIONS_PIECES[forme][rotation]
+        if not (0 <= abscissePiece <= nbColonnes - etat.largeur and 0 <= ordonneePiece <= nbLignes - etat.hauteur):
+            raise ValueError("Pièce hors de la grille : ({}, {})".format(abscissePiece, ordonneePiece))
+    elif forme != -1:
+        raise ValueError("Pièce invalide : forme {}".format(forme))
+    if nbDonnees < 1 or nbPieces < 1 or premiereLigne > nbLignes:
+        raise ValueError("Sauvegarde incohérente : {} pièces données, {} gardées, première ligne {}".format(nbDonnees, nbPieces, premiereLigne))
+    largeurMasque = (nbColonnes + 7) // 8
+    taille = (position + _ETAT_ALEATOIRE.size + longueurSac + nbPieces + 2*nbColonnes
+              + (nbLignes - premiereLigne) * (largeurMasque + nbColonnes) + longueurRejeu)
+    if len(donnees) != taille:
+        raise ValueError("Sauvegarde tronquée : {} octets au lieu de {}".format(len(donnees), taille))
+
+    etatAleatoire = (_VERSION_ALEATOIRE, _ETAT_ALEATOIRE.unpack_from(donnees, position), None)
+    position += _ETAT_ALEATOIRE.size
+    sac = donnees[position:position+longueurSac]
+    position += longueurSac
+    pieces = donnees[position:position+nbPieces]
+    position += nbPieces
+    nbFormes = len(_FORMES_PIECES)
+    if any(formeSac >= nbFormes for formeSac in sac) or any(piece >= nbFormes*len(_COULEURS_PIECES) for piece in pieces):
+        raise ValueError("Pièces tirées invalides")
+    generateur = GenerateurPieces.depuisEtat(graine, modeTirage, nbDonnees, etatAleatoire, sac, pieces)
+
+    # la grille : le sommet de chaque colonne, les lignes vides du haut, puis les masques et les couleurs des autres lignes
+    sommets = struct.unpack_from("<{}H".format(nbColonnes), donnees, position)
+    position += 2*nbColonnes
+    if any(not premiereLigne <= sommet <= nbLignes for sommet in sommets) or (premiereLigne < nbLignes and premiereLigne not in sommets):
+        raise ValueError("Sommets des colonnes invalides")
+    nbLignesEcrites = nbLignes - premiereLigne
+    lignes = [0] * premiereLigne + [int.from_bytes(donnees[debut:debut+largeurMasque], "little")
+                                    for debut in range(position, position + nbLignesEcrites*largeurMasque, largeurMasque)]
+    position += nbLignesEcrites*largeurMasque
+    couleursVides = bytes(nbColonnes)
+    couleurs = [couleursVides] * premiereLigne + [donnees[debut:debut+nbColonnes]
+                                                  for debut in range(position, position + nbLignesEcrites*nbColonnes, nbColonnes)]
+    position += nbLignesEcrites*nbColonnes
+    if any(ligne >> nbColonnes for ligne in lignes) or max(b"".join(couleurs[premiereLigne:]), default=0) > len(_COULEURS_PIECES):
+        raise ValueError("Lignes de la grille invalides")
+    if forme >= 0 and any(lignes[ordonneePiece + ordonnee] >> (abscissePiece + abscisse) & 1 for abscisse, ordonnee in etat.briques):
+        raise ValueError("Pièce en mouvement sur des briques")
+
+    enregistrement = rejeu.EnregistrementPartie.depuisOctets(donnees[position:position+longueurRejeu])
+    if ((enregistrement.graine, enregistrement.modeTirage, enregistrement.difficulte, enregistrement.limiterScore, enregistrement.nbColonnes, enregistrement.nbLignes)
+            != (graine, modeTirage, difficulte, bool(limiterScore), nbColonnes, nbLignes) or enregistrement.tickDerniereAction > nbTicks):
+        raise ValueError("L'enregistrement ne correspond pas à la partie sauvegardée")
+
+    instantane = InstantanePartie(
+        nbColonnes, nbLignes, difficulte, bool(limiterScore), blocsDeLignes(lignes), blocsDeLignes(couleurs), sommets,
+        None if forme < 0 else (forme, rotation, indiceCouleur), abscissePiece, ordonneePiece,
+        generateur, score, False, False
+    )
+    return instantane, nbTicks, enregistrement
+
+
+def sauverPartie(instantane, nbTicks, enregistrement, chemin=_CHEMIN_SAUVEGARDE):
+    """Ecrit la sauvegarde d'une partie (voir versOctets) dans le fichier, en remplaçant la sauvegarde précédente"""
+
+    _ecrireFichier(chemin, versOctets(instantane, nbTicks, enregistrement))
+
+
+def _ecrireFichier(chemin, donnees):
+    """Ecrit les données dans un fichier temporaire renommé ensuite : la sauvegarde est toujours complète,
+       même si le jeu s'arrête brutalement pendant l'écriture"""
+
+    cheminTemporaire = chemin + ".tmp"
+    with open(cheminTemporaire, "wb") as fichier:
+        fichier.write(donnees)
+        fichier.flush()
+        os.fsync(fichier.fileno())
+    os.replace(cheminTemporaire, chemin)
+
+
+def lirePartie(chemin=_CHEMIN_SAUVEGARDE):
+    """Relit la sauvegarde du fichier (voir depuisOctets), projeté en mémoire plutôt que lu d'un bloc ;
+       renvoie None s'il n'y a pas de sauvegarde, et lève ValueError si elle est illisible ou incohérente"""
+
+    try:
+        with open(chemin, "rb") as fichier, mmap.mmap(fichier.fileno(), 0, access=mmap.ACCESS_READ) as donnees:
+            return depuisOctets(donnees)
+    except FileNotFoundError:
+        return None
+    except (struct.error, IndexError) as erreur:     # (fichier tronqué)
+        raise ValueError("Sauvegarde illisible : {}".format(erreur))
+
+
+def effacerPartie(chemin=_CHEMIN_SAUVEGARDE):
+    """Efface la sauvegarde (la partie sauvegardée est terminée, ou a été reprise)"""
+
+    try:
+        os.remove(chemin)
+    except FileNotFoundError:
+        pass
+
+
+class SauvegardeAuto:
+    """Sauvegarde automatique de la partie en cours, pendant la partie (voir GrilleMelobrics.sauvegardeAutomatique).
+
+       La sauvegarde est codée par le thread de Tk (voir proposer), qui seul peut lire le moteur, puis écrite par un thread :
+       le jeu n'attend jamais le disque. Les sauvegardes en attente sont dans une file de _PROFONDEUR_FILE places ;
+       quand elle est pleine, la plus ancienne est abandonnée, puisque la nouvelle la remplace de toute façon."""
+
+    def __init__(self, chemin=_CHEMIN_SAUVEGARDE):
+        """Démarre le thread d'écriture"""
+
+        self.chemin = chemin
+        self.condition = threading.Condition()          # protège enAttente et arret, réveille le thread d'écriture
+        self.enAttente = deque(maxlen=_PROFONDEUR_FILE) # sauvegardes à écrire (bytes), ou None pour effacer la sauvegarde
+        self.arret = False
+        self.nbEcrites, self.nbAbandonnees = 0, 0
+
+        self.threadEcriture = threading.Thread(target=self.boucleEcriture, daemon=True)
+        self.threadEcriture.start()
+
+    def proposer(self, instantane, nbTicks, enregistrement):
+        """Code la partie (voir versOctets) et la confie au thread d'écriture"""
+
+        self.mettreEnFile(versOctets(instantane, nbTicks, enregistrement))
+
+    def effacer(self):
+        """Efface la sauvegarde, après l'écriture des sauvegardes déjà confiées au thread (voir effacerPartie)"""
+
+        self.mettreEnFile(None)
+
+    def mettreEnFile(self, donnees):
+        """Ajoute une opération à la file du thread d'écriture, en abandonnant la plus ancienne si la file est pleine"""
+
+        with self.condition:
+            if len(self.enAttente) == self.enAttente.maxlen:
+                self.nbAbandonnees += 1
+            self.enAttente.append(donnees)
+            self.condition.notify()
+
+    def boucleEcriture(self):
+        """Ecrit les sauvegardes de la file au fur et à mesure (dans le thread d'écriture), jusqu'à l'appel de fermer"""
+
+        while True:
+            with self.condition:
+                while not self.enAttente and not self.arret:
+                    self.condition.wait()
+                if not self.enAttente:          # (arret, et plus rien à écrire)
+                    return
+                donnees = self.enAttente.popleft()
+            # l'écriture se fait sans bloquer le thread de Tk, qui peut déjà proposer la sauvegarde suivante
+            try:
+                if donnees == None:
+                    effacerPartie(self.chemin)
+                else:
+                    _ecrireFichier(self.chemin, donnees)
+                    self.nbEcrites += 1
+            except OSError as erreur:           # (disque plein...) : la sauvegarde suivante réessaiera
+                print("Sauvegarde automatique impossible : {}".format(erreur), file=sys.stderr)
+
+    def fermer(self):
+        """Termine l'écriture des sauvegardes en attente et arrête le thread"""
+
+        with self.condition:
+            self.arret = True
+            self.condition.notify()
+        self.threadEcriture.join()
+
+
+if __name__ == "__main__":
+    # utilisation : python sauvegarde.py [fichier de sauvegarde]
+    # affiche la partie sauvegardée, et le temps de lecture
+    chemin = sys.argv[1] if len(sys.argv) > 1 else _CHEMIN_SAUVEGARDE
+    debut = time.perf_counter()
+    partie = lirePartie(chemin)
+    duree = time.perf_counter() - debut
+    if partie == None:
+        print("Pas de sauvegarde : {}".format(chemin))
+        sys.exit(1)
+    instantane, nbTicks, enregistrement = partie
+    print("Grille {}x{}, difficulté {}, score {}, {} ticks, {} pièces données ; lue en {:.2f} ms ({} octets)".format(
+        instantane.nbColonnes, instantane.nbLignes, instantane.difficulte, instantane.score, nbTicks,
+        instantane.generateur.nbDonnees, 1000*duree, os.path.getsize(chemin)))
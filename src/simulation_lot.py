@@ -0,0 +1,260 @@
+﻿"""Simulation de nombreuses parties à la fois avec NumPy, sans affichage (pour régler la difficulté à partir de données).
+
+NumPy n'est nécessaire que pour ce module : le jeu lui-même n'en dépend pas."""
+
+import sys                  # pour les arguments de la ligne de commande
+import time                 # pour mesurer la vitesse de la simulation
+
+import numpy as np
+
+from moteur import *
+from moteur import _ROTATIONS_PIECES, _PAS_SCORE     # pour la géométrie des pièces et le score
+
+
+# Géométrie des pièces en tableaux, indexés par [forme, rotation] (voir _EtatRotation) :
+# coordonnées des briques (toutes les formes ont le même nombre de briques), largeur, et décalages de rotation
+_ABSCISSES_BRIQUES = np.array([[[abscisse for abscisse, ordonnee in etat.briques] for etat in etats] for etats in _ROTATIONS_PIECES], dtype=np.int64)
+_ORDONNEES_BRIQUES = np.array([[[ordonnee for abscisse, ordonnee in etat.briques] for etat in etats] for etats in _ROTATIONS_PIECES], dtype=np.int64)
+_LARGEURS_PIECES = np.array([[etat.largeur for etat in etats] for etats in _ROTATIONS_PIECES], dtype=np.int64)
+_DECALAGES_ORDONNEE = np.array([[etat.decalageOrdonnee for etat in etats] for etats in _ROTATIONS_PIECES], dtype=np.int64)
+_DECALAGES_ABSCISSE = np.array([[etat.decalagesAbscisse for etat in etats] for etats in _ROTATIONS_PIECES], dtype=np.int64)
+
+
+class LotMoteurs:
+    """N parties indépendantes, avancées ensemble d'une action chacune à chaque appel d'etape.
+
+       Les règles et le score sont ceux de MoteurMelobrics, et une même graine avec les mêmes actions redonne la même partie
+       (voir comparerAuMoteur) ; mais chaque opération (collision, blocage, lignes pleines, effacement) est faite
+       en une fois pour tout le lot, sur les tableaux NumPy :
+       - grilles      : tableau (N, nbLignes, nbColonnes) d'octets, 0 pour une case vide, 1 + l'indice de la couleur sinon,
+       - forme, rotation, indiceCouleur, abscisse, ordonnee : la pièce en déplacement de chaque partie,
+       - aPiece, terminee, gagne, score : l'état de chaque partie.
+       Seul le tirage des pièces reste fait partie par partie (avec GenerateurPieces), à l'insertion d'une pièce."""
+
+    def __init__(self, nbColonnes, nbLignes, graines, difficultes, limiterScore=False, modeTirage=MODE_ALEATOIRE):
+        """Commence une partie par graine (une liste d'entiers), chacune avec sa difficulté (liste, ou un seul entier pour toutes)"""
+
+        nbParties = len(graines)
+        self.nbParties, self.nbColonnes, self.nbLignes = nbParties, nbColonnes, nbLignes
+        self.parties = np.arange(nbParties)
+
+        self.difficultes = np.broadcast_to(np.asarray(difficultes, dtype=np.int64), (nbParties,)).copy()
+        self.limiterScore = limiterScore
+        self.scoresMaximaux = 11000 - 1000*self.difficultes     # (utilisés seulement si limiterScore)
+
+        self.grilles = np.zeros((nbParties, nbLignes, nbColonnes), dtype=np.uint8)
+        self.forme = np.zeros(nbParties, dtype=np.int64)
+        self.rotation = np.zeros(nbParties, dtype=np.int64)
+        self.indiceCouleur = np.zeros(nbParties, dtype=np.int64)
+        self.abscisse = np.zeros(nbParties, dtype=np.int64)
+        self.ordonnee = np.zeros(nbParties, dtype=np.int64)
+        self.aPiece = np.zeros(nbParties, dtype=bool)
+        self.terminee = np.zeros(nbParties, dtype=bool)
+        self.gagne = np.zeros(nbParties, dtype=bool)
+        self.score = np.zeros(nbParties, dtype=np.int64)
+        self.nbLignesEffacees = np.zeros(nbParties, dtype=np.int64)
+        self.nbPieces = np.zeros(nbParties, dtype=np.int64)
+
+        # la prochaine pièce de chaque partie, tirée comme dans MoteurMelobrics.nouvellePartie
+        self.generateurs = [GenerateurPieces(graine, modeTirage) for graine in graines]
+        self.prochaineForme = np.zeros(nbParties, dtype=np.int64)
+        self.prochaineCouleur = np.zeros(nbParties, dtype=np.int64)
+        self.tirerProchainesPieces(self.parties)
+
+    def tirerProchainesPieces(self, parties):
+        """Tire la prochaine pièce des parties demandées (tableau d'indices)"""
+
+        for partie in parties.tolist():
+            piece = self.generateurs[partie].suivante()
+            self.prochaineForme[partie], self.prochaineCouleur[partie] = piece.forme, piece.indiceCouleur
+
+    def obstacle(self, parties, forme, rotation, abscisse, ordonnee):
+        """Pour chaque partie demandée, True si la pièce de forme et rotation données ne peut pas être placée en (abscisse, ordonnee)
+           (tous les arguments sont des tableaux de même longueur)"""
+
+        colonnes = abscisse[:, None] + _ABSCISSES_BRIQUES[forme, rotation]
+        lignes = ordonnee[:, None] + _ORDONNEES_BRIQUES[forme, rotation]
+        dehors = (colonnes < 0) | (colonnes >= self.nbColonnes) | (lignes < 0) | (lignes >= self.nbLignes)
+        cases = self.grilles[parties[:, None], np.clip(lignes, 0, self.nbLignes-1), np.clip(colonnes, 0, self.nbColonnes-1)]
+        return (dehors | (cases != 0)).any(axis=1)
+
+    def etape(self, actions):
+        """Applique à chaque partie son action (tableau de N actions ACTION_..., ou une seule action pour toutes),
+           comme MoteurMelobrics.etape ; les parties terminées ignorent leur action"""
+
+        actions = np.broadcast_to(np.asarray(actions), (self.nbParties,))
+        enCours = ~self.terminee
+        for action, deplacer in ((ACTION_GAUCHE, -1), (ACTION_DROITE, 1)):
+            parties = self.parties[enCours & self.aPiece & (actions == action)]
+            if len(parties):
+                self.deplacer(parties, deplacer)
+        parties = self.parties[enCours & self.aPiece & (actions == ACTION_RETOURNER)]
+        if len(parties):
+            self.retourner(parties)
+        parties = self.parties[enCours & self.aPiece & (actions == ACTION_CHUTE)]
+        if len(parties):
+            self.chute(parties)
+        parties = self.parties[enCours & ((actions == ACTION_BAS) | ((actions == ACTION_CHUTE) & self.aPiece))]
+        if len(parties):
+            self.mouvementBas(parties)
+
+    def deplacer(self, parties, decalage):
+        """Déplace horizontalement la pièce des parties demandées, si la place est libre"""
+
+        abscisse = self.abscisse[parties] + decalage
+        libres = ~self.obstacle(parties, self.forme[parties], self.rotation[parties], abscisse, self.ordonnee[parties])
+        self.abscisse[parties[libres]] = abscisse[libres]
+
+    def retourner(self, parties):
+        """Tourne la pièce des parties demandées, en essayant les décalages horizontaux dans l'ordre (voir MoteurMelobrics.retournerPiece)"""
+
+        forme, rotation = self.forme[parties], self.rotation[parties]
+        rotationSuivante = (rotation + 1) % 4
+        ordonnee = self.ordonnee[parties] + _DECALAGES_ORDONNEE[forme, rotation]
+        decalages = _DECALAGES_ABSCISSE[forme, rotation]
+        aTourner = np.ones(len(parties), dtype=bool)    # parties dont la pièce n'a pas encore trouvé de place
+        for essai in range(decalages.shape[1]):
+            abscisse = self.abscisse[parties] + decalages[:, essai]
+            placees = aTourner & ~self.obstacle(parties, forme, rotationSuivante, abscisse, ordonnee)
+            tournees = parties[placees]
+            self.rotation[tournees] = rotationSuivante[placees]
+            self.abscisse[tournees], self.ordonnee[tournees] = abscisse[placees], ordonnee[placees]
+            aTourner &= ~placees
+
+    def chute(self, parties):
+        """Fait descendre la pièce des parties demandées jusqu'à ce qu'elle soit bloquée (mouvementBas la fixera ensuite)"""
+
+        while len(parties):
+            ordonnee = self.ordonnee[parties] + 1
+            libres = ~self.obstacle(parties, self.forme[parties], self.rotation[parties], self.abscisse[parties], ordonnee)
+            parties = parties[libres]
+            self.ordonnee[parties] = ordonnee[libres]
+
+    def mouvementBas(self, parties):
+        """Fait avancer le jeu pour les parties demandées, comme MoteurMelobrics.mouvementBas :
+           descend la pièce, ou la fixe, efface les lignes pleines et compte le score, puis insère la pièce suivante"""
+
+        # les pièces qui peuvent descendre descendent, les autres sont fixées
+        avecPiece = parties[self.aPiece[parties]]
+        forme, rotation, abscisse = self.forme[avecPiece], self.rotation[avecPiece], self.abscisse[avecPiece]
+        ordonnee = self.ordonnee[avecPiece]
+        bloquees = self.obstacle(avecPiece, forme, rotation, abscisse, ordonnee + 1)
+        self.ordonnee[avecPiece[~bloquees]] += 1
+
+        fixees = avecPiece[bloquees]
+        if len(fixees):
+            forme, rotation = forme[bloquees], rotation[bloquees]
+            colonnes = abscisse[bloquees][:, None] + _ABSCISSES_BRIQUES[forme, rotation]
+            lignes = ordonnee[bloquees][:, None] + _ORDONNEES_BRIQUES[forme, rotation]
+            self.grilles[fixees[:, None], lignes, colonnes] = (self.indiceCouleur[fixees] + 1)[:, None]
+            self.aPiece[fixees] = False
+            self.effacerLignesPleines(fixees)
+
+        # puis on insère une pièce dans les parties qui n'en ont pas (sauf celles qui viennent d'être gagnées)
+        aInserer = parties[~self.aPiece[parties] & ~self.terminee[parties]]
+        if len(aInserer):
+            self.inserer(aInserer)
+
+    def effacerLignesPleines(self, parties):
+        """Efface les lignes pleines des parties demandées, descend les lignes du dessus, augmente le score et vérifie la victoire"""
+
+        grilles = self.grilles[parties]
+        pleines = (grilles != 0).all(axis=2)                    # (n, nbLignes) : True pour les lignes pleines
+        nbPleines = pleines.sum(axis=1)
+        avecLignes = nbPleines > 0
+        if not avecLignes.any():
+            return
+        parties, grilles, pleines, nbPleines = parties[avecLignes], grilles[avecLignes], pleines[avecLignes], nbPleines[avecLignes]
+
+        # on range les lignes pleines en haut et les autres dessous, dans leur ordre (tri stable), puis on vide celles du haut
+        ordre = np.argsort(~pleines, axis=1, kind="stable")
+        grilles = np.take_along_axis(grilles, ordre[:, :, None], axis=1)
+        grilles[np.arange(self.nbLignes)[None, :] < nbPleines[:, None]] = 0
+        self.grilles[parties] = grilles
+
+        self.score[parties] += _PAS_SCORE * nbPleines*(nbPleines+1)//2
+        self.nbLignesEffacees[parties] += nbPleines
+        if self.limiterScore:
+            gagnees = parties[self.score[parties] >= self.scoresMaximaux[parties]]
+            self.terminee[gagnees] = True
+            self.gagne[gagnees] = True
+
+    def inserer(self, parties):
+        """Insère la prochaine pièce en haut de la grille des parties demandées ; si elle ne peut pas l'être, la partie est perdue"""
+
+        forme, rotation = self.prochaineForme[parties], np.zeros(len(parties), dtype=np.int64)
+        self.forme[parties], self.rotation[parties] = forme, rotation
+        self.indiceCouleur[parties] = self.prochaineCouleur[parties]
+        self.abscisse[parties] = self.nbColonnes//2 - _LARGEURS_PIECES[forme, 0]//2
+        self.ordonnee[parties] = 0
+        self.aPiece[parties] = True
+
+        perdues = self.obstacle(parties, forme, rotation, self.abscisse[parties], self.ordonnee[parties])
+        self.terminee[parties[perdues]] = True
+        inserees = parties[~perdues]
+        self.nbPieces[inserees] += 1
+        self.tirerProchainesPieces(inserees)
+
+    def comparerAuMoteur(self, partie, moteur):
+        """Renvoie True si la partie du lot est dans le même état que le moteur (MoteurMelobrics) : grille, pièce, score, fin"""
+
+        if (self.terminee[partie], self.score[partie]) != (moteur.terminee, moteur.score):
+            return False
+        if self.grilles[partie].tobytes() != b"".join(moteur.couleurs):
+            return False
+        if moteur.terminee:
+            return self.gagne[partie] == moteur.gagne
+        if moteur.piece == None:
+            return not self.aPiece[partie]
+        return bool(self.aPiece[partie]) and (self.forme[partie], self.rotation[partie], self.indiceCouleur[partie], self.abscisse[partie], self.ordonnee[partie]) \
+            == (moteur.piece.forme, moteur.piece.rotation, moteur.piece.indiceCouleur, moteur.abscissePiece, moteur.ordonneePiece)
+
+
+def valider(nbParties=200, nbEtapes=2000, nbColonnes=10, nbLignes=15, limiterScore=True):
+    """Fait jouer les mêmes parties (graines et actions aléatoires) au lot et à MoteurMelobrics, et compare leur état après chaque étape.
+       Renvoie le nombre de parties dont l'état a différé (0 si le lot respecte les règles du moteur)."""
+
+    aleatoire = np.random.default_rng(0)
+    graines = list(range(nbParties))
+    difficultes = [1 + graine % 10 for graine in graines]
+    lot = LotMoteurs(nbColonnes, nbLignes, graines, difficultes, limiterScore)
+    moteurs = []
+    for graine, difficulte in zip(graines, difficultes):
+        moteur = MoteurMelobrics(nbColonnes, nbLignes)
+        moteur.nouvellePartie(difficulte, limiterScore, graine)
+        moteurs.append(moteur)
+
+    differentes = set()
+    for i in range(nbEtapes):
+        actions = aleatoire.choice([ACTION_BAS, ACTION_BAS, ACTION_GAUCHE, ACTION_DROITE, ACTION_RETOURNER, ACTION_CHUTE], nbParties)
+        lot.etape(actions)
+        for partie, (moteur, action) in enumerate(zip(moteurs, actions.tolist())):
+            moteur.etape(action)
+            if not lot.comparerAuMoteur(partie, moteur):
+                differentes.add(partie)
+        if lot.terminee.all():
+            break
+    return len(differentes)
+
+
+if __name__ == "__main__":
+    # utilisation : python simulation_lot.py [nombre de parties] [nombre d'étapes]
+    # valide le lot contre MoteurMelobrics, puis mesure la vitesse et le score moyen par difficulté (descentes et chutes aléatoires)
+    nbParties = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    nbEtapes = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    nbDifferentes = valider()
+    print("Validation contre MoteurMelobrics : {}".format("identique" if nbDifferentes == 0 else "{} parties différentes".format(nbDifferentes)))
+
+    aleatoire = np.random.default_rng(1)
+    lot = LotMoteurs(10, 15, list(range(nbParties)), [1 + partie % 10 for partie in range(nbParties)])
+    debut, nbEtapesJouees = time.perf_counter(), 0
+    for i in range(nbEtapes):
+        nbEtapesJouees += int((~lot.terminee).sum())    # (on ne compte pas les parties terminées, qui ne coûtent presque rien)
+        lot.etape(aleatoire.choice([ACTION_BAS, ACTION_GAUCHE, ACTION_DROITE, ACTION_RETOURNER], nbParties))
+    duree = time.perf_counter() - debut
+    print("{} étapes de partie en {:.2f} s : {:.0f} étapes par seconde".format(nbEtapesJouees, duree, nbEtapesJouees/duree))
+    for difficulte in range(1, 11):
+        parties = lot.difficultes == difficulte
+        print("difficulté {:>2} : score moyen {:>7.1f}, {:>5.1f} lignes, {:>5.1f} pièces".format(
+            difficulte, lot.score[parties].mean(), lot.nbLignesEffacees[parties].mean(), lot.nbPieces[parties].mean()))
@@ -0,0 +1,193 @@
+﻿"""Tournoi de joueurs automatiques : de nombreuses parties sans affichage, réparties sur plusieurs processus"""
+
+import sys                  # pour signaler les parties abandonnées sur la sortie d'erreur
+import os                   # pour le nombre de processeurs
+import time                 # pour mesurer la vitesse du tournoi
+import argparse             # pour les options de la ligne de commande
+import importlib            # pour charger les joueurs donnés par "module:Classe"
+from random import Random   # pour le joueur aléatoire
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from moteur import *
+from journal_scores import JournalScores    # pour écrire les résultats dans le format du fichier des scores
+from joueur_auto import JoueurAuto          # joueur qui cherche le meilleur placement de chaque pièce
+
+
+# Nombre maximal de ticks d'une partie (pour qu'un joueur qui ne fait jamais rien perdre ne bloque pas le tournoi)
+_NB_TICKS_MAX = 100000
+
+# Nombre de fois qu'une partie est relancée si le processus qui la jouait s'est arrêté brutalement
+_NB_ESSAIS_MAX = 3
+
+# Centiles calculés pour chaque difficulté
+_CENTILES = (10, 50, 90, 99)
+
+# Résultat d'une partie du tournoi
+ResultatPartie = namedtuple("ResultatPartie", "joueur graine difficulte score gagne nbTicks")
+
+
+class JoueurAleatoire:
+    """Joueur qui fait des actions au hasard : sert de référence, et de modèle pour écrire d'autres joueurs.
+
+       Un joueur est créé pour chaque partie, avec la graine de la partie. Avant chaque tick (descente automatique de la pièce),
+       le tournoi appelle actions(moteur), qui renvoie la liste des actions (ACTION_...) à faire avant le tick ;
+       le joueur ne doit pas modifier le moteur lui-même."""
+
+    def __init__(self, graine):
+        self.aleatoire = Random(graine)
+
+    def actions(self, moteur):
+        return [self.aleatoire.choice((ACTION_GAUCHE, ACTION_DROITE, ACTION_RETOURNER, ACTION_BAS))]
+
+
+# Joueurs disponibles par leur nom (les autres se donnent par "module:Classe")
+JOUEURS = {
+    "aleatoire": JoueurAleatoire,
+    "auto": JoueurAuto,
+}
+
+
+def trouverJoueur(nom):
+    """Renvoie la classe du joueur : un nom de JOUEURS, ou "module:Classe" pour un joueur défini ailleurs"""
+
+    if nom in JOUEURS:
+        return JOUEURS[nom]
+    if ":" not in nom:
+        raise ValueError("Joueur inconnu : {} (disponibles : {}, ou module:Classe)".format(nom, ", ".join(JOUEURS)))
+    nomModule, nomClasse = nom.split(":", 1)
+    return getattr(importlib.import_module(nomModule), nomClasse)
+
+
+def jouerPartie(nomJoueur, graine, difficulte, nbColonnes, nbLignes, limiterScore):
+    """Joue une partie sans affichage (dans un processus du tournoi) et renvoie son ResultatPartie"""
+
+    joueur = trouverJoueur(nomJoueur)(graine)
+    moteur = MoteurMelobrics(nbColonnes, nbLignes)
+    moteur.nouvellePartie(difficulte, limiterScore, graine)
+
+    nbTicks = 0
+    while not moteur.terminee and nbTicks < _NB_TICKS_MAX:
+        for action in joueur.actions(moteur):
+            moteur.etape(action)
+            if moteur.terminee:
+                break
+        moteur.etape(ACTION_BAS)        # la descente automatique
+        nbTicks += 1
+
+    return ResultatPartie(nomJoueur, graine, difficulte, moteur.score, moteur.gagne, nbTicks)
+
+
+def tournoi(nomJoueur, nbParties, difficultes, nbColonnes=10, nbLignes=15, limiterScore=False, nbProcessus=None, graineDepart=0):
+    """Joue nbParties parties par difficulté (graines graineDepart, graineDepart+1...) et renvoie chaque ResultatPartie dès qu'il est connu.
+
+       Les parties sont réparties sur nbProcessus processus (tous les processeurs par défaut). Si un processus s'arrête
+       brutalement, les parties en cours sont rejouées une à une dans de nouveaux processus ; une partie qui arrête
+       ainsi _NB_ESSAIS_MAX processus est abandonnée (et signalée sur la sortie d'erreur)."""
+
+    trouverJoueur(nomJoueur)        # (pour signaler un joueur inconnu avant de lancer les processus)
+    aJouer = [(graine, difficulte) for difficulte in difficultes for graine in range(graineDepart, graineDepart+nbParties)]
+    aJouer.reverse()                # (on joue dans l'ordre en prenant à la fin de la liste)
+    suspectes = []                  # parties en cours lors d'un arrêt brutal : rejouées une à une pour trouver celle qui en est la cause
+    nbEssais = {}
+    nbProcessus = nbProcessus or os.cpu_count() or 1
+
+    while aJouer or suspectes:
+        enCours = {}                # future -> (graine, difficulte)
+        try:
+            with ProcessPoolExecutor(nbProcessus) as executeur:
+                while aJouer or suspectes or enCours:
+                    if suspectes:
+                        if not enCours:
+                            future = executeur.submit(jouerPartie, nomJoueur, *suspectes[-1], nbColonnes, nbLignes, limiterScore)
+                            enCours[future] = suspectes.pop()
+                    else:
+                        # on garde quelques parties d'avance par processus, sans tout soumettre d'un coup
+                        while aJouer and len(enCours) < 4*nbProcessus:
+                            future = executeur.submit(jouerPartie, nomJoueur, *aJouer[-1], nbColonnes, nbLignes, limiterScore)
+                            enCours[future] = aJouer.pop()       # (retirée seulement une fois soumise, au cas où le processus se serait déjà arrêté)
+                    terminees, _ = wait(enCours, return_when=FIRST_COMPLETED)
+                    for future in terminees:
+                        resultat = future.result()      # (lève BrokenProcessPool si un processus s'est arrêté)
+                        del enCours[future]
+                        yield resultat
+        except BrokenProcessPool:
+            if len(enCours) > 1:
+                # on ne sait pas laquelle des parties en cours a arrêté le processus : on les rejouera une à une
+                suspectes.extend(enCours.values())
+                continue
+            # la partie était seule en cours : c'est elle qui a arrêté le processus
+            for partie in enCours.values():
+                nbEssais[partie] = nbEssais.get(partie, 0) + 1
+                if nbEssais[partie] < _NB_ESSAIS_MAX:
+                    suspectes.append(partie)
+                else:
+                    print("Partie abandonnée (graine {}, difficulté {}) : processus arrêté {} fois".format(*partie, _NB_ESSAIS_MAX), file=sys.stderr)
+
+
+def centile(valeursTriees, pourcentage):
+    """Renvoie le centile (au rang le plus proche) d'une liste de valeurs triées"""
+
+    rang = max(int(round(pourcentage / 100 * len(valeursTriees) + 0.5)) - 1, 0)
+    return valeursTriees[min(rang, len(valeursTriees) - 1)]
+
+
+def statistiques(resultats):
+    """Renvoie, pour chaque difficulté, les statistiques des parties : nombre, moyenne, centiles (_CENTILES),
+       et proportion de parties ayant atteint le score maximal de la difficulté (11000-1000*difficulte, voir MoteurMelobrics)"""
+
+    scoresParDifficulte = {}
+    for resultat in resultats:
+        scoresParDifficulte.setdefault(resultat.difficulte, []).append(resultat.score)
+
+    stats = {}
+    for difficulte, scores in sorted(scoresParDifficulte.items()):
+        scores.sort()
+        scoreMaximal = 11000 - 1000*difficulte
+        stats[difficulte] = {
+            "nombre": len(scores),
+            "moyenne": sum(scores) / len(scores),
+            "centiles": {pourcentage: centile(scores, pourcentage) for pourcentage in _CENTILES},
+            "victoires": sum(score >= scoreMaximal for score in scores) / len(scores),
+        }
+    return stats
+
+
+if __name__ == "__main__":
+    analyseur = argparse.ArgumentParser(description="Tournoi de joueurs automatiques du Mélobrics")
+    analyseur.add_argument("--joueur", default="aleatoire", help="nom du joueur ({}), ou module:Classe".format(", ".join(JOUEURS)))
+    analyseur.add_argument("--parties", type=int, default=100, help="nombre de parties par difficulté")
+    analyseur.add_argument("--difficultes", default="1-10", help="difficultés jouées, par exemple 1-10 ou 3,5,7")
+    analyseur.add_argument("--colonnes", type=int, default=10)
+    analyseur.add_argument("--lignes", type=int, default=15)
+    analyseur.add_argument("--limiter", action="store_true", help="arrêter les parties au score maximal de la difficulté")
+    analyseur.add_argument("--processus", type=int, default=None, help="nombre de processus (tous les processeurs par défaut)")
+    analyseur.add_argument("--graine", type=int, default=0, help="graine de la première partie")
+    analyseur.add_argument("--sortie", default=None, help="fichier où ajouter les scores (format du fichier des scores)")
+    options = analyseur.parse_args()
+
+    if "-" in options.difficultes:
+        debut, fin = options.difficultes.split("-")
+        difficultes = list(range(int(debut), int(fin)+1))
+    else:
+        difficultes = [int(difficulte) for difficulte in options.difficultes.split(",")]
+
+    journal = JournalScores(options.sortie) if options.sortie else None
+    resultats = []
+    debut = time.perf_counter()
+    for resultat in tournoi(options.joueur, options.parties, difficultes, options.colonnes, options.lignes,
+                            options.limiter, options.processus, options.graine):
+        resultats.append(resultat)
+        if journal != None:     # chaque score est écrit dès que sa partie est finie
+            journal.ajouter("{}-{}".format(resultat.joueur.replace(":", "."), resultat.graine), resultat.score, resultat.difficulte)
+    duree = time.perf_counter() - debut
+    if journal != None:
+        journal.fermer()
+
+    print("{} parties en {:.2f} s ({:.1f} parties par seconde)".format(len(resultats), duree, len(resultats) / max(duree, 1e-9)))
+    print("difficulté  parties   moyenne  " + "  ".join("c{:<5}".format(pourcentage) for pourcentage in _CENTILES) + "  victoires")
+    for difficulte, stats in statistiques(resultats).items():
+        print("{:>10}  {:>7}  {:>8.1f}  ".format(difficulte, stats["nombre"], stats["moyenne"])
+              + "  ".join("{:>6}".format(stats["centiles"][pourcentage]) for pourcentage in _CENTILES)
+              + "  {:>8.1%}".format(stats["victoires"]))
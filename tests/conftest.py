@@ -0,0 +1,6 @@
+﻿"""Configuration des tests : les modules du jeu sont dans src/ et s'importent entre eux par leur nom (from moteur import *...)"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,56 @@
+﻿"""Tests de la gestion des scores : lecture en arrière-plan, et échec de la lecture"""
+
+import time
+
+from gestion_scores import GestionScores
+
+
+def _attendre(condition, delai=5):
+    """Attend que condition() soit vraie (la lecture se fait dans un thread)"""
+
+    fin = time.monotonic() + delai
+    while not condition() and time.monotonic() < fin:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_chargement(tmp_path):
+    """Les scores du fichier sont indexés, et ceux ajoutés pendant la lecture sont écrits ensuite"""
+
+    chemin = tmp_path / "scores.txt"
+    chemin.write_text("a:300:1\nb:100:1\nligne invalide\n", encoding="utf-8")
+    scores = GestionScores(str(chemin), 10)
+    scores.ajouterScore("c", 200, 1)
+    assert _attendre(scores.charge.is_set)
+    assert scores.erreur == None
+    assert scores.index.meilleurs(1, 10, 0) == [(300, "a"), (200, "c"), (100, "b")]
+    scores.fermer()
+    assert "c:200:1" in chemin.read_text(encoding="utf-8")
+
+
+def test_echecChargement(tmp_path):
+    """Si le fichier ne peut pas être lu, l'erreur est signalée et les scores ajoutés sont écrits en fermant"""
+
+    chemin = tmp_path / "scores.txt"
+    chemin.mkdir()                  # (un dossier à la place du fichier : il ne peut pas être ouvert)
+    scores = GestionScores(str(chemin), 10)
+    assert _attendre(lambda: scores.erreur != None)
+    assert not scores.charge.is_set()
+    scores.ajouterScore("c", 200, 1)
+    assert scores.scoresEnAttente == [("c", 200, 1)]
+
+
+def test_fermerPendantChargement(tmp_path):
+    """Les scores en attente quand le jeu est quitté avant la fin de la lecture sont ajoutés à la fin du fichier"""
+
+    chemin = tmp_path / "scores.txt"
+    scores = GestionScores(str(chemin), 10)
+    assert _attendre(scores.charge.is_set)
+    with scores.verrou:                 # (on revient à l'état d'avant la fin de la lecture)
+        scores.journal.fermer()
+        scores.journal = None
+        scores.charge.clear()
+    scores.ajouterScore("c", 200, 1)
+    scores.ajouterScore("d", 100, 2)
+    scores.fermer()
+    assert chemin.read_text(encoding="utf-8").splitlines()[-2:] == ["c:200:1", "d:100:2"]
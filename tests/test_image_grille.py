@@ -0,0 +1,57 @@
+﻿"""Tests du dessin de la grille en mémoire (rendu en image, sans Tk) : contour des briques et mise à jour partielle"""
+
+from moteur import *
+from image_grille import ImageRGB, DessinGrille, _RGB_COULEURS, _RGB_PIECES
+from joueur_auto import JoueurAuto
+
+
+def _pixel(image, x, y):
+    """Renvoie la couleur RGB (bytes) d'un pixel de l'image"""
+
+    return bytes(image.lignes[y][3*x:3*x+3])
+
+
+def test_contourDesBriques():
+    """Le contour d'une brique est dans ses propres pixels : deux briques voisines sont séparées par deux pixels noirs
+       (une ligne d'un pixel partagée avec Tk), et vider une case ne touche pas à sa voisine"""
+
+    image = ImageRGB(31, 31)
+    dessin = DessinGrille(image, 3, 3, 10)
+    dessin.preparer()
+    dessin.dessinerCase(1, 0, 1)
+    dessin.dessinerCase(1, 1, 1)
+
+    noir, remplissage = _RGB_COULEURS["black"], _RGB_PIECES[0]
+    assert [_pixel(image, x, 15) for x in (0, 8, 9, 10, 11, 19)] == [noir, remplissage, noir, noir, remplissage, noir]
+    assert [_pixel(image, 5, y) for y in (10, 11, 19)] == [noir, remplissage, noir]
+
+    briqueGauche = [bytes(ligne[:30]) for ligne in image.lignes[10:20]]
+    dessin.dessinerCase(1, 1, 0)
+    assert [bytes(ligne[:30]) for ligne in image.lignes[10:20]] == briqueGauche
+    assert _pixel(image, 10, 15) == _RGB_COULEURS["grey"]
+
+
+def test_dessinPartiel():
+    """Redessiner seulement les lignes modifiées donne la même image que tout redessiner, tout au long d'une partie"""
+
+    moteur = MoteurMelobrics(10, 15)
+    moteur.nouvellePartie(5, False, 3)
+    image = ImageRGB(61, 91)
+    dessin = DessinGrille(image, 10, 15, 6)
+    dessin.preparer()
+    joueur = JoueurAuto(3)
+
+    for tick in range(400):
+        if moteur.terminee:
+            break
+        for action in joueur.actions(moteur):
+            moteur.etape(action)
+        moteur.etape(ACTION_BAS)
+        dessin.dessiner(moteur)
+
+        if tick % 20 == 0:
+            imageComplete = ImageRGB(61, 91)
+            dessinComplet = DessinGrille(imageComplete, 10, 15, 6)
+            dessinComplet.preparer()
+            dessinComplet.dessiner(moteur, range(moteur.nbLignes))
+            assert image.lignes == imageComplete.lignes
@@ -0,0 +1,95 @@
+﻿"""Tests du fichier des scores en ajout seul : ajout, lecture, compactage"""
+
+import time
+from collections import Counter
+
+import journal_scores
+from journal_scores import JournalScores, _ENTETE_SCORES
+
+
+def _scores(chemin):
+    """Relit les scores d'un fichier avec un nouveau JournalScores"""
+
+    journal = JournalScores(str(chemin))
+    scores = list(journal.lire())
+    journal.fermer()
+    return scores
+
+
+def test_ajouts(tmp_path):
+    """Les scores ajoutés sont relus ; quelques ajouts ne demandent pas de compactage"""
+
+    journal = JournalScores(str(tmp_path / "scores.txt"))
+    for numero in range(100):
+        journal.ajouter("j{}".format(numero), numero, 1 + numero % 10)
+    assert len(list(journal.lire())) == 100
+    assert journal.nbLignesObsoletes == 0 and not journal.aCompacter()
+    journal.fermer()
+
+
+def test_declenchement(tmp_path, monkeypatch):
+    """Le compactage est demandé quand le fichier contient une ligne invalide, ou quand il a doublé de taille"""
+
+    monkeypatch.setattr(journal_scores, "_CROISSANCE_MIN", 100)
+    chemin = tmp_path / "scores.txt"
+    chemin.write_text(_ENTETE_SCORES + "a:1:1\n" * 100, encoding="utf-8")
+    journal = JournalScores(str(chemin))
+    taille = journal.tailleCompactee
+    numero = 0
+    while journal.fichier.tell() < 2 * taille:
+        assert not journal.aCompacter()
+        journal.ajouter("b", numero, 2)
+        numero += 1
+    assert journal.aCompacter()
+    journal.compacter()
+    assert not journal.aCompacter()
+
+    with open(str(chemin), "a", encoding="utf-8") as fichier:
+        fichier.write("ligne invalide\n")
+    list(journal.lire())
+    assert journal.aCompacter()
+    journal.fermer()
+    assert not journal.aCompacter()
+
+
+def test_compactage(tmp_path):
+    """Le compactage supprime les lignes invalides, regroupe les scores par difficulté, et garde tous les scores"""
+
+    chemin = tmp_path / "scores.txt"
+    journal = JournalScores(str(chemin))
+    journal.ajouter("a", 100, 2)
+    journal.fichier.write("ligne invalide\nb:x:1\n")
+    journal.ajouter("b", 300, 1)
+    journal.ajouter("c", 200, 1)
+    avant = Counter(journal.lire())
+    assert journal.nbLignesObsoletes == 2
+
+    journal.compacter()
+    assert journal.nbLignesObsoletes == 0
+    journal.ajouter("d", 50, 3)
+    journal.fermer()
+
+    lignes = chemin.read_text(encoding="utf-8").splitlines()
+    assert lignes[-4:] == ["b:300:1", "c:200:1", "a:100:2", "d:50:3"]
+    assert "ligne invalide" not in lignes
+    avant[("d", 50, 3)] += 1
+    assert Counter(_scores(chemin)) == avant
+
+
+def test_compactageEnArrierePlan(tmp_path, monkeypatch):
+    """Le thread de compactage compacte de lui-même un fichier qui a doublé de taille, sans perdre de score"""
+
+    monkeypatch.setattr(journal_scores, "_PERIODE_COMPACTAGE", 0.01)
+    monkeypatch.setattr(journal_scores, "_CROISSANCE_MIN", 100)
+    chemin = tmp_path / "scores.txt"
+    journal = JournalScores(str(chemin))
+    for numero in range(200):
+        journal.ajouter("j{}".format(numero), numero, 1 + numero % 3)
+    fin = time.monotonic() + 5
+    while journal.aCompacter() and time.monotonic() < fin:
+        time.sleep(0.01)
+    journal.fermer()
+
+    difficultes = [int(ligne.rsplit(":", 1)[1]) for ligne in chemin.read_text(encoding="utf-8").splitlines()[3:]]
+    assert difficultes == sorted(difficultes)          # (regroupés par difficulté : le fichier a bien été compacté)
+    assert sorted(_scores(chemin)) == sorted(("j{}".format(numero), numero, 1 + numero % 3) for numero in range(200))
@@ -0,0 +1,258 @@
+﻿"""Tests des règles du moteur : score des lignes, effacement, rotations, chute, tirage des pièces, et instantanés"""
+
+from random import Random
+
+import pytest
+
+from moteur import *
+from moteur import _PieceMelobrics, _ROTATIONS_PIECES, _FORMES_PIECES, _COULEURS_PIECES, _PAS_SCORE, _TAILLE_BLOC_LIGNES, _CAPACITE_HISTORIQUE
+from joueur_auto import JoueurAuto
+
+# formes utilisées par les tests (voir _FORMES_PIECES)
+_FORME_BARRE = 1        # quatre briques alignées, verticale dans la rotation 0
+_FORME_CARRE = 2
+
+
+def _moteur(nbColonnes=10, nbLignes=15, rangees=(), graine=1):
+    """Renvoie un moteur en cours de partie dont le bas de la grille contient les rangées données
+       (chaînes de "#" et de ".", la dernière rangée étant celle du bas), et la liste des scores annoncés par rappelScoreChange"""
+
+    scores = []
+    moteur = MoteurMelobrics(nbColonnes, nbLignes, rappelScoreChange=lambda score, *arguments: scores.append(score))
+    moteur.nouvellePartie(5, False, graine)
+    for numero, rangee in enumerate(rangees, nbLignes - len(rangees)):
+        moteur.lignes[numero] = sum(1 << colonne for colonne, case in enumerate(rangee) if case == "#")
+        moteur.couleurs[numero] = bytes(1 if case == "#" else 0 for case in rangee)
+    moteur.sommets = [0] * nbColonnes          # (calculerSommets parcourt les lignes à partir du plus haut des anciens sommets)
+    moteur.calculerSommets()
+    scores.clear()
+    return moteur, scores
+
+
+def _placer(moteur, forme, abscisse, ordonnee, rotation=0):
+    """Met une pièce en mouvement à la position donnée"""
+
+    moteur.piece = _PieceMelobrics(forme, 0, rotation)
+    moteur.abscissePiece, moteur.ordonneePiece = abscisse, ordonnee
+
+
+def _sommets(moteur):
+    """Recalcule le sommet de chaque colonne directement à partir des lignes"""
+
+    return [next((numero for numero, ligne in enumerate(moteur.lignes) if ligne >> colonne & 1), moteur.nbLignes)
+            for colonne in range(moteur.nbColonnes)]
+
+
+@pytest.mark.parametrize("nbLignesPleines", [1, 2, 3, 4])
+def test_scoreLignes(nbLignesPleines):
+    """Effacer k lignes d'un coup rapporte 100·k(k+1)/2, annoncé par un seul appel de rappelScoreChange"""
+
+    moteur, scores = _moteur(rangees=["." + "#" * 9] * nbLignesPleines)
+    _placer(moteur, _FORME_BARRE, 0, moteur.nbLignes - 4)
+    moteur.etape(ACTION_BAS)
+
+    score = _PAS_SCORE * nbLignesPleines * (nbLignesPleines + 1) // 2
+    assert moteur.score == score
+    assert scores == [score]
+    # le reste de la barre est descendu au fond de la colonne 0
+    assert moteur.lignes[moteur.nbLignes - (4 - nbLignesPleines):] == [1] * (4 - nbLignesPleines)
+    assert not any(moteur.lignes[:moteur.nbLignes - (4 - nbLignesPleines)])
+    assert moteur.sommets == _sommets(moteur)
+
+
+def test_sansLignePleine():
+    """Fixer une pièce sans remplir de ligne ne change pas le score et n'appelle pas rappelScoreChange"""
+
+    moteur, scores = _moteur(rangees=["..#######."])
+    _placer(moteur, _FORME_BARRE, 0, moteur.nbLignes - 4)
+    moteur.etape(ACTION_BAS)
+    assert moteur.score == 0 and scores == []
+
+
+def test_effacementJusquALaLigne0():
+    """Les lignes qui descendent après un effacement vont jusqu'à la ligne 0, qui est remplacée par une ligne vide"""
+
+    moteur, scores = _moteur(6, 4, ["#.....", ".#....", "..#...", "#####."])
+    _placer(moteur, _FORME_BARRE, 5, 0)
+    moteur.etape(ACTION_BAS)
+
+    assert moteur.score == _PAS_SCORE
+    assert moteur.lignes == [0, 0b100001, 0b100010, 0b100100]
+    assert moteur.couleurs[0] == moteur.couleursVides
+    assert [couleurs[5] != 0 for couleurs in moteur.couleurs] == [False, True, True, True]
+    assert moteur.sommets == _sommets(moteur) == [1, 2, 3, 4, 4, 1]
+
+
+def test_effacementDeLaLigne0():
+    """Une ligne 0 pleine est effacée comme les autres"""
+
+    moteur, scores = _moteur(6, 4, ["#####."] * 4)
+    _placer(moteur, _FORME_BARRE, 5, 0)
+    moteur.etape(ACTION_BAS)
+
+    assert scores == [_PAS_SCORE * 4 * 5 // 2]
+    assert moteur.lignes == [0, 0, 0, 0]       # (la pièce suivante, insérée en haut, n'est pas dans les lignes)
+    assert all(couleurs == moteur.couleursVides for couleurs in moteur.couleurs)
+    assert moteur.sommets == [4] * 6
+
+
+def test_rotationBarreAuxBords():
+    """La barre verticale retournée contre un bord est décalée pour rester dans la grille"""
+
+    moteur, _ = _moteur()
+    _placer(moteur, _FORME_BARRE, 0, 5)
+    assert moteur.etape(ACTION_RETOURNER)
+    assert (moteur.piece.rotation, moteur.abscissePiece) == (1, 0)
+
+    _placer(moteur, _FORME_BARRE, moteur.nbColonnes - 1, 5)
+    assert moteur.etape(ACTION_RETOURNER)
+    assert (moteur.piece.rotation, moteur.abscissePiece) == (1, moteur.nbColonnes - 4)
+
+
+@pytest.mark.parametrize("forme", range(len(_FORMES_PIECES)))
+def test_rotationAuxBords(forme):
+    """Contre le bord gauche ou droit, chaque pièce peut tourner, et reste dans la grille"""
+
+    moteur, _ = _moteur()
+    for rotation in range(4):
+        largeur = _ROTATIONS_PIECES[forme][rotation].largeur
+        for abscisse in (0, moteur.nbColonnes - largeur):
+            _placer(moteur, forme, abscisse, 5, rotation)
+            assert moteur.etape(ACTION_RETOURNER)
+            assert moteur.piece.rotation == (rotation + 1) % 4
+            assert 0 <= moteur.abscissePiece <= moteur.nbColonnes - moteur.piece.largeur
+            assert not moteur.obstacle(moteur.piece.masques, moteur.abscissePiece, moteur.ordonneePiece)
+
+
+def test_rotationImpossible():
+    """Dans un puits d'une colonne, la barre verticale ne peut pas tourner et ne bouge pas"""
+
+    moteur, _ = _moteur(rangees=["####.#####"] * 6)
+    _placer(moteur, _FORME_BARRE, 4, moteur.nbLignes - 5)
+    assert not moteur.etape(ACTION_RETOURNER)
+    assert (moteur.piece.rotation, moteur.abscissePiece, moteur.ordonneePiece) == (0, 4, moteur.nbLignes - 5)
+
+
+def test_chuteSousSurplomb():
+    """Une pièce glissée sous une brique en surplomb tombe jusqu'en bas, et le surplomb reste le sommet de sa colonne"""
+
+    moteur, _ = _moteur(rangees=["...#......", "..........", "..........", ".........."])
+    assert moteur.sommets[3] == moteur.nbLignes - 4
+    _placer(moteur, _FORME_CARRE, 3, moteur.nbLignes - 3)          # sous le surplomb
+    assert moteur.ordonneeChute() == moteur.nbLignes - 2
+    moteur.etape(ACTION_CHUTE)
+
+    assert moteur.lignes[-2:] == [0b11000, 0b11000]
+    assert moteur.sommets[3] == moteur.nbLignes - 4 and moteur.sommets[4] == moteur.nbLignes - 2
+    assert moteur.sommets == _sommets(moteur)
+
+
+def test_chuteEtSommetsEnJeu():
+    """Tout au long de parties au hasard, ordonneeChute est l'ordonnée trouvée en descendant rang par rang,
+       et les sommets sont ceux des lignes"""
+
+    aleatoire = Random(5)
+    for graine in range(20):
+        moteur, _ = _moteur(8, 12, graine=graine)
+        while not moteur.terminee:
+            if moteur.piece != None:
+                ordonnee = moteur.ordonneePiece
+                while not moteur.obstacle(moteur.piece.masques, moteur.abscissePiece, ordonnee + 1):
+                    ordonnee += 1
+                assert moteur.ordonneeChute() == ordonnee
+            assert moteur.sommets == _sommets(moteur)
+            moteur.etape(aleatoire.choice((ACTION_BAS, ACTION_BAS, ACTION_GAUCHE, ACTION_DROITE, ACTION_RETOURNER, ACTION_CHUTE)))
+
+
+def _suite(graine, mode, nombre=500):
+    generateur = GenerateurPieces(graine, mode)
+    return [(piece.forme, piece.indiceCouleur) for piece in (generateur.suivante() for i in range(nombre))]
+
+
+@pytest.mark.parametrize("mode", [MODE_ALEATOIRE, MODE_SAC])
+def test_tirageReproductible(mode):
+    """La même graine donne la même suite de pièces, une autre graine une autre suite"""
+
+    assert _suite(42, mode) == _suite(42, mode)
+    assert _suite(42, mode) != _suite(43, mode)
+    assert all(0 <= forme < len(_FORMES_PIECES) and 0 <= couleur < len(_COULEURS_PIECES) for forme, couleur in _suite(7, mode))
+
+
+def test_sac():
+    """En MODE_SAC, chaque groupe de sept pièces contient une fois chaque forme"""
+
+    formes = [forme for forme, couleur in _suite(3, MODE_SAC, 7 * 100)]
+    for debut in range(0, len(formes), 7):
+        assert sorted(formes[debut:debut+7]) == list(range(len(_FORMES_PIECES)))
+
+
+def test_modeInconnu():
+    with pytest.raises(ValueError):
+        GenerateurPieces(1, 5)
+
+
+def test_partieReproductible():
+    """Deux parties de même graine, avec les mêmes actions, sont identiques"""
+
+    etats = []
+    for i in range(2):
+        moteur, _ = _moteur(graine=11)
+        aleatoire = Random(2)
+        while not moteur.terminee:
+            moteur.etape(aleatoire.choice((ACTION_BAS, ACTION_GAUCHE, ACTION_DROITE, ACTION_RETOURNER, ACTION_CHUTE)))
+        etats.append((moteur.lignes, moteur.couleurs, moteur.score, moteur.generateur.nbDonnees))
+    assert etats[0] == etats[1]
+
+
+def _etat(moteur):
+    """Renvoie ce qui décide de la suite d'une partie : grille, sommets, score, pièce en mouvement et prochaine pièce"""
+
+    piece, prochaine = moteur.piece, moteur.prochainePiece
+    return (list(moteur.lignes), list(moteur.couleurs), list(moteur.sommets), moteur.score, moteur.terminee,
+            None if piece == None else (piece.forme, piece.rotation, piece.indiceCouleur, moteur.abscissePiece, moteur.ordonneePiece),
+            (prochaine.forme, prochaine.indiceCouleur), moteur.generateur.nbDonnees)
+
+
+def test_historiqueRejeu():
+    """Une partie remise dans l'état d'un instantané de l'historique, avec les mêmes actions, redevient identique"""
+
+    moteur = MoteurMelobrics(10, 40)
+    moteur.nouvellePartie(5, False, 4)
+    historique, joueur, actionsParTick = HistoriquePartie(), JoueurAuto(4), []
+    for tick in range(600):
+        historique.enregistrer(moteur)
+        actions = joueur.actions(moteur) + [ACTION_BAS]
+        for action in actions:
+            moteur.etape(action)
+        actionsParTick.append(actions)
+    assert not moteur.terminee and moteur.score > 0
+    etatFinal = _etat(moteur)
+
+    capacite = _CAPACITE_HISTORIQUE         # (seuls les derniers instantanés sont gardés)
+    assert len(historique) == capacite and not historique.revenir(moteur, capacite + 1)
+    for nombre in (1, 37, capacite):
+        tick = len(actionsParTick) - nombre
+        assert historique.revenir(moteur, nombre)
+        assert len(historique) == capacite - nombre
+        for actions in actionsParTick[tick:]:
+            historique.enregistrer(moteur)
+            for action in actions:
+                moteur.etape(action)
+        assert _etat(moteur) == etatFinal
+
+
+def test_instantanePartage():
+    """Deux instantanés successifs partagent les blocs de lignes qui n'ont pas changé entre eux"""
+
+    moteur, _ = _moteur(10, 100, ["..########", "..#######."])
+    avant = moteur.instantane()
+    _placer(moteur, _FORME_CARRE, 0, 0)
+    moteur.etape(ACTION_CHUTE)              # (le carré se pose sur les lignes 97 et 98, et complète la ligne 98)
+    apres = moteur.instantane()
+    assert moteur.score == _PAS_SCORE
+
+    assert lignesDeBlocs(apres.lignes) == moteur.lignes and lignesDeBlocs(apres.couleurs) == moteur.couleurs
+    blocsChanges = {bloc for bloc in range(len(apres.lignes)) if apres.lignes[bloc] is not avant.lignes[bloc]}
+    assert blocsChanges == {97 // _TAILLE_BLOC_LIGNES}
+    assert all(apres.couleurs[bloc] is avant.couleurs[bloc] for bloc in range(len(apres.couleurs)) if bloc not in blocsChanges)
+    assert moteur.instantane().lignes == apres.lignes
@@ -0,0 +1,69 @@
+﻿"""Tests des rejeux : format binaire, vérification des scores, et décompte des ticks par la grille"""
+
+from collections import deque
+from types import SimpleNamespace
+
+from moteur import *
+from rejeu import EnregistrementPartie
+from grille import GrilleMelobrics
+from joueur_auto import JoueurAuto
+
+
+def _jouer(difficulte, limiterScore, graine, chute=True, nbTicksMax=20000):
+    """Joue une partie avec JoueurAuto en passant par les méthodes de GrilleMelobrics qui comptent les ticks et enregistrent
+       les actions (sans Tk : la grille est remplacée par un simple espace de noms). Sans chute, les pièces ne se fixent
+       qu'aux descentes automatiques. Renvoie la grille, dont l'enregistrement a été terminé comme à la fin d'une vraie partie,
+       et True si la partie s'est terminée pendant une descente automatique."""
+
+    grille = SimpleNamespace(nbTicks=0, actionsEnAttente=deque(), actions_id=None, demanderDessin=lambda: None,
+                             sauvegardeAutomatique=lambda: None)
+    # comme FenetrePrincipale.rappelPartieTerminee, qui appelle GrilleMelobrics.sauverRejeu
+    def partieTerminee(gagne):
+        grille.enregistrement.terminer(grille.nbTicks, "test", grille.moteur.score)
+    grille.moteur = MoteurMelobrics(10, 15, rappelPartieTerminee=partieTerminee)
+    grille.moteur.nouvellePartie(difficulte, limiterScore, graine)
+    grille.enregistrement = EnregistrementPartie(graine, MODE_ALEATOIRE, difficulte, limiterScore, 10, 15)
+
+    joueur = JoueurAuto(graine)
+    finParDescente = False
+    while not grille.moteur.terminee and grille.nbTicks < nbTicksMax:
+        grille.actionsEnAttente.extend(action for action in joueur.actions(grille.moteur) if chute or action != ACTION_CHUTE)
+        GrilleMelobrics.appliquerActions(grille)
+        if not grille.moteur.terminee:
+            finParDescente = not GrilleMelobrics.descenteAutomatique(grille)
+    return grille, finParDescente
+
+
+def test_octets():
+    """Un enregistrement relu depuis ses octets est identique à l'original, et se réécrit à l'identique"""
+
+    grille, _ = _jouer(5, False, 3, nbTicksMax=2000)
+    enregistrement = grille.enregistrement
+    enregistrement.terminer(grille.nbTicks, "pseudo é", grille.moteur.score)
+    octets = enregistrement.versOctets()
+    relu = EnregistrementPartie.depuisOctets(octets)
+
+    assert vars(relu) == vars(enregistrement)
+    assert relu.versOctets() == octets
+    # les actions ajoutées ensuite sont codées de la même façon
+    relu.ajouterAction(grille.nbTicks + 5, ACTION_GAUCHE)
+    enregistrement.ajouterAction(grille.nbTicks + 5, ACTION_GAUCHE)
+    assert relu.versOctets() == enregistrement.versOctets()
+
+
+def test_verifier():
+    """Une partie enregistrée se rejoue jusqu'au même score"""
+
+    grille, _ = _jouer(5, True, 1)
+    assert grille.moteur.terminee
+    assert grille.enregistrement.verifier() == (grille.moteur.score, True)
+
+
+def test_finParDescenteAutomatique():
+    """Une partie terminée par une descente automatique compte cette dernière descente, et se rejoue jusqu'au même score"""
+
+    for graine in range(5):
+        grille, finParDescente = _jouer(10, True, graine, chute=False)
+        assert finParDescente
+        assert grille.enregistrement.nbTicks == grille.nbTicks
+        assert grille.enregistrement.verifier() == (grille.moteur.score, True)
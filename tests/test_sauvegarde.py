@@ -0,0 +1,154 @@
+﻿"""Tests de la sauvegarde de la partie en cours : format binaire, fichier, reprise, et sauvegarde automatique"""
+
+import pytest
+
+from moteur import *
+import rejeu
+import sauvegarde
+from joueur_auto import JoueurAuto
+
+
+def _jouer(moteur, enregistrement, nbTicks, nbTicksJoues, joueur):
+    """Joue nbTicksJoues ticks avec le joueur, en enregistrant ses actions comme GrilleMelobrics ; renvoie le nombre de ticks"""
+
+    for i in range(nbTicksJoues):
+        if moteur.terminee:
+            break
+        for action in joueur.actions(moteur):
+            enregistrement.ajouterAction(nbTicks, action)
+            moteur.etape(action)
+            if moteur.terminee:
+                return nbTicks
+        nbTicks += 1
+        moteur.etape(ACTION_BAS)
+    return nbTicks
+
+
+def _partieEnCours(graine=2, nbTicksJoues=300, nbColonnes=10, nbLignes=15):
+    """Renvoie une partie en cours : moteur, enregistrement et nombre de ticks"""
+
+    moteur = MoteurMelobrics(nbColonnes, nbLignes)
+    moteur.nouvellePartie(4, False, graine)
+    enregistrement = rejeu.EnregistrementPartie(moteur.graine, MODE_ALEATOIRE, 4, False, nbColonnes, nbLignes)
+    nbTicks = _jouer(moteur, enregistrement, 0, nbTicksJoues, JoueurAuto(graine))
+    assert not moteur.terminee
+    return moteur, enregistrement, nbTicks
+
+
+def _memeEtat(instantane, autre):
+    """Compare deux instantanés, générateur compris (par son état)"""
+
+    assert instantane._replace(generateur=None) == autre._replace(generateur=None)
+    generateur, autreGenerateur = instantane.generateur, autre.generateur
+    assert (generateur.graine, generateur.mode, generateur.nbDonnees) == (autreGenerateur.graine, autreGenerateur.mode, autreGenerateur.nbDonnees)
+    assert generateur.etat() == autreGenerateur.etat()
+
+
+def test_octets():
+    """Une sauvegarde relue redonne exactement l'état, le nombre de ticks et l'enregistrement de la partie"""
+
+    moteur, enregistrement, nbTicks = _partieEnCours()
+    instantane = moteur.instantane()
+    relue, nbTicksRelu, enregistrementRelu = sauvegarde.depuisOctets(sauvegarde.versOctets(instantane, nbTicks, enregistrement))
+
+    _memeEtat(relue, instantane)
+    assert nbTicksRelu == nbTicks
+    assert vars(enregistrementRelu) == vars(enregistrement)
+
+
+def test_fichierEtReprise(tmp_path):
+    """Une partie reprise depuis le fichier continue exactement comme l'originale, et son rejeu se vérifie"""
+
+    chemin = str(tmp_path / "partie.sauvegarde")
+    moteur, enregistrement, nbTicks = _partieEnCours(nbColonnes=13, nbLignes=40)
+    sauvegarde.sauverPartie(moteur.instantane(), nbTicks, enregistrement, chemin)
+    instantane, nbTicksRelu, enregistrementRelu = sauvegarde.lirePartie(chemin)
+
+    reprise = MoteurMelobrics(13, 40)
+    reprise.restaurer(instantane)
+    _jouer(moteur, enregistrement, nbTicks, 500, JoueurAuto(7))
+    nbTicksRelu = _jouer(reprise, enregistrementRelu, nbTicksRelu, 500, JoueurAuto(7))
+    _memeEtat(reprise.instantane(), moteur.instantane())
+
+    enregistrementRelu.terminer(nbTicksRelu, "test", reprise.score)
+    assert enregistrementRelu.verifier() == (reprise.score, True)
+
+
+def test_fichierAbsentOuIllisible(tmp_path):
+    """Sans fichier, il n'y a pas de sauvegarde ; un fichier vide ou tronqué lève ValueError"""
+
+    chemin = tmp_path / "partie.sauvegarde"
+    assert sauvegarde.lirePartie(str(chemin)) == None
+    moteur, enregistrement, nbTicks = _partieEnCours(nbTicksJoues=50)
+    octets = sauvegarde.versOctets(moteur.instantane(), nbTicks, enregistrement)
+    for donnees in (b"", b"XXXX", octets[:40]):
+        chemin.write_bytes(donnees)
+        with pytest.raises(ValueError):
+            sauvegarde.lirePartie(str(chemin))
+
+
+def _modifierEntete(octets, **valeurs):
+    """Renvoie la sauvegarde avec des champs de l'en-tête remplacés (par nom, dans l'ordre de sauvegarde._ENTETE)"""
+
+    noms = ("nbColonnes", "nbLignes", "difficulte", "limiterScore", "score", "nbTicks", "forme", "rotation", "indiceCouleur",
+            "abscissePiece", "ordonneePiece", "graine", "modeTirage", "nbDonnees", "longueurSac", "nbPieces", "premiereLigne", "longueurRejeu")
+    position = len(sauvegarde._MAGIE_SAUVEGARDE) + 1
+    champs = dict(zip(noms, sauvegarde._ENTETE.unpack_from(octets, position)))
+    champs.update(valeurs)
+    return octets[:position] + sauvegarde._ENTETE.pack(*(champs[nom] for nom in noms)) + octets[position+sauvegarde._ENTETE.size:]
+
+
+@pytest.mark.parametrize("valeurs", [
+    {"nbColonnes": 0}, {"nbLignes": 2}, {"difficulte": 0}, {"difficulte": 11}, {"limiterScore": 2},
+    {"forme": 7}, {"forme": -2}, {"rotation": 4}, {"indiceCouleur": 7}, {"abscissePiece": -1}, {"abscissePiece": 9}, {"ordonneePiece": 15},
+    {"modeTirage": 2}, {"nbDonnees": 0}, {"premiereLigne": 16}, {"premiereLigne": 0}, {"graine": 3},
+])
+def test_enteteInvalide(tmp_path, valeurs):
+    """Une sauvegarde dont l'en-tête est incohérent est refusée (ValueError), au lieu de donner une partie impossible"""
+
+    chemin = tmp_path / "partie.sauvegarde"
+    moteur, enregistrement, nbTicks = _partieEnCours(nbTicksJoues=50)
+    octets = sauvegarde.versOctets(moteur.instantane(), nbTicks, enregistrement)
+    chemin.write_bytes(_modifierEntete(octets, **valeurs))
+    with pytest.raises(ValueError):
+        sauvegarde.lirePartie(str(chemin))
+
+
+def test_contenuInvalide(tmp_path):
+    """Une sauvegarde tronquée, trop longue, ou dont les lignes ou les sommets sont abîmés, est refusée (ValueError)"""
+
+    chemin = tmp_path / "partie.sauvegarde"
+    moteur, enregistrement, nbTicks = _partieEnCours(nbTicksJoues=50)
+    instantane = moteur.instantane()
+    octets = sauvegarde.versOctets(instantane, nbTicks, enregistrement)
+    lignes, couleurs = lignesDeBlocs(instantane.lignes), lignesDeBlocs(instantane.couleurs)
+    lignesAbimees = sauvegarde.versOctets(instantane._replace(lignes=blocsDeLignes(lignes[:-1] + [1 << 10])), nbTicks, enregistrement)
+    couleursAbimees = sauvegarde.versOctets(instantane._replace(couleurs=blocsDeLignes(couleurs[:-1] + [b"\x09" * 10])), nbTicks, enregistrement)
+    sommetsAbimes = sauvegarde.versOctets(instantane._replace(sommets=instantane.sommets[:-1] + (16,)), nbTicks, enregistrement)
+    for donnees in (octets[:-1], octets[:len(octets)//2], octets + b"\x00", lignesAbimees, couleursAbimees, sommetsAbimes):
+        chemin.write_bytes(donnees)
+        with pytest.raises(ValueError):
+            sauvegarde.lirePartie(str(chemin))
+
+
+def test_sauvegardeAuto(tmp_path):
+    """La sauvegarde automatique écrit la dernière partie proposée, et l'effacement passe après les écritures"""
+
+    chemin = str(tmp_path / "partie.sauvegarde")
+    moteur, enregistrement, nbTicks = _partieEnCours(nbTicksJoues=50)
+    sauvegardeAuto = sauvegarde.SauvegardeAuto(chemin)
+    for i in range(20):
+        nbTicks = _jouer(moteur, enregistrement, nbTicks, 5, JoueurAuto(3))
+        sauvegardeAuto.proposer(moteur.instantane(), nbTicks, enregistrement)
+    sauvegardeAuto.fermer()
+
+    instantane, nbTicksRelu, _ = sauvegarde.lirePartie(chemin)
+    _memeEtat(instantane, moteur.instantane())
+    assert nbTicksRelu == nbTicks
+    assert not (tmp_path / "partie.sauvegarde.tmp").exists()
+
+    sauvegardeAuto = sauvegarde.SauvegardeAuto(chemin)
+    sauvegardeAuto.proposer(moteur.instantane(), nbTicks, enregistrement)
+    sauvegardeAuto.effacer()
+    sauvegardeAuto.fermer()
+    assert sauvegarde.lirePartie(chemin) == None